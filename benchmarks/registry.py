@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+
+'''Benchmark building and querying a shovel of many synthetic tasks
+
+    python benchmarks/registry.py [count ...]
+'''
+
+from __future__ import print_function
+
+import copy
+import sys
+import time
+import timeit
+
+from shovel.resolve import Trie
+from shovel.tasks import Shovel, Task
+
+
+def synthetic(count, width=10):
+    '''Make `count` tasks spread across modules `width` wide and three deep'''
+    def dummy(a, b=2, *args, **kwargs):
+        '''A synthetic task'''
+    template = Task(dummy)
+    tasks = []
+    for index in range(count):
+        task = copy.copy(template)
+        task.fullname = 'm%i.m%i.m%i.task%i' % (
+            index % width, (index // width) % width,
+            (index // width ** 2) % width, index)
+        tasks.append(task)
+    return tasks
+
+
+def measure(label, func, number):
+    '''Print the time per call of func'''
+    best = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print('%-32s %12.3f us' % (label, best * 1e6))
+
+
+def main(counts):
+    for count in counts:
+        tasks = synthetic(count)
+        print('%i tasks' % count)
+        measure('extend (build)', lambda: Shovel(tasks), 1)
+        shovel = Shovel(tasks)
+        name = tasks[count // 2].fullname
+        measure('__getitem__ (task)', lambda: shovel[name], 10000)
+        measure('__contains__ (missing)',
+            lambda: 'm0.m0.missing' in shovel, 10000)
+        measure('tasks (module prefix)', lambda: shovel.tasks('m3.m4'), 100)
+        measure('keys', shovel.keys, 10)
+        measure('items', shovel.items, 10)
+        measure('iterate first 10 keys',
+            lambda: [k for k, _ in zip(shovel, range(10))], 10000)
+
+        # Abbreviations, completions and suggestions
+        trie = Trie(shovel.keys())
+        measure('Trie (build)', lambda: Trie(shovel.keys()), 1)
+        measure('resolve (abbreviation)', lambda: trie.resolve('m3.m4.m5.t'), 100)
+        measure('complete (prefix)', lambda: trie.complete('m3.m4.m5'), 100)
+        measure('suggest (misspelling)', lambda: trie.suggest('m3.m4.tsak7'), 1)
+
+        # Overlays (like the tasks in ~/.shovel and the current directory)
+        # are extended onto an existing shovel
+        overlay = synthetic(100)
+        timings = []
+        for _ in range(3):
+            shovel = Shovel(tasks)
+            start = time.time()
+            shovel.extend(overlay)
+            timings.append(time.time() - start)
+        print('%-32s %12.3f us' % ('extend (100-task overlay)',
+            min(timings) * 1e6))
+        print()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 50000])
@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+
+'''Benchmark the hot paths of shovel against synthetic trees of task files,
+optionally comparing the results against a baseline from an earlier run
+
+    python benchmarks/suite.py [--files 10,1000,10000] [--output results.json]
+        [--baseline baseline.json] [--threshold 0.25]
+
+Each result is the best time of one operation, in seconds. With --output, the
+results are written as JSON, which can later be used as a --baseline. Exits
+with 1 if anything is more than --threshold slower than its baseline.
+'''
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from shovel import help, loader, logger
+from shovel.parser import parse
+from shovel.tasks import Shovel, Task
+
+# Each file in a tree defines these tasks
+SOURCE = '''from shovel import task
+
+
+@task
+def build(target, jobs=4, *args, **kwargs):
+    """Build target number %(index)i"""
+
+
+@task
+def test(pattern='*', verbose=False):
+    """Run the tests of number %(index)i"""
+
+
+@task
+def deploy(env, version=None, *, dry=False):
+    """Deploy number %(index)i"""
+'''
+
+
+def path(shape, index):
+    '''Where a file goes in a tree. Wide trees are a single directory of
+    files, and deep trees are nested a directory per digit of the index'''
+    if shape == 'wide':
+        return 'f%i.py' % index
+    digits = str(index)
+    return os.path.join(*(['d%s' % d for d in digits[:-1]] +
+        ['f%s.py' % digits]))
+
+
+def tree(root, shape, count, every=1):
+    '''Write `count` task files (or every so many of them) in a shape'''
+    for index in range(0, count, every):
+        absolute = os.path.join(root, path(shape, index))
+        directory = os.path.dirname(absolute)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(absolute, 'w') as fout:
+            fout.write(SOURCE % {'index': index})
+
+
+def best(func):
+    '''The best time of one call of func, in seconds, over three runs of as
+    many calls as take at least a fifth of a second'''
+    timer = timeit.Timer(func)
+    number, taken = timer.autorange()
+    return min([taken] + timer.repeat(repeat=2, number=number)) / number
+
+
+def trees(workspace, count):
+    '''Benchmark reading and querying trees of `count` files'''
+    results = {}
+    for shape in ('wide', 'deep', 'overrides'):
+        # The overrides are like a ~/.shovel and the current directory, with
+        # the latter redefining a tenth of the former's tasks
+        roots = [os.path.join(workspace, '%s-%i' % (shape, count), 'base')]
+        tree(os.path.join(roots[0], 'shovel'), 'deep' if shape == 'deep'
+            else 'wide', count)
+        if shape == 'overrides':
+            roots.append(os.path.join(workspace, '%s-%i' % (shape, count),
+                'overrides'))
+            tree(os.path.join(roots[1], 'shovel'), 'wide', count, 10)
+
+        def read():
+            shovel = Shovel()
+            for root in roots:
+                shovel.read(os.path.join(root, 'shovel'), root)
+            return shovel
+
+        prefix = '%s/%i/' % (shape, count)
+        shovel = read()
+        names = [loader.module_name(path) for path in shovel.sources]
+
+        def imported():
+            for name in names:
+                sys.modules.pop(name, None)
+            return read()
+
+        # Files that were already imported (and haven't changed since) are
+        # reused, so importing them again means forgetting them first. Their
+        # bytecode is still cached, as it would be for any run but the first
+        results[prefix + 'read (import)'] = best(imported)
+        results[prefix + 'read (reuse)'] = best(read)
+
+        tasks = [task for _, task in shovel.items()]
+        keys = shovel.keys()
+        name = keys[len(keys) // 2]
+        module = name.rpartition('.')[0]
+        results[prefix + 'extend'] = best(lambda: Shovel(tasks))
+        results[prefix + '__getitem__'] = best(lambda: shovel[name])
+        results[prefix + 'tasks'] = best(lambda: shovel.tasks(module))
+        results[prefix + 'keys'] = best(shovel.keys)
+        results[prefix + 'items'] = best(shovel.items)
+        results[prefix + 'heirarchical_help'] = best(
+            lambda: help.heirarchical_help(shovel, ''))
+    return results
+
+
+def calls():
+    '''Benchmark parsing a long command line, and binding arguments'''
+    results = {}
+    argv = []
+    for index in range(500):
+        argv.extend(['value%i' % index, '--key%i' % index, str(index)])
+    argv.extend(['--flag'] * 10)
+    results['parse (1.5k tokens)'] = best(lambda: parse(argv))
+    results['parse (short)'] = best(lambda: parse(['a', 'b', '--c', 'd']))
+
+    def deploy(env, version=None, *args, dry=False, **kwargs):
+        '''Deploy'''
+    task = Task(deploy)
+    results['Args.get (positional)'] = best(
+        lambda: task.args.get('prod', '1.2', 'extra'))
+    results['Args.get (keywords)'] = best(
+        lambda: task.args.get(env='prod', dry=True, other=1))
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Print each result against its baseline, and return the names of those
+    more than threshold slower'''
+    regressions = []
+    width = max(len(name) for name in results)
+    for name, seconds in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            print('%-*s %12.3f us %12s' % (width, name, seconds * 1e6, 'new'))
+            continue
+        ratio = seconds / previous if previous else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print('%-*s %12.3f us %11.2fx%s' % (
+            width, name, seconds * 1e6, ratio, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', default='10,1000,10000',
+        help='The sizes of the trees, in files (three tasks each)')
+    parser.add_argument('--output', default=None,
+        help='Write the results as JSON to this path')
+    parser.add_argument('--baseline', default=None,
+        help='Compare the results to those in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+        help='How much slower than the baseline counts as a regression')
+    args = parser.parse_args(argv)
+
+    # Overriding tasks is something to be warned about, but not a thousand times
+    logger.setLevel(logging.ERROR)
+    workspace = tempfile.mkdtemp(prefix='shovel-benchmarks-')
+    # Keep the bytecode of the task files out of the way
+    os.environ['SHOVEL_CACHE'] = os.path.join(workspace, 'cache')
+    try:
+        results = calls()
+        for count in [int(n) for n in args.files.split(',')]:
+            results.update(trees(workspace, count))
+    finally:
+        shutil.rmtree(workspace)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)['results']
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'time': time.time(),
+                'results': results
+            }, fout, indent=2, sort_keys=True)
+    if regressions:
+        print('%i regressed by more than %i%%' % (
+            len(regressions), args.threshold * 100), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
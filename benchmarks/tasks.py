@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+'''Benchmark the cost of decorating functions as tasks, in time and memory
+
+    python benchmarks/tasks.py [count ...]
+'''
+
+from __future__ import print_function
+
+import sys
+import time
+import timeit
+import tracemalloc
+
+from shovel.tasks import Task
+
+
+def source(count):
+    '''The source of a module with `count` documented tasks'''
+    lines = ['from shovel import task']
+    for index in range(count):
+        lines.extend([
+            '@task',
+            'def task%i(first, second=%i, *args, **kwargs):' % (index, index),
+            '    """Task number %i"""' % index,
+            '    return first'])
+    return '\n'.join(lines)
+
+
+def execute(code, decorate, trace=False):
+    '''Run the module's code, with or without the decorator doing anything.
+    Return the time it took (or if tracing, the memory still allocated after)
+    along with the tasks it made'''
+    namespace = {}
+    Task.clear()
+    if not decorate:
+        import shovel
+        original, shovel.task = shovel.task, lambda func: func
+    try:
+        if trace:
+            tracemalloc.start()
+        start = time.time()
+        exec(code, namespace)
+        result = time.time() - start
+        if trace:
+            result, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        if not decorate:
+            shovel.task = original
+    return result, Task.clear()
+
+
+def main(counts):
+    for count in counts:
+        code = compile(source(count), '<benchmark>', 'exec')
+        print('%i tasks' % count)
+        plain = min(execute(code, False)[0] for _ in range(3))
+        decorated = min(execute(code, True)[0] for _ in range(3))
+        plain_memory, _ = execute(code, False, trace=True)
+        memory, tasks = execute(code, True, trace=True)
+        print('%-32s %12.3f us' % ('import (undecorated)', plain * 1e6))
+        print('%-32s %12.3f us' % ('import (decorated)', decorated * 1e6))
+        print('%-32s %12.3f us' % ('overhead per task',
+            (decorated - plain) * 1e6 / count))
+        print('%-32s %12i B' % ('memory per task',
+            (memory - plain_memory) // count))
+
+        # Introspection is only paid for when the details are asked for
+        start = time.time()
+        for task in tasks:
+            task.doc, task.spec, task.line, task.file
+        print('%-32s %12.3f us' % ('first access of details',
+            (time.time() - start) * 1e6 / count))
+
+        # Checking an invocation against a task's arguments
+        task = tasks[0]
+        bind = lambda: task.args.get('1', '2', '3', extra='4')
+        print('%-32s %12.3f us' % ('bind arguments',
+            min(timeit.repeat(bind, number=10000, repeat=3)) / 10000 * 1e6))
+        print()
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
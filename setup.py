@@ -15,6 +15,7 @@ setup(
     license="MIT License",
     keywords='tasks, shovel, rake',
     packages=['shovel'],
+    python_requires='>=3.6',
     package_dir={'shovel': 'shovel'},
     package_data={'shovel': ['templates/*.tpl', 'static/css/*']},
     include_package_data=True,
@@ -26,6 +27,15 @@ setup(
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Intended Audience :: Developers',
         'Operating System :: OS Independent'
     ],
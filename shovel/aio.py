@@ -0,0 +1,167 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Running `async def` tasks (and async generators) on an event loop'''
+
+import os
+import inspect
+import asyncio
+import threading
+import traceback
+
+# Internal imports
+from shovel import logger, runner
+
+# Each thread that runs asynchronous tasks by calling them keeps its own loop,
+# so that it's only made once however many tasks are run
+_local = threading.local()
+
+
+def forget():
+    '''Forget this thread's loop, which a forked child shares with its parent,
+    so that the child makes its own'''
+    _local.__dict__.pop('loop', None)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forget)
+
+
+def new_loop():
+    '''A new event loop, using uvloop if it's installed'''
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.new_event_loop()
+    return uvloop.new_event_loop()
+
+
+async def resolve(result):
+    '''Finish running a coroutine, or collect what an async generator yields'''
+    if inspect.isasyncgen(result):
+        return [item async for item in result]
+    return await result
+
+
+def run(result):
+    '''Finish a task's coroutine (or async generator) on this thread's loop'''
+    loop = getattr(_local, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = _local.loop = new_loop()
+    return loop.run_until_complete(resolve(result))
+
+
+async def call(task, args, kwargs):
+    '''Invoke a task from a running loop, as calling it does elsewhere:
+    measuring it if metrics are being sent, and using its stored return value
+    if it keeps them'''
+    from shovel.tasks import measured
+    try:
+        with measured(task.fullname):
+            if task.cache is None:
+                return await resolve(task._obj(*args, **kwargs))
+            from shovel.memo import memo
+            store = memo()
+            key, found, value = store.lookup(task, args, kwargs)
+            if not found:
+                value = await resolve(task._obj(*args, **kwargs))
+                store.keep(task, key, value)
+            return value
+    except Exception:
+        logger.exception('Failed to run task %s' % task.name)
+        raise
+
+
+async def status(task, args, kwargs):
+    '''Invoke a task from a running loop, and return its exit status'''
+    try:
+        await call(task, args, kwargs)
+    except SystemExit as exc:
+        return runner.status(exc)
+    except Exception:
+        return 1
+    return 0
+
+
+async def outcome(task, args, kwargs):
+    '''Invoke a task from a running loop, and return a dictionary like the one
+    from `Task.capture`. Each asyncio task has its own context, so output is
+    captured for just this invocation'''
+    from shovel.capture import capture
+    result = {
+        'exception': None,
+        'stderr': None,
+        'stdout': None,
+        'return': None,
+        'status': 0
+    }
+    with capture() as (out, err):
+        try:
+            result['return'] = await call(task, args, kwargs)
+        except SystemExit as exc:
+            result['status'] = runner.status(exc)
+            if result['status']:
+                result['exception'] = traceback.format_exc()
+        except Exception:
+            result['exception'] = traceback.format_exc()
+            result['status'] = 1
+        result['stderr'] = err.getvalue()
+        result['stdout'] = out.getvalue()
+    return result
+
+
+class Runner(object):
+    '''An event loop on its own thread, running up to `limit` coroutines at
+    once. Submitting returns a `concurrent.futures.Future`, so that waiting on
+    them works just like it does with a pool of threads or processes'''
+    def __init__(self, limit):
+        self.loop = new_loop()
+        self.semaphore = None
+        self.limit = limit
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    async def _limited(self, func, args):
+        if self.semaphore is None:
+            # Made on the loop, since some versions bind it to the loop
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            try:
+                return await func(*args)
+            except (Exception, asyncio.CancelledError):
+                raise
+            except BaseException as exc:
+                # These would stop the loop rather than fail the future,
+                # leaving whatever's waiting on it waiting forever
+                raise RuntimeError(
+                    '%s: %s' % (type(exc).__name__, exc)) from exc
+
+    def submit(self, func, *args):
+        '''Run the coroutine function with args on the loop'''
+        return asyncio.run_coroutine_threadsafe(
+            self._limited(func, args), self.loop)
+
+    def shutdown(self):
+        '''Stop the loop. Anything submitted should be done by now'''
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -30,40 +30,105 @@ from collections import namedtuple
 ArgTuple = namedtuple('ArgTuple',
     ('required', 'overridden', 'defaulted', 'varargs', 'kwargs'))
 
+# The shape of `inspect.getargspec`, along with keyword-only arguments and
+# annotations. Specs that come from a manifest may not have the latter
+ArgSpec = namedtuple('ArgSpec', ('args', 'varargs', 'keywords', 'defaults',
+    'kwonlyargs', 'kwonlydefaults', 'annotations'))
+ArgSpec.__new__.__defaults__ = ((), None, None)
+
+
+def getspec(obj):
+    '''The ArgSpec of a callable, as `inspect.signature` sees it. Bound methods
+    don't include the argument they're bound to'''
+    try:
+        signature = inspect.signature(obj)
+    except ValueError:
+        # Some callables implemented in C can't be introspected, so the best
+        # we can say is that they take anything
+        return ArgSpec([], 'args', 'kwargs', None)
+
+    args, defaults, kwonlyargs, kwonlydefaults = [], [], [], {}
+    varargs = keywords = None
+    annotations = {}
+    for name, parameter in signature.parameters.items():
+        if parameter.annotation is not parameter.empty:
+            annotations[name] = parameter.annotation
+        if parameter.kind == parameter.VAR_POSITIONAL:
+            varargs = name
+        elif parameter.kind == parameter.VAR_KEYWORD:
+            keywords = name
+        elif parameter.kind == parameter.KEYWORD_ONLY:
+            kwonlyargs.append(name)
+            if parameter.default is not parameter.empty:
+                kwonlydefaults[name] = parameter.default
+        else:
+            args.append(name)
+            if parameter.default is not parameter.empty:
+                defaults.append(parameter.default)
+    return ArgSpec(args, varargs, keywords, tuple(defaults) or None,
+        kwonlyargs, kwonlydefaults or None, annotations or None)
+
+
+def annotation(value):
+    '''How an annotation is displayed'''
+    if isinstance(value, type):
+        return value.__name__
+    return str(value)
+
 
 class Args(object):
     '''Represents an argspec, and evaluates provided arguments to complete an
     invocation. It wraps an `argspec`, and provides some utility functionality
-    around actually evaluating args and kwargs given that argspec.'''
+    around actually evaluating args and kwargs given that argspec. Everything
+    that doesn't depend on the arguments is worked out once, up front, so that
+    it's cheap enough to check every invocation.'''
     @classmethod
     def parse(cls, obj):
         '''Get the Args object associated with the argspec'''
-        return cls(inspect.getargspec(obj))
+        return cls(getspec(obj))
 
     def __init__(self, spec):
-        # We need to keep track of all our arguments and their defaults. Since
-        # defaults are provided from the tail end of the positional args, we'll
-        # reverse those and the defaults from the argspec and pair them. Then
-        # we'll add the required positional arguments and get a list of all
-        # args and whether or not they have defaults
-        self._defaults = list(reversed(
-            list(zip(reversed(spec.args or []), reversed(spec.defaults or [])))
-        ))
-        # Now, take all the args that don't have a default
-        self._args = spec.args[:(len(spec.args) - len(self._defaults))]
-        # Now our internal args is a list of tuples of variable
-        # names and their corresponding default values
+        # Defaults are provided for the tail end of the positional args, so
+        # everything before them is required
+        args = list(spec.args or [])
+        defaults = list(spec.defaults or [])
+        self._args = args[:len(args) - len(defaults)]
+        self._defaults = list(zip(args[len(self._args):], defaults))
         self._varargs = spec.varargs
         self._kwargs = spec.keywords
 
+        # Keyword-only arguments, and which of them have defaults
+        kwonlydefaults = spec.kwonlydefaults or {}
+        self._kwonly = [(name, name in kwonlydefaults, kwonlydefaults.get(name))
+            for name in spec.kwonlyargs or []]
+        self._annotations = spec.annotations or {}
+
+        # The names that keyword arguments may have, if not just anything
+        self._names = None
+        if not self._kwargs:
+            self._names = frozenset(args + [n for n, _, _ in self._kwonly])
+
+    def _name(self, name):
+        '''An argument's name, along with its annotation'''
+        if name in self._annotations:
+            return '%s: %s' % (name, annotation(self._annotations[name]))
+        return name
+
     def __str__(self):
-        results = []
-        results.extend(self._args)
-        results.extend('%s=%s' % (k, v) for k, v in self._defaults)
+        results = [self._name(name) for name in self._args]
+        results.extend(
+            '%s=%s' % (self._name(k), v) for k, v in self._defaults)
         if self._varargs:
-            results.append('*%s' % self._varargs)
+            results.append('*%s' % self._name(self._varargs))
+        elif self._kwonly:
+            results.append('*')
+        for name, defaulted, value in self._kwonly:
+            if defaulted:
+                results.append('%s=%s' % (self._name(name), value))
+            else:
+                results.append(self._name(name))
         if self._kwargs:
-            results.append('**%s' % self._kwargs)
+            results.append('**%s' % self._name(self._kwargs))
         return '(' + ', '.join(results) + ')'
 
     def explain(self, *args, **kwargs):
@@ -81,24 +146,52 @@ class Args(object):
         return '\n\t'.join(results)
 
     def get(self, *args, **kwargs):
-        '''Evaluate this argspec with the provided arguments'''
-        # We'll go through all of our required args and make sure they're
-        # present
-        required = [arg for arg in self._args if arg not in kwargs]
-        if len(args) < len(required):
-            raise TypeError('Missing arguments %s' % required[len(args):])
-        required = list(zip(required, args))
-        args = args[len(required):]
-
-        # Now we'll look through our defaults, if there are any
-        defaulted = [(name, default) for name, default in self._defaults
-            if name not in kwargs]
-        overridden = list(zip([d[0] for d in defaulted], args))
-        args = args[len(overridden):]
-        defaulted = defaulted[len(overridden):]
+        '''Evaluate this argspec with the provided arguments. Arguments provided
+        by keyword are only listed in `kwargs`, with the exception of those
+        that are keyword-only'''
+        if self._names is not None:
+            unexpected = [name for name in kwargs if name not in self._names]
+            if unexpected:
+                raise TypeError(
+                    'Unexpected keyword arguments %s' % sorted(unexpected))
+
+        # Hand out the positional arguments, in order, to the required and
+        # then defaulted arguments that weren't provided by keyword
+        index, count = 0, len(args)
+        required, missing = [], []
+        for name in self._args:
+            if name in kwargs:
+                continue
+            if index < count:
+                required.append((name, args[index]))
+                index += 1
+            else:
+                missing.append(name)
+
+        overridden, defaulted = [], []
+        for name, default in self._defaults:
+            if name in kwargs:
+                continue
+            if index < count:
+                overridden.append((name, args[index]))
+                index += 1
+            else:
+                defaulted.append((name, default))
+
+        # Keyword-only arguments can only be provided by keyword
+        for name, has_default, default in self._kwonly:
+            if name in kwargs:
+                required.append((name, kwargs[name]))
+            elif has_default:
+                defaulted.append((name, default))
+            else:
+                missing.append(name)
+
+        if missing:
+            raise TypeError('Missing arguments %s' % missing)
 
         # And anything left over is in varargs
-        if args and not self._varargs:
+        if index < count and not self._varargs:
             raise TypeError('Too many arguments provided')
 
-        return ArgTuple(required, overridden, defaulted, args, kwargs)
+        return ArgTuple(required, overridden, defaulted, args[index:], kwargs)
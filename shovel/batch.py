@@ -0,0 +1,165 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Running a task once for each of many sets of arguments'''
+
+from __future__ import print_function
+
+import sys
+import json
+import shlex
+
+# Internal imports
+from shovel.parser import parse
+
+# The task that a pool of processes runs, which they inherit when forked
+_task = None
+
+# How many invocations of an asynchronous task run at once, by default
+ASYNC_JOBS = 100
+
+
+def read(lines, args=(), kwargs=None):
+    '''Yield (line number, args, kwargs) for each invocation in lines. A line is
+    either a JSON list of positional arguments, a JSON object of keyword
+    arguments, or tokens like those on the command line. They're added to the
+    provided args and kwargs. Blank lines and comments are skipped'''
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line[0] in '[{':
+            try:
+                found = json.loads(line)
+            except ValueError as exc:
+                raise ValueError('Line %i: %s' % (number, exc))
+            if isinstance(found, list):
+                more, named = found, {}
+            else:
+                more, named = [], found
+        else:
+            more, named = parse(shlex.split(line))
+        combined = dict(kwargs or {})
+        combined.update(named)
+        yield number, list(args) + list(more), combined
+
+
+def bind(task, invocations):
+    '''Check every invocation against the task's arguments, raising ValueError
+    with all the lines that don't fit'''
+    errors = []
+    for number, args, kwargs in invocations:
+        try:
+            task.args.get(*args, **kwargs)
+        except TypeError as exc:
+            errors.append('Line %i: %s' % (number, exc))
+    if errors:
+        raise ValueError('\n'.join(errors))
+
+
+def describe(number, args, kwargs, result):
+    '''Return whether an invocation failed, along with a line of JSON
+    describing it, given the result of `Task.capture`'''
+    return result['exception'] is not None, json.dumps({
+        'line': number,
+        'args': args,
+        'kwargs': kwargs,
+        'return': result['return'],
+        'stdout': result['stdout'],
+        'stderr': result['stderr'],
+        'error': result['exception'],
+        'status': result['status']
+    }, default=repr)
+
+
+def _invoke(number, args, kwargs):
+    '''Run an invocation in a process of the pool'''
+    return describe(number, args, kwargs, _task.capture(*args, **kwargs))
+
+
+def run(task, invocations, jobs=None, ordered=False, stream=None):
+    '''Run the task for each invocation in a pool of `jobs` processes (or for
+    asynchronous tasks, with up to `jobs` at once on one event loop), with at
+    most twice that many waiting at a time. Each result is written to stream as
+    a line of JSON as soon as it's done or, if ordered, in the order of the
+    invocations. Returns the number of invocations that failed'''
+    import os
+    from concurrent import futures
+    global _task
+    stream = stream or sys.stdout
+    invocations = iter(invocations)
+
+    if task.asynchronous:
+        from shovel import aio
+        jobs = jobs or ASYNC_JOBS
+        pool = aio.Runner(jobs)
+
+        def submit(number, args, kwargs):
+            return pool.submit(aio.outcome, task, args, kwargs)
+
+        def finish(number, args, kwargs, future):
+            return describe(number, args, kwargs, future.result())
+
+    else:
+        from shovel.compat import forked
+        jobs = jobs or os.cpu_count() or 1
+        _task = task
+        pool = forked(jobs)
+
+        def submit(number, args, kwargs):
+            return pool.submit(_invoke, number, args, kwargs)
+
+        def finish(number, args, kwargs, future):
+            return future.result()
+
+    # Results that are done but, when ordered, waiting on earlier ones
+    waiting, following, failed = {}, 0, 0
+    try:
+        running = {}
+        index = 0
+        while True:
+            for number, args, kwargs in invocations:
+                future = submit(number, args, kwargs)
+                running[future] = (index, number, args, kwargs)
+                index += 1
+                if len(running) >= jobs * 2:
+                    break
+            if not running:
+                break
+
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                position, number, args, kwargs = running.pop(future)
+                failure, line = finish(number, args, kwargs, future)
+                failed += failure
+                waiting[position] = line
+            if not ordered:
+                for line in waiting.values():
+                    print(line, file=stream)
+                waiting.clear()
+            while following in waiting:
+                print(waiting.pop(following), file=stream)
+                following += 1
+            stream.flush()
+    finally:
+        pool.shutdown()
+        _task = None
+    return failed
@@ -0,0 +1,169 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Benchmarking tasks: timing repeated calls, summarizing them, and keeping a
+history of the results to catch regressions against a baseline'''
+
+from __future__ import print_function
+
+import os
+import gc
+import json
+import math
+import time
+
+# Internal imports
+from shovel import cache
+
+
+def percentile(ordered, fraction):
+    '''The value a fraction of the way through sorted samples, interpolating
+    between the two nearest'''
+    position = (len(ordered) - 1) * fraction
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (
+        position - lower)
+
+
+def outliers(samples):
+    '''The samples beyond 1.5 times the interquartile range of the quartiles'''
+    ordered = sorted(samples)
+    first, third = percentile(ordered, 0.25), percentile(ordered, 0.75)
+    spread = 1.5 * (third - first)
+    return [s for s in samples if s < first - spread or s > third + spread]
+
+
+def summarize(samples):
+    '''The min, median, p95, mean, standard deviation and outliers of some
+    samples'''
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered)
+    variance = sum((s - mean) ** 2 for s in ordered) / max(len(ordered) - 1, 1)
+    return {
+        'runs': len(ordered),
+        'min': ordered[0],
+        'median': percentile(ordered, 0.5),
+        'p95': percentile(ordered, 0.95),
+        'max': ordered[-1],
+        'mean': mean,
+        'stddev': math.sqrt(variance),
+        'outliers': len(outliers(ordered))
+    }
+
+
+def measure(task, args, kwargs, repeat=20, warmup=3, collect=False):
+    '''Call a task (in this process, and bypassing any cache of its results)
+    `warmup` times untimed, and then `repeat` times, returning how long each
+    of those took in seconds. Unless `collect`, the garbage collector is run
+    before each call and kept out of the way during it'''
+    for _ in range(warmup):
+        task._call(*args, **kwargs)
+
+    enabled = gc.isenabled()
+    samples = []
+    try:
+        for _ in range(repeat):
+            if not collect:
+                gc.collect()
+                gc.disable()
+            start = time.perf_counter()
+            task._call(*args, **kwargs)
+            samples.append(time.perf_counter() - start)
+            if enabled:
+                gc.enable()
+    finally:
+        if enabled:
+            gc.enable()
+    return samples
+
+
+def key(task, args, kwargs):
+    '''What identifies a benchmark: the task and its arguments'''
+    return json.dumps([task.fullname, list(args), kwargs], sort_keys=True,
+        default=repr)
+
+
+class History(object):
+    '''The results of every benchmark run in a directory, one JSON object per
+    line. Runs can be marked as the baseline that later runs of the same task
+    (with the same arguments) are compared against'''
+    def __init__(self, path=None):
+        if path is None:
+            path = cache.local('bench', '.jsonl')
+        self.path = path
+
+    def entries(self):
+        '''Every run recorded, oldest first'''
+        try:
+            with open(self.path) as fin:
+                for line in fin:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (IOError, OSError):
+            return
+
+    def baseline(self, name):
+        '''The most recent baseline for a benchmark, if any'''
+        found = None
+        for entry in self.entries():
+            if entry.get('key') == name and entry.get('baseline'):
+                found = entry
+        return found
+
+    def append(self, entry):
+        '''Record a run'''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Appending a single short line is atomic enough for concurrent runs
+        with open(self.path, 'a') as fout:
+            fout.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+def duration(seconds):
+    '''A duration for display, in whatever unit suits it'''
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%.3f%s' % (seconds / scale, unit)
+    return '%.1fns' % (seconds / 1e-9)
+
+
+def report(name, stats, baseline=None, threshold=0.1):
+    '''The lines describing a benchmark's stats, compared to its baseline.
+    Returns them, along with whether the median regressed past threshold'''
+    lines = ['%s: %i runs' % (name, stats['runs'])]
+    for field in ('min', 'median', 'p95', 'max', 'mean', 'stddev'):
+        lines.append('  %-8s %12s' % (field, duration(stats[field])))
+    if stats['outliers']:
+        lines.append('  %i outliers (beyond 1.5 IQR)' % stats['outliers'])
+
+    regressed = False
+    if baseline is not None:
+        before = baseline['stats']['median']
+        change = (stats['median'] - before) / before if before else 0.0
+        regressed = change > threshold
+        lines.append('  median %s -> %s (%+.1f%%) against the baseline%s' % (
+            duration(before), duration(stats['median']), change * 100,
+            ', a regression' if regressed else ''))
+    return lines, regressed
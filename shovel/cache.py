@@ -0,0 +1,60 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Where shovel keeps the things it writes to disk'''
+
+import os
+import hashlib
+
+
+def directory(*parts):
+    '''Return (and create) a directory in shovel's cache. This is
+    $SHOVEL_CACHE if set, or `shovel` in the user's cache directory'''
+    root = os.environ.get('SHOVEL_CACHE') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'shovel')
+    path = os.path.join(root, *parts)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def local(kind, extension):
+    '''Return the path of something of a kind kept for the current directory,
+    like its state or its daemon's socket, in that kind's directory'''
+    digest = hashlib.sha1(os.getcwd().encode('utf-8')).hexdigest()
+    return os.path.join(directory(kind), '%s%s' % (digest[:16], extension))
+
+
+def write(path, data):
+    '''Atomically replace the contents of path with data, so that concurrent
+    readers see either the old or the new contents but never a mix'''
+    import tempfile
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    fd, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix='.shovel-')
+    try:
+        with os.fdopen(fd, mode) as fout:
+            fout.write(data)
+        os.rename(temporary, path)
+    except Exception:
+        os.remove(temporary)
+        raise
@@ -0,0 +1,134 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Capturing what tasks write to stdout and stderr, safely with threads and
+coroutines running other tasks at the same time. On python 3.6, which has no
+contextvars, coroutines on one thread share where their output goes'''
+
+import sys
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Internal imports
+from shovel.compat import ContextVar
+
+# How much output is kept in memory before it's spooled to a file
+THRESHOLD = 1024 * 1024
+
+
+class Router(object):
+    '''Stands in for sys.stdout or sys.stderr, and sends writes wherever the
+    current context (a thread, or an asyncio task) has asked. Otherwise, to
+    the original stream'''
+    @classmethod
+    def install(cls):
+        '''Route sys.stdout and sys.stderr, if they aren't already'''
+        for name in ('stdout', 'stderr'):
+            if not isinstance(getattr(sys, name), cls):
+                setattr(sys, name, cls(name, getattr(sys, name)))
+
+    def __init__(self, name, original):
+        self.original = original
+        self.target = ContextVar('shovel_%s' % name, default=None)
+
+    @contextmanager
+    def to(self, target):
+        '''Send this context's writes to target for the duration'''
+        token = self.target.set(target)
+        try:
+            yield
+        finally:
+            self.target.reset(token)
+
+    def write(self, data):
+        return (self.target.get() or self.original).write(data)
+
+    def flush(self):
+        (self.target.get() or self.original).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+class Capture(object):
+    '''Collects what's written to a stream. It's kept in memory up to a
+    threshold, and then spooled to a temporary file. Optionally, the last
+    `tail` characters are kept on hand, and each write is passed to a callback
+    (with the name of the stream) as it happens'''
+    def __init__(self, name, threshold=THRESHOLD, tail=None, callback=None):
+        self.name = name
+        self.spool = tempfile.SpooledTemporaryFile(
+            max_size=threshold, mode='w+')
+        self.callback = callback
+        self.limit = tail
+        self.chunks = deque()
+        self.length = 0
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        if not data:
+            return 0
+        with self.lock:
+            self.spool.write(data)
+            if self.limit:
+                self.chunks.append(data)
+                self.length += len(data)
+                while self.length - len(self.chunks[0]) >= self.limit:
+                    self.length -= len(self.chunks.popleft())
+        if self.callback:
+            self.callback(self.name, data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        '''Everything that's been written'''
+        with self.lock:
+            self.spool.seek(0)
+            value = self.spool.read()
+            self.spool.seek(0, 2)
+        return value
+
+    def tail(self):
+        '''The last `tail` characters written'''
+        with self.lock:
+            return ''.join(self.chunks)[-self.limit:] if self.limit else ''
+
+    def close(self):
+        self.spool.close()
+
+
+@contextmanager
+def capture(threshold=THRESHOLD, tail=None, callback=None):
+    '''Capture what this context writes to stdout and stderr, yielding a
+    Capture for each. The streams are restored however the block exits'''
+    Router.install()
+    out = Capture('stdout', threshold, tail, callback)
+    err = Capture('stderr', threshold, tail, callback)
+    try:
+        with sys.stdout.to(out), sys.stderr.to(err):
+            yield out, err
+    finally:
+        out.close()
+        err.close()
@@ -0,0 +1,81 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Stand-ins for what older versions of python don't have'''
+
+import sys
+import threading
+
+try:
+    from contextvars import ContextVar, copy_context
+except ImportError:  # pragma: no cover
+    # Python 3.6 doesn't have contextvars, so there each variable is kept per
+    # thread instead. Copying the context copies the values of every one of
+    # them, so that they can be carried over to another thread
+    _variables = []
+
+    class ContextVar(threading.local):
+        '''A variable whose value is kept per thread'''
+        def __init__(self, name, default=None):
+            self.value = default
+            if self not in _variables:
+                _variables.append(self)
+
+        def get(self):
+            return self.value
+
+        def set(self, value):
+            token, self.value = self.value, value
+            return token
+
+        def reset(self, token):
+            self.value = token
+
+    class Context(object):
+        '''The values of every variable in one thread'''
+        def __init__(self, values):
+            self.values = values
+
+        def run(self, func, *args, **kwargs):
+            '''Call func with the variables set to these values'''
+            tokens = [(var, var.set(value)) for var, value in self.values]
+            try:
+                return func(*args, **kwargs)
+            finally:
+                for var, token in reversed(tokens):
+                    var.reset(token)
+
+    def copy_context():
+        '''The values of every variable in this thread'''
+        return Context([(var, var.get()) for var in _variables])
+
+
+def forked(jobs):
+    '''A pool of `jobs` processes that are forked, so that they inherit the
+    tasks that have been read in'''
+    import multiprocessing
+    from concurrent import futures
+    if sys.version_info < (3, 7):  # pragma: no cover
+        # Python 3.6 can't be told how to start them, but it forks by default
+        # wherever it can
+        return futures.ProcessPoolExecutor(jobs)
+    return futures.ProcessPoolExecutor(
+        jobs, mp_context=multiprocessing.get_context('fork'))
@@ -0,0 +1,269 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''A long-running process that keeps tasks loaded, and a client for it'''
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import socket
+import threading
+import traceback
+
+# Internal imports
+from shovel import cache, logger, timing
+from shovel.capture import Router
+
+
+def address(path=None):
+    '''The socket of the daemon for the current directory'''
+    if path:
+        return path
+    return cache.local('daemon', '.sock')
+
+
+def forward(argv, path=None, stdout=None, stderr=None):
+    '''Have the daemon for the current directory run a shovel command line,
+    relaying what it writes. Returns the exit code, or None if there's no
+    daemon to ask'''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(address(path))
+    except (IOError, OSError):
+        client.close()
+        return None
+
+    streams = {
+        'stdout': stdout or sys.stdout,
+        'stderr': stderr or sys.stderr
+    }
+    try:
+        request = {'argv': argv, 'env': dict(os.environ), 'cwd': os.getcwd()}
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        for line in client.makefile('rb'):
+            message = json.loads(line.decode('utf-8'))
+            if 'exit' in message:
+                return message['exit']
+            streams[message['stream']].write(message['data'])
+            streams[message['stream']].flush()
+    finally:
+        client.close()
+    print('Lost connection to the shovel daemon', file=streams['stderr'])
+    return 1
+
+
+class Connection(object):
+    '''Sends messages to a client. Both of a request's streams share one of
+    these, and so it's locked'''
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = threading.Lock()
+
+    def send(self, **message):
+        '''Send a message to the client'''
+        with self.lock:
+            self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+    def stream(self, name):
+        '''A file-like object whose writes are sent as the named stream'''
+        return Stream(self, name)
+
+
+class Stream(object):
+    '''A file-like object that sends what's written to it to a client'''
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def write(self, data):
+        if data:
+            self.connection.send(stream=self.name, data=data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class Daemon(object):
+    '''Keeps the tasks for a directory loaded, reloading them when any of the
+    task files change, and runs shovel command lines against them'''
+    def __init__(self, root=None, interval=1.0):
+        self.root = os.path.realpath(root or os.getcwd())
+        # How often, in seconds, to check whether task files have changed
+        self.interval = interval
+        # Requests are run with the environment of their client
+        self.environment = dict(os.environ)
+        self.lock = threading.Lock()
+        self.shovel = None
+        self.stamps = None
+        self.checked = 0
+
+    def stamp(self):
+        '''The modification time and size of every task file'''
+        from shovel.runner import roots
+        from shovel.tasks import files
+        stamps = {}
+        for path, base in roots():
+            for absolute in files(path, base):
+                stat = os.stat(absolute)
+                stamps[absolute] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def current(self):
+        '''The up-to-date tasks'''
+        import time
+        from shovel.runner import load
+        with self.lock:
+            now = time.time()
+            if self.shovel is None or now - self.checked >= self.interval:
+                self.checked = now
+                stamps = self.stamp()
+                if stamps != self.stamps:
+                    # Task files that haven't changed are reused rather than
+                    # being executed again, so this is only as expensive as
+                    # the files that have changed
+                    logger.info('Reloading tasks in %s' % self.root)
+                    self.shovel = load()
+                    self.stamps = stamps
+            return self.shovel
+
+    def handle(self, request, connection):
+        '''Run a request, sending its output over the connection, and return
+        its exit code'''
+        from shovel.runner import command, status
+        stdout, stderr = connection.stream('stdout'), connection.stream('stderr')
+        Router.install()
+        with sys.stdout.to(stdout), sys.stderr.to(stderr):
+            try:
+                if os.path.realpath(request['cwd']) != self.root:
+                    print('This daemon serves %s' % self.root, file=sys.stderr)
+                    return 1
+                clargs, remaining = command(request['argv'])
+                if clargs.method == 'daemon':
+                    print('Already a daemon', file=sys.stderr)
+                    return 1
+                shovel = self.current()
+            except SystemExit as exc:
+                return status(exc)
+            except Exception:
+                traceback.print_exc()
+                return 1
+
+            # Since os.environ is shared by every thread, a request with an
+            # environment of its own is run in a child process
+            env = request.get('env')
+            if env is None or env == self.environment:
+                return self.run(clargs, remaining, shovel)
+            return self.fork(env, clargs, remaining, shovel)
+
+    def run(self, clargs, remaining, shovel):
+        '''Run a parsed command line with the provided tasks, and return its
+        exit code'''
+        from shovel.runner import execute, status
+        try:
+            with timing.Timings() as timings:
+                try:
+                    execute(clargs, remaining, shovel)
+                finally:
+                    if clargs.timings:
+                        timings.report(clargs.timings)
+        except SystemExit as exc:
+            return status(exc)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    def fork(self, env, clargs, remaining, shovel):
+        '''Run a parsed command line in a child forked from the daemon, with
+        the provided environment, and return its exit code. The child starts
+        off with the tasks loaded, and its output goes to the same client'''
+        import multiprocessing
+
+        def child():
+            os.environ.clear()
+            os.environ.update(env)
+            sys.exit(self.run(clargs, remaining, shovel))
+
+        process = multiprocessing.get_context('fork').Process(target=child)
+        process.start()
+        process.join()
+        if process.exitcode < 0:
+            from shovel.isolate import describe
+            print('The request %s' % describe(process.exitcode),
+                file=sys.stderr)
+            return 1
+        return process.exitcode
+
+    def listen(self, path=None):
+        '''Return a server for this daemon listening on a socket'''
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            '''Reads a request from a client and runs it'''
+            def handle(self):
+                connection = Connection(self.wfile)
+                try:
+                    request = json.loads(self.rfile.readline().decode('utf-8'))
+                    code = daemon.handle(request, connection)
+                    connection.send(exit=code)
+                except (IOError, OSError, ValueError):
+                    logger.exception('Failed to serve a client')
+
+        class Server(socketserver.ThreadingMixIn,
+            socketserver.UnixStreamServer):
+            '''Serves each client in its own thread'''
+            daemon_threads = True
+
+        path = address(path)
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                raise RuntimeError('A daemon is already listening on %s' % path)
+            except (IOError, OSError):
+                # Nobody is listening, so it's left over from a daemon that
+                # didn't shut down cleanly
+                os.remove(path)
+            finally:
+                probe.close()
+
+        Router.install()
+        self.current()
+        return Server(path, Handler)
+
+
+def serve(path=None):
+    '''Serve the tasks for the current directory until interrupted'''
+    server = Daemon().listen(path)
+    logger.info('Listening on %s' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(server.server_address)
@@ -0,0 +1,276 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Find tasks by reading the source of task files rather than importing them'''
+
+import os
+import ast
+
+# Internal imports
+from shovel import logger
+from shovel.tasks import Stub, files, modules
+from shovel.loader import module_name
+
+# Below this many files, starting a pool of processes costs more than it saves
+THRESHOLD = 64
+
+# The kinds of function definitions, including `async def` where there is one
+DEFINITIONS = tuple(getattr(ast, name)
+    for name in ('FunctionDef', 'AsyncFunctionDef') if hasattr(ast, name))
+
+
+class Visitor(ast.NodeVisitor):
+    '''Finds the names that refer to `shovel.task` in a module, and then the
+    definitions decorated with them'''
+    def __init__(self):
+        # Names that are bound to the decorator, like `task` after `from shovel
+        # import task`, and names bound to the module, like `shovel`
+        self.decorators = set()
+        self.modules = set()
+        # Definitions we found and references we couldn't make sense of
+        self.found = []
+        self.unresolved = []
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name == 'shovel':
+                self.modules.add(alias.asname or alias.name)
+
+    def visit_ImportFrom(self, node):
+        if node.module not in ('shovel', 'shovel.tasks'):
+            return
+        for alias in node.names:
+            if alias.name in ('task', '*'):
+                self.decorators.add(alias.asname or 'task')
+
+    def decorator(self, node):
+        '''Whether or not this expression refers to `shovel.task`'''
+        if isinstance(node, ast.Name):
+            return node.id in self.decorators
+        if isinstance(node, ast.Attribute) and node.attr == 'task':
+            return (isinstance(node.value, ast.Name) and
+                node.value.id in self.modules)
+        return False
+
+    def definitions(self, body):
+        '''Look through the statements of a module for decorated definitions.
+        Definitions nested in other statements may or may not happen, so
+        those are left to `visit`'''
+        for node in body:
+            if isinstance(node, DEFINITIONS + (ast.ClassDef,)):
+                # The decorator is used either bare or called with options
+                calls = [d for d in node.decorator_list if self.decorator(
+                    d.func if isinstance(d, ast.Call) else d)]
+                if calls:
+                    # Functions' line numbers start at their first decorator
+                    line = min([node.lineno] +
+                        [d.lineno for d in node.decorator_list])
+                    call = calls[0] if isinstance(calls[0], ast.Call) else None
+                    self.found.append((node, line, call))
+                    # Don't count this decorator as an unresolved reference
+                    node.decorator_list = [
+                        d for d in node.decorator_list if d not in calls]
+            self.visit(node)
+
+    def visit_Module(self, node):
+        self.definitions(node.body)
+
+    def visit_Name(self, node):
+        if node.id in self.decorators:
+            self.unresolved.append((node.lineno, 'dynamic use of task'))
+
+    def visit_Attribute(self, node):
+        if self.decorator(node):
+            self.unresolved.append((node.lineno, 'dynamic use of task'))
+        else:
+            self.generic_visit(node)
+
+
+def default(node):
+    '''How a default value would be displayed once imported'''
+    try:
+        return str(ast.literal_eval(node))
+    except (ValueError, TypeError, SyntaxError):
+        # The best we can do is the source of the expression
+        return source(node)
+
+
+def source(node):
+    '''The source of an expression, if it can be recovered'''
+    if hasattr(ast, 'unparse'):
+        return ast.unparse(node)
+    # Before python 3.9, only names (like most annotations) are recovered
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return '%s.%s' % (source(node.value), node.attr)
+    return '<%s>' % type(node).__name__
+
+
+def spec(node, method=False):
+    '''The argspec of a function definition, in the form `Task.to_dict` uses'''
+    arguments = node.args
+    positional = list(getattr(arguments, 'posonlyargs', []))
+    positional.extend(arguments.args)
+    if method:
+        positional = positional[1:]
+    kwonly = getattr(arguments, 'kwonlyargs', [])
+    kwonlydefaults = {}
+    for arg, value in zip(kwonly, getattr(arguments, 'kw_defaults', [])):
+        if value is not None:
+            kwonlydefaults[arg.arg] = default(value)
+
+    annotations = {}
+    every = positional + kwonly + [
+        a for a in (arguments.vararg, arguments.kwarg) if a is not None]
+    for arg in every:
+        if getattr(arg, 'annotation', None) is not None:
+            annotations[arg.arg] = source(arg.annotation)
+    return {
+        'args': [a.arg for a in positional],
+        'varargs': arguments.vararg and arguments.vararg.arg,
+        'keywords': arguments.kwarg and arguments.kwarg.arg,
+        'defaults': [default(d) for d in arguments.defaults],
+        'kwonlyargs': [a.arg for a in kwonly],
+        'kwonlydefaults': kwonlydefaults,
+        'annotations': annotations
+    }
+
+
+def options(call):
+    '''The options given in a call like `@task(depends=[...])`. Raises
+    ValueError if they can't be known without running the code'''
+    if call.args:
+        raise ValueError('positional arguments')
+    found = {}
+    for keyword in call.keywords:
+        if keyword.arg not in ('depends', 'inputs', 'outputs', 'cache',
+            'isolate', 'timeout', 'max_memory'):
+            raise ValueError('unknown option')
+        value = ast.literal_eval(keyword.value)
+        if keyword.arg == 'max_memory':
+            from shovel.isolate import size
+            found['max_memory'] = size(value)
+            continue
+        if keyword.arg in ('cache', 'isolate', 'timeout'):
+            found[keyword.arg] = value
+            continue
+        if not isinstance(value, (list, tuple)):
+            raise ValueError('%s is not a list' % keyword.arg)
+        found[keyword.arg] = list(value)
+    return found
+
+
+def nullary(node):
+    '''Whether an `__init__` definition can be called without arguments'''
+    details = spec(node, True)
+    return (len(details['args']) == len(details['defaults']) and
+        set(details['kwonlyargs']) == set(details['kwonlydefaults']))
+
+
+def parse(absolute, base):
+    '''Return a list of the details of the tasks defined in a file, and a list
+    of the (file, line, reason) of anything that would need an import'''
+    with open(absolute, 'rb') as fin:
+        source = fin.read()
+    try:
+        tree = ast.parse(source, absolute)
+    except SyntaxError as exc:
+        return [], [(absolute, exc.lineno, 'syntax error')]
+
+    visitor = Visitor()
+    visitor.visit(tree)
+    relative, _, _ = os.path.relpath(absolute, base).rpartition('.py')
+    found = []
+    unresolved = [(absolute, line, why) for line, why in visitor.unresolved]
+    for node, line, call in visitor.found:
+        details = {
+            'name': node.name,
+            'fullname': '.'.join(modules(relative) + modules(node.name)),
+            'doc': ast.get_docstring(node) or '',
+            'module': module_name(absolute),
+            'file': absolute,
+            'line': line,
+            'depends': [],
+            'inputs': [],
+            'outputs': [],
+            'cache': None,
+            'isolate': False,
+            'timeout': None,
+            'max_memory': None
+        }
+        if call is not None:
+            try:
+                details.update(options(call))
+            except ValueError:
+                unresolved.append((absolute, node.lineno, 'task options'))
+                continue
+        if isinstance(node, ast.ClassDef):
+            # Classes are instantiated with no arguments, and then called
+            methods = dict((n.name, n) for n in node.body
+                if isinstance(n, DEFINITIONS))
+            init, call = methods.get('__init__'), methods.get('__call__')
+            if init and not nullary(init):
+                unresolved.append((absolute, node.lineno, 'class arguments'))
+                continue
+            if call is None:
+                unresolved.append((absolute, node.lineno, 'inherited call'))
+                continue
+            details['spec'] = spec(call, True)
+            details['doc'] = ast.get_docstring(call) or details['doc']
+            details['line'] = 'Unknown line'
+            details['file'] = 'Unknown file'
+        else:
+            details['spec'] = spec(node)
+        found.append(details)
+    return found, unresolved
+
+
+def _parse(args):
+    '''Unpack arguments for `parse` in a pool'''
+    return parse(*args)
+
+
+def discover(path, base=None, processes=None):
+    '''Return a list of the tasks in path (a file or directory), found without
+    importing anything, and a list of (file, line, reason) for anything that
+    would need an import to resolve. Large trees are parsed in a pool of
+    processes, unless `processes` is 1'''
+    base = os.path.abspath(base or os.getcwd())
+    paths = list(files(path, base))
+    jobs = [(absolute, base) for absolute in paths]
+    if processes != 1 and len(jobs) >= THRESHOLD:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_parse, jobs, chunksize=16)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [parse(*job) for job in jobs]
+
+    tasks, unresolved = [], []
+    for absolute, (found, missing) in zip(paths, results):
+        logger.info('Read %s' % absolute)
+        tasks.extend(Stub(details, absolute, base) for details in found)
+        unresolved.extend(missing)
+    return tasks, unresolved
@@ -24,6 +24,7 @@
 
 import re
 from shovel.tasks import Shovel
+from shovel.resolve import resolve
 
 
 def heirarchical_helper(shovel, prefix, level=0):
@@ -71,6 +72,7 @@ def shovel_help(shovel, *names):
         return heirarchical_help(shovel, '')
     else:
         for name in names:
+            name = resolve(shovel, name)
             task = shovel[name]
             if isinstance(task, Shovel):
                 return heirarchical_help(task, name)
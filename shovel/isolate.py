@@ -0,0 +1,296 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Running a task in a child process of its own, so that one that hangs or
+runs away with memory can be killed without taking down whatever is running
+it, be that shovel itself, a daemon, a batch, or some other program'''
+
+import sys
+import traceback
+from contextlib import contextmanager
+
+# Internal imports
+from shovel.compat import ContextVar
+
+# Return values that expose at least this many bytes through the buffer
+# protocol (bytes, bytearrays, arrays, numpy arrays) are passed back in shared
+# memory, rather than pickled through a pipe
+SHARED = 1024 * 1024
+
+# Suffixes accepted in memory sizes, like `512M`
+UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+# Isolation asked for on the command line, which applies to every task that's
+# run in this context, on top of what each asks for itself
+_defaults = ContextVar('shovel_isolate', default=None)
+
+
+def size(value):
+    '''A number of bytes, given either as a number or as a string with an
+    optional suffix, like `512M` or `2G`'''
+    if isinstance(value, bool):
+        raise ValueError('Not a size: %s' % value)
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().upper().rstrip('B')
+    multiple = UNITS.get(text[-1:], 1)
+    if text[-1:] in UNITS:
+        text = text[:-1]
+    try:
+        return int(float(text) * multiple)
+    except ValueError:
+        raise ValueError('Not a size: %s' % value)
+
+
+@contextmanager
+def configure(isolate=True, timeout=None, max_memory=None):
+    '''Isolate every task run in this context for the duration, with these
+    limits'''
+    if isolate or timeout is not None or max_memory is not None:
+        limits = {
+            'timeout': timeout,
+            'max_memory': None if max_memory is None else size(max_memory)
+        }
+    else:
+        limits = None
+    token = _defaults.set(limits)
+    try:
+        yield
+    finally:
+        _defaults.reset(token)
+
+
+def settings(task):
+    '''The timeout and memory limit for a task if it's to be isolated, by its
+    own options or those from `configure`. Otherwise, None'''
+    defaults = _defaults.get()
+    if not (defaults or task.isolate or task.timeout is not None or
+        task.max_memory is not None):
+        return None
+    defaults = defaults or {}
+    return {
+        'timeout': task.timeout if task.timeout is not None
+            else defaults.get('timeout'),
+        'max_memory': task.max_memory if task.max_memory is not None
+            else defaults.get('max_memory')
+    }
+
+
+class RemoteTraceback(Exception):
+    '''The traceback of an exception raised in the child process, attached as
+    the cause of that exception once it's raised again in the parent'''
+    def __init__(self, text):
+        Exception.__init__(self, text)
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+def pack(value):
+    '''A message describing a return value. Large buffers are copied into
+    shared memory, and the rest is pickled along with the message'''
+    try:
+        view = memoryview(value)
+    except TypeError:
+        return ('return', value)
+    if view.nbytes < SHARED or not view.c_contiguous:
+        return ('return', value)
+
+    import array
+    if isinstance(value, bytes):
+        kind, meta = 'bytes', None
+    elif isinstance(value, bytearray):
+        kind, meta = 'bytearray', None
+    elif isinstance(value, array.array):
+        kind, meta = 'array', value.typecode
+    elif type(value).__module__ == 'numpy' and hasattr(value, 'dtype'):
+        if value.dtype.hasobject:
+            return ('return', value)
+        kind, meta = 'ndarray', (value.dtype.str, value.shape)
+    elif isinstance(value, memoryview):
+        kind, meta = 'bytes', None
+    else:
+        return ('return', value)
+
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        # Before python 3.8, everything is pickled through the pipe
+        return ('return', value)
+    block = shared_memory.SharedMemory(create=True, size=view.nbytes)
+    try:
+        block.buf[:view.nbytes] = view.cast('B')
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    # The parent unlinks it once it's read. Until then, it's registered with
+    # the resource tracker the parent started, which cleans it up if the
+    # parent goes away first
+    block.close()
+    return ('shared', block.name, view.nbytes, kind, meta)
+
+
+def unpack(message):
+    '''The return value described by a message from `pack`'''
+    if message[0] == 'return':
+        return message[1]
+
+    from multiprocessing import shared_memory
+    _, name, length, kind, meta = message
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        view = block.buf[:length]
+        try:
+            if kind == 'bytes':
+                return bytes(view)
+            elif kind == 'bytearray':
+                return bytearray(view)
+            elif kind == 'array':
+                import array
+                value = array.array(meta)
+                value.frombytes(view)
+                return value
+            import numpy
+            dtype, shape = meta
+            return numpy.frombuffer(view, dtype=dtype).reshape(shape).copy()
+        finally:
+            view.release()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def attempt(task, args, kwargs):
+    '''Run the task, and return a message saying how it went'''
+    try:
+        return pack(task._call(*args, **kwargs))
+    except BaseException as exc:
+        return ('error', exc, traceback.format_exc())
+
+
+def _child(conn, task, args, kwargs, max_memory, captured):
+    '''Run the task in the child process, and send back what happened'''
+    if max_memory is not None:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+
+    # If the parent is capturing output (or writing it to memory), then this
+    # process' writes into its copy would be lost, so they're sent back
+    if captured:
+        from shovel.capture import capture
+        with capture() as (out, err):
+            message = attempt(task, args, kwargs)
+            message += (out.getvalue(), err.getvalue())
+    else:
+        message = attempt(task, args, kwargs) + (None, None)
+    try:
+        conn.send(message)
+    except Exception:
+        # The exception (or return value) couldn't be pickled
+        text = traceback.format_exc()
+        conn.send(('error', RuntimeError(text), text) + message[-2:])
+    finally:
+        conn.close()
+
+
+def forwarded(stream):
+    '''Whether what a child process writes to this stream must be sent back
+    to be written, because it doesn't go to a file they share'''
+    from shovel.capture import Router
+    if isinstance(stream, Router):
+        if stream.target.get() is not None:
+            return True
+        stream = stream.original
+    try:
+        stream.fileno()
+    except (AttributeError, ValueError, OSError):
+        # Including io.UnsupportedOperation, for in-memory streams
+        return True
+    return False
+
+
+def describe(code):
+    '''How a child process that exited with this code came to an end'''
+    if code is not None and code < 0:
+        import signal
+        try:
+            return 'was killed by %s' % signal.Signals(-code).name
+        except ValueError:
+            return 'was killed by signal %i' % -code
+    return 'exited with code %s' % code
+
+
+def run(task, args, kwargs, timeout=None, max_memory=None):
+    '''Run a task in a child process, killing it if it's still running after
+    `timeout` seconds, with its address space limited to `max_memory` bytes.
+    Returns what it returns, and raises what it raises (with the child's
+    traceback as the cause). Raises TimeoutError if it took too long, and
+    RuntimeError if it died without saying why'''
+    import os
+    import signal
+    import multiprocessing
+
+    # Shared memory the child makes is registered with the tracker, and so it
+    # needs to be one they share. Before python 3.8, there's neither
+    try:
+        from multiprocessing import resource_tracker
+    except ImportError:
+        pass
+    else:
+        resource_tracker.ensure_running()
+    captured = forwarded(sys.stdout) or forwarded(sys.stderr)
+    # Otherwise, whatever's buffered would be written by both processes
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_child,
+        args=(sender, task, args, kwargs, max_memory, captured))
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            os.kill(process.pid, signal.SIGKILL)
+            raise TimeoutError('%s timed out after %s seconds' % (
+                task.fullname, timeout))
+        try:
+            message = receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError('%s %s' % (
+                task.fullname, describe(process.exitcode))) from None
+    finally:
+        receiver.close()
+        process.join()
+
+    message, out, err = message[:-2], message[-2], message[-1]
+    if out:
+        sys.stdout.write(out)
+    if err:
+        sys.stderr.write(err)
+    if message[0] == 'error':
+        _, exc, text = message
+        exc.__cause__ = RemoteTraceback(text)
+        raise exc
+    return unpack(message)
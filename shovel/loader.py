@@ -0,0 +1,104 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Importing task files'''
+
+import os
+import re
+import sys
+import marshal
+import hashlib
+import importlib.util
+import importlib.machinery
+
+# Internal imports
+from shovel import logger
+from shovel import cache
+
+
+def module_name(absolute):
+    '''The name a task file is imported as. It's derived from the whole path so
+    that `a/util.py` and `b/util.py` don't clobber each other'''
+    stem, _, _ = os.path.basename(absolute).rpartition('.py')
+    digest = hashlib.sha1(absolute.encode('utf-8')).hexdigest()[:10]
+    return '_shovel_%s_%s' % (re.sub(r'\W', '_', stem), digest)
+
+
+class Loader(importlib.machinery.SourceFileLoader):
+    '''Loads task files, keeping their bytecode in shovel's cache rather than
+    in __pycache__ next to them, which might not be writable'''
+    def bytecode(self, path):
+        '''Where the bytecode for a file is cached, or None if nowhere'''
+        try:
+            directory = cache.directory('bytecode')
+        except (IOError, OSError):
+            return None
+        digest = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(directory, '%s.%s.pyc' % (
+            os.path.basename(path), digest))
+
+    def get_code(self, fullname):
+        path = self.get_filename(fullname)
+        stat = os.stat(path)
+        # Bytecode is only valid for the same interpreter and source
+        stamp = '%i:%i\n' % (stat.st_mtime_ns, stat.st_size)
+        header = importlib.util.MAGIC_NUMBER + stamp.encode('ascii')
+        cached = self.bytecode(path)
+        if cached:
+            try:
+                with open(cached, 'rb') as fin:
+                    data = fin.read()
+                if data.startswith(header):
+                    return marshal.loads(data[len(header):])
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                pass
+
+        code = self.source_to_code(self.get_data(path), path)
+        if cached:
+            try:
+                cache.write(cached, header + marshal.dumps(code))
+            except (IOError, OSError):
+                logger.info('Unable to cache bytecode for %s' % path)
+        return code
+
+
+def load(absolute):
+    '''Import a task file, returning the module and whether or not it was
+    executed. A module that was already imported is reused as long as its file
+    hasn't changed since'''
+    name = module_name(absolute)
+    stat = os.stat(absolute)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    module = sys.modules.get(name)
+    if getattr(module, '__shovel_stamp__', None) == stamp:
+        return module, False
+
+    spec = importlib.util.spec_from_file_location(
+        name, absolute, loader=Loader(name, absolute))
+    module = importlib.util.module_from_spec(spec)
+    module.__shovel_stamp__ = stamp
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module, True
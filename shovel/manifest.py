@@ -0,0 +1,118 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''A persistent record of the tasks each file defines'''
+
+import os
+import json
+import hashlib
+
+# Internal imports
+from shovel import logger
+from shovel import cache
+from shovel.tasks import Task, Stub
+
+
+class Manifest(object):
+    '''An on-disk cache of task details, keyed by file. When a file hasn't
+    changed since it was last read, its tasks can be listed and described
+    without importing it'''
+    # Bumped whenever the format of the stored task details changes
+    version = 7
+
+    @classmethod
+    def load(cls, path=None):
+        '''Read the manifest at path (or the default location)'''
+        path = path or os.path.join(cache.directory(), 'manifest.json')
+        try:
+            with open(path) as fin:
+                data = json.load(fin)
+            if data.get('version') == cls.version:
+                return cls(path, data['files'])
+            logger.info('Ignoring manifest %s of another version' % path)
+        except (IOError, OSError, ValueError, KeyError):
+            logger.info('No usable manifest at %s' % path)
+        return cls(path)
+
+    def __init__(self, path, files=None):
+        self.path = path
+        self.files = files or {}
+        self.dirty = False
+
+    @staticmethod
+    def digest(path):
+        '''The hash of a file's contents'''
+        with open(path, 'rb') as fin:
+            return hashlib.sha1(fin.read()).hexdigest()
+
+    def fresh(self, absolute, base):
+        '''Return the entry for this file if it's still current, else None'''
+        entry = self.files.get(absolute)
+        if entry is None or entry['base'] != base:
+            return None
+        stat = os.stat(absolute)
+        if entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry
+        # The stat has changed, but that happens with a checkout or a touch,
+        # so make sure that the contents have really changed
+        if entry['hash'] == self.digest(absolute):
+            entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+            self.dirty = True
+            return entry
+        return None
+
+    def tasks(self, path, base=None):
+        '''Return the tasks in a file, importing it only if it is stale'''
+        base = base or os.getcwd()
+        absolute = os.path.abspath(path)
+        entry = self.fresh(absolute, base)
+        if entry is not None:
+            logger.debug('Using manifest for %s' % absolute)
+            return [Stub(d, absolute, base) for d in entry['tasks']]
+
+        tasks = Task.load(path, base)
+        stat = os.stat(absolute)
+        self.files[absolute] = {
+            'base': base,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': self.digest(absolute),
+            'tasks': [task.to_dict() for task in tasks]
+        }
+        self.dirty = True
+        return tasks
+
+    def save(self):
+        '''Write the manifest back out if anything has changed, forgetting
+        about any files that no longer exist'''
+        for absolute in [f for f in self.files if not os.path.exists(f)]:
+            del self.files[absolute]
+            self.dirty = True
+        if not self.dirty:
+            return
+        try:
+            cache.write(self.path, json.dumps({
+                'version': self.version,
+                'files': self.files
+            }))
+            self.dirty = False
+        except (IOError, OSError):
+            logger.exception('Unable to write manifest %s' % self.path)
@@ -0,0 +1,278 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''An on-disk store of tasks' return values, for tasks that ask for it'''
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+
+# Internal imports
+from shovel import logger
+from shovel import cache
+
+# The default bound on the size of the store, in bytes
+SIZE = 256 * 1024 * 1024
+
+
+class Memo(object):
+    '''Return values of tasks, each in a file named by the hash of the task's
+    full name, source and arguments. Each file starts with a line of JSON with
+    when it expires, followed by the pickled value. Files are touched when
+    they're used, so that when the store grows beyond its size, the least
+    recently used can be evicted'''
+    def __init__(self, path=None, size=None):
+        self.path = path or cache.directory('memo')
+        if size is None:
+            size = int(os.environ.get('SHOVEL_MEMO_SIZE', SIZE))
+        self.size = size
+        self.lock = threading.Lock()
+        # How big the store is, as far as we know, so that it's only listed
+        # when it's grown too big. Until it's first listed, we don't know
+        self.used = None
+        # The hashes of source files, along with their stats
+        self.sources = {}
+
+    def source(self, task):
+        '''The hash of the file that defines a task'''
+        path = task.source or task.file
+        try:
+            stat = os.stat(path)
+        except (TypeError, OSError):
+            return None
+        stamp = (stat.st_mtime, stat.st_size)
+        found = self.sources.get(path)
+        if found is None or found[0] != stamp:
+            with open(path, 'rb') as fin:
+                found = (stamp, hashlib.sha1(fin.read()).hexdigest())
+            self.sources[path] = found
+        return found[1]
+
+    def key(self, task, args, kwargs):
+        '''The key of an invocation, regardless of whether arguments are given
+        by position or keyword. Raises TypeError if it can't be pickled'''
+        bound = task.args.get(*args, **kwargs)
+        values = dict(bound.required + bound.overridden + bound.defaulted)
+        values.update(bound.kwargs)
+        try:
+            arguments = pickle.dumps(
+                (sorted(values.items()), tuple(bound.varargs)), 2)
+        except (pickle.PicklingError, AttributeError, TypeError) as exc:
+            raise TypeError('Unable to pickle arguments: %s' % exc)
+        hasher = hashlib.sha1()
+        hasher.update(task.fullname.encode('utf-8'))
+        hasher.update((self.source(task) or '').encode('utf-8'))
+        hasher.update(arguments)
+        return hasher.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, '%s.pickle' % key)
+
+    @staticmethod
+    def header(path):
+        '''The header of a stored value'''
+        with open(path, 'rb') as fin:
+            return json.loads(fin.readline().decode('utf-8'))
+
+    def get(self, key):
+        '''Return (True, value) for a stored value, or (False, None)'''
+        path = self.filename(key)
+        try:
+            with open(path, 'rb') as fin:
+                header = json.loads(fin.readline().decode('utf-8'))
+                if header['expires'] is not None and (
+                    header['expires'] < time.time()):
+                    fin.close()
+                    self.remove(path)
+                    return False, None
+                value = pickle.load(fin)
+            os.utime(path, None)
+            return True, value
+        except (IOError, OSError):
+            return False, None
+        except Exception:
+            logger.exception('Unable to read %s' % path)
+            self.remove(path)
+            return False, None
+
+    def put(self, key, value, ttl=None, fullname=None):
+        '''Store a value, to expire after ttl seconds (if any)'''
+        header = json.dumps({
+            'expires': None if ttl is None else time.time() + ttl,
+            'task': fullname
+        })
+        try:
+            data = pickle.dumps(value, 2)
+        except Exception as exc:
+            logger.warning('Unable to store result of %s: %s' % (fullname, exc))
+            return
+        path = self.filename(key)
+        data = header.encode('utf-8') + b'\n' + data
+        try:
+            previous = os.stat(path).st_size
+        except OSError:
+            previous = 0
+        cache.write(path, data)
+        with self.lock:
+            if self.used is not None:
+                self.used += len(data) - previous
+            full = self.used is None or self.used > self.size
+        if full:
+            self.prune()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def entries(self):
+        '''Yield (path, stat) for each stored value'''
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.pickle'):
+                path = os.path.join(self.path, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    pass
+
+    def prune(self, expired=False):
+        '''Evict the least recently used values until the store fits in its
+        size. If asked, first remove every value that has expired. Returns how
+        many were removed'''
+        removed = 0
+        entries = []
+        now = time.time()
+        with self.lock:
+            for path, stat in self.entries():
+                if expired:
+                    try:
+                        expires = self.header(path)['expires']
+                    except (IOError, OSError, ValueError, KeyError):
+                        expires = now
+                    if expires is not None and expires <= now:
+                        self.remove(path)
+                        removed += 1
+                        continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.size:
+                    break
+                self.remove(path)
+                total -= size
+                removed += 1
+            self.used = total
+        return removed
+
+    def stats(self):
+        '''A description of what's in the store'''
+        entries = list(self.entries())
+        counts = self.counts()
+        return {
+            'path': self.path,
+            'entries': len(entries),
+            'bytes': sum(stat.st_size for _, stat in entries),
+            'limit': self.size,
+            'hits': counts.get('hits', 0),
+            'misses': counts.get('misses', 0)
+        }
+
+    def counts(self):
+        '''The numbers of hits and misses so far'''
+        try:
+            with open(os.path.join(self.path, 'stats.json')) as fin:
+                return json.load(fin)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def count(self, name):
+        '''Add one to the number of hits or misses. Several processes may be
+        counting at once, so the counts are updated under a lock'''
+        path = os.path.join(self.path, 'stats.json')
+        with self.lock:
+            try:
+                with open(path + '.lock', 'a') as lock:
+                    try:
+                        import fcntl
+                        fcntl.flock(lock, fcntl.LOCK_EX)
+                    except ImportError:  # pragma: no cover
+                        pass
+                    counts = self.counts()
+                    counts[name] = counts.get(name, 0) + 1
+                    cache.write(path, json.dumps(counts))
+            except (IOError, OSError):
+                logger.exception('Unable to record memo stats')
+
+    def lookup(self, task, args, kwargs):
+        '''Return (key, found, value) for an invocation of a task, where found
+        is whether there's a stored return value. The key is None if the
+        return value can't be stored'''
+        try:
+            key = self.key(task, args, kwargs)
+        except TypeError as exc:
+            logger.debug('Not memoizing %s: %s' % (task.fullname, exc))
+            return None, False, None
+
+        found, value = self.get(key)
+        if found:
+            logger.debug('Using stored result of %s' % task.fullname)
+            self.count('hits')
+        else:
+            self.count('misses')
+        return key, found, value
+
+    def keep(self, task, key, value):
+        '''Store the return value of an invocation, for as long as the task
+        asks'''
+        if key is not None:
+            ttl = None if task.cache is True else task.cache
+            self.put(key, value, ttl, task.fullname)
+
+    def call(self, task, args, kwargs):
+        '''Invoke a task, using its stored return value if there is one'''
+        key, found, value = self.lookup(task, args, kwargs)
+        if found:
+            return value
+        value = task.invoke(*args, **kwargs)
+        self.keep(task, key, value)
+        return value
+
+
+# The store used for all tasks, made when it's first needed
+_memo = None
+
+
+def memo():
+    '''The store used for tasks' return values, in the current cache'''
+    global _memo
+    path = cache.directory('memo')
+    if _memo is None or _memo.path != path:
+        _memo = Memo(path)
+    return _memo
@@ -0,0 +1,314 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Metrics about the tasks that are run: how long they take, whether they
+succeed, and how much memory they use. These are exported to a Prometheus
+node-exporter textfile ($SHOVEL_METRICS_TEXTFILE), and/or to a statsd server
+over UDP ($SHOVEL_STATSD, as host:port). Measurements are kept in memory and
+sent in batches, at most every few seconds and when the process exits'''
+
+import os
+import sys
+import json
+import atexit
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# Internal imports
+from shovel import cache, logger
+
+# The upper bounds of the duration histogram's buckets, in seconds. They go
+# well past the usual defaults, since tasks are often long-running cron jobs
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+    300, 600, 1800, 3600)
+
+# How often, at most, measurements are sent, in seconds
+INTERVAL = 10
+
+# The largest statsd packet, which keeps clear of fragmenting on most networks
+PACKET = 1432
+
+
+def peak_rss():
+    '''The most memory this process has had resident, in bytes'''
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports it in kilobytes, but macOS in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def empty():
+    '''The measurements of a task that hasn't been run'''
+    return {
+        'buckets': [0] * (len(BUCKETS) + 1),
+        'sum': 0.0,
+        'count': 0,
+        'success': 0,
+        'failure': 0,
+        'peak_rss': None,
+        'last_success': None
+    }
+
+
+def merge(into, measured):
+    '''Add the measurements of some tasks to those of others'''
+    for name, task in measured.items():
+        total = into.setdefault(name, empty())
+        for key in ('sum', 'count', 'success', 'failure'):
+            total[key] += task[key]
+        total['buckets'] = [a + b for a, b in zip(
+            total['buckets'], task['buckets'])]
+        for key in ('peak_rss', 'last_success'):
+            if task[key] is not None:
+                total[key] = task[key]
+    return into
+
+
+def label(value):
+    '''Escape a Prometheus label value'''
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def render(tasks):
+    '''The Prometheus text format of the measurements of some tasks'''
+    lines = [
+        '# HELP shovel_task_duration_seconds How long tasks took to run',
+        '# TYPE shovel_task_duration_seconds histogram']
+    for name, task in sorted(tasks.items()):
+        name = label(name)
+        count = 0
+        for bound, number in zip(BUCKETS + ('+Inf',), task['buckets']):
+            count += number
+            lines.append('shovel_task_duration_seconds_bucket'
+                '{task="%s",le="%s"} %i' % (name, bound, count))
+        lines.append('shovel_task_duration_seconds_sum{task="%s"} %r' % (
+            name, task['sum']))
+        lines.append('shovel_task_duration_seconds_count{task="%s"} %i' % (
+            name, task['count']))
+
+    lines.extend([
+        '# HELP shovel_task_runs_total Tasks run, by whether they succeeded',
+        '# TYPE shovel_task_runs_total counter'])
+    for name, task in sorted(tasks.items()):
+        for result in ('success', 'failure'):
+            lines.append('shovel_task_runs_total{task="%s",result="%s"} %i' % (
+                label(name), result, task[result]))
+
+    for metric, key, description in (
+        ('shovel_task_peak_rss_bytes', 'peak_rss',
+            'The peak resident memory of the process that last ran the task'),
+        ('shovel_task_last_success_timestamp_seconds', 'last_success',
+            'When the task last succeeded')):
+        lines.extend([
+            '# HELP %s %s' % (metric, description),
+            '# TYPE %s gauge' % metric])
+        for name, task in sorted(tasks.items()):
+            if task[key] is not None:
+                lines.append('%s{task="%s"} %r' % (metric, label(name), task[key]))
+    return ''.join('%s\n' % line for line in lines)
+
+
+def packets(lines, size=PACKET):
+    '''Join statsd lines into as few packets as fit them'''
+    packet = ''
+    for line in lines:
+        if packet and len(packet) + 1 + len(line) > size:
+            yield packet
+            packet = ''
+        packet = packet + '\n' + line if packet else line
+    if packet:
+        yield packet
+
+
+class Recorder(object):
+    '''Measures tasks, and periodically sends what it's measured to a
+    Prometheus textfile and / or a statsd server'''
+    def __init__(self, textfile=None, statsd=None, prefix='shovel'):
+        self.textfile = textfile
+        self.statsd = statsd
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.lines = []
+        self.flushed = time.time()
+
+        # Processes started by multiprocessing (like those of a batch) don't
+        # run atexit handlers, but they do run its finalizers
+        from multiprocessing import util
+        self._started()
+        util.register_after_fork(self, Recorder._started)
+
+    def _forked(self):
+        '''Forget the measurements of the parent process, which are its to
+        send, in a forked child'''
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.lines = []
+
+    def _started(self):
+        from multiprocessing import util
+        util.Finalize(self, self.flush, exitpriority=10)
+
+    @contextmanager
+    def measure(self, name):
+        '''Measure the task run in the block'''
+        start = time.perf_counter()
+        success = False
+        try:
+            yield
+            success = True
+        except SystemExit as exc:
+            success = not exc.code
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, success)
+
+    def record(self, name, duration, success, rss=None):
+        '''Record a run of a task'''
+        rss = peak_rss() if rss is None else rss
+        now = time.time()
+        with self.lock:
+            task = self.tasks.setdefault(name, empty())
+            index = len(BUCKETS)
+            for position, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    index = position
+                    break
+            task['buckets'][index] += 1
+            task['sum'] += duration
+            task['count'] += 1
+            task['success' if success else 'failure'] += 1
+            task['peak_rss'] = rss
+            if success:
+                task['last_success'] = now
+            if self.statsd:
+                stat = '%s.task.%s' % (self.prefix, name)
+                self.lines.extend([
+                    '%s.duration:%.3f|ms' % (stat, duration * 1000),
+                    '%s.%s:1|c' % (stat, 'success' if success else 'failure')])
+                if rss is not None:
+                    self.lines.append('%s.peak_rss:%i|g' % (stat, rss))
+            due = now - self.flushed >= INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        '''Send everything that's been measured since the last flush'''
+        with self.lock:
+            tasks, self.tasks = self.tasks, {}
+            lines, self.lines = self.lines, []
+            self.flushed = time.time()
+        try:
+            if tasks and self.textfile:
+                self.write(tasks)
+            if lines and self.statsd:
+                self.send(lines)
+        except Exception:
+            logger.exception('Unable to export metrics')
+
+    def state(self):
+        '''Where the measurements behind the textfile are kept'''
+        digest = hashlib.sha1(
+            os.path.abspath(self.textfile).encode('utf-8')).hexdigest()
+        return os.path.join(cache.directory('metrics'), '%s.json' % digest[:16])
+
+    def write(self, tasks):
+        '''Add measurements to those in the textfile. Every run adds to the
+        same totals, so they're kept in the cache and merged under a lock'''
+        path = self.state()
+        with open(path + '.lock', 'a') as lock:
+            try:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except ImportError:  # pragma: no cover
+                pass
+            try:
+                with open(path) as fin:
+                    total = json.load(fin)
+            except (IOError, OSError, ValueError):
+                total = {}
+            merge(total, tasks)
+            cache.write(path, json.dumps(total))
+            cache.write(self.textfile, render(total))
+
+    def send(self, lines):
+        '''Send statsd lines in as few packets as fit them'''
+        import socket
+        host, _, port = self.statsd.rpartition(':')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for packet in packets(lines):
+                sock.sendto(packet.encode('utf-8'), (host, int(port)))
+        finally:
+            sock.close()
+
+
+_recorder = None
+
+
+def _exit():
+    '''Send whatever's left when the process exits'''
+    if _recorder is not None:
+        _recorder.flush()
+
+
+def _forked():
+    if _recorder is not None:
+        _recorder._forked()
+
+
+def recorder():
+    '''The recorder for where the environment says to send metrics, or None
+    if it doesn't say'''
+    global _recorder
+    textfile = os.environ.get('SHOVEL_METRICS_TEXTFILE') or None
+    statsd = os.environ.get('SHOVEL_STATSD') or None
+    if not (textfile or statsd):
+        return None
+    prefix = os.environ.get('SHOVEL_STATSD_PREFIX') or 'shovel'
+    if _recorder is None:
+        # Only a process that measures something has anything to send
+        atexit.register(_exit)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_forked)
+    elif (_recorder.textfile, _recorder.statsd, _recorder.prefix) != (
+        textfile, statsd, prefix):
+        _recorder.flush()
+    else:
+        return _recorder
+    _recorder = Recorder(textfile, statsd, prefix)
+    return _recorder
+
+
+@contextmanager
+def measure(name):
+    '''Measure the task run in the block, if metrics are being sent'''
+    found = recorder()
+    if found is None:
+        yield
+    else:
+        with found.measure(name):
+            yield
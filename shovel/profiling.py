@@ -0,0 +1,104 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Profiling tasks (and reading them in) with cProfile'''
+
+from __future__ import print_function
+
+import os
+import sys
+
+
+def profile(func, *args, **kwargs):
+    '''Call func under cProfile, and return what it returns along with the
+    `pstats.Stats` of the call'''
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    return result, pstats.Stats(profiler)
+
+
+def label(func):
+    '''How a function (a (file, line, name) from pstats) appears in a stack'''
+    path, line, name = func
+    if path == '~' and line == 0:
+        # Built in, like `<built-in method time.sleep>`
+        return name
+    return '%s (%s:%i)' % (name, os.path.basename(path), line)
+
+
+def collapse(stats, floor=1e-6):
+    '''Yield collapsed stacks, like `a;b;c 1200`, weighted in microseconds.
+    cProfile only knows which functions call which, not whole stacks, so each
+    function's time is split between its callers in proportion to the time
+    it spent when called by each. Paths worth less than floor seconds, and
+    recursive calls, are left out'''
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    # The entry points are the functions nothing (that was profiled) called
+    roots = [func for func, details in stats.stats.items() if not details[4]]
+    work = [((func,), 1.0) for func in roots]
+    while work:
+        stack, share = work.pop()
+        func = stack[-1]
+        _, _, own, total, _ = stats.stats[func]
+        weight = int(round(own * share * 1e6))
+        if weight:
+            yield '%s %i' % (';'.join(label(f) for f in stack), weight)
+        for callee, spent in callees.get(func, ()):
+            if callee in stack or not stats.stats[callee][3]:
+                continue
+            portion = share * spent / stats.stats[callee][3]
+            if portion * stats.stats[callee][3] >= floor:
+                work.append((stack + (callee,), portion))
+
+
+def report(stats, prefix, top=20, stacks=False, stream=None):
+    '''Write stats to prefix.pstats (and, if asked, collapsed stacks to
+    prefix.folded), and print the top functions by cumulative time'''
+    stream = stream or sys.stderr
+    path = '%s.pstats' % prefix
+    stats.dump_stats(path)
+    print('Profile written to %s' % path, file=stream)
+    if stacks:
+        path = '%s.folded' % prefix
+        with open(path, 'w') as fout:
+            for line in collapse(stats):
+                fout.write('%s\n' % line)
+        print('Collapsed stacks written to %s' % path, file=stream)
+    if top:
+        stats.stream = stream
+        stats.sort_stats('cumulative').print_stats(top)
+
+
+def run(func, args, prefix, top=20, stacks=False):
+    '''Call func with args under cProfile, reporting on it however it exits'''
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        report(pstats.Stats(profiler), prefix, top, stacks)
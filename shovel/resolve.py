@@ -0,0 +1,154 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Resolving abbreviated and misspelled task names'''
+
+import bisect
+import difflib
+import heapq
+
+# The key that marks a node of the trie as a full name. Since empty
+# components are never part of a name, it can't collide with one
+END = ''
+
+
+class Unresolved(KeyError):
+    '''A name that doesn't refer to exactly one task or module'''
+    def __init__(self, name, candidates=(), suggestions=()):
+        KeyError.__init__(self, name)
+        self.name = name
+        # The names it abbreviates, if there's more than one
+        self.candidates = list(candidates)
+        # Names similar to it, if it abbreviates nothing
+        self.suggestions = list(suggestions)
+
+    def __str__(self):
+        if self.candidates:
+            return 'Specifier "%s" matches multiple tasks:\n\t%s' % (
+                self.name, '\n\t'.join(self.candidates))
+        message = 'Could not find task "%s"' % self.name
+        if self.suggestions:
+            message += '\nDid you mean one of these?\n\t%s' % (
+                '\n\t'.join(self.suggestions))
+        return message
+
+
+class Trie(object):
+    '''The full names of tasks, organized by their components. Each component
+    of an abbreviation is a prefix of a component of the full name, so that
+    `f.b.h` can refer to `foo.bar.hello`'''
+    def __init__(self, names=()):
+        self.names = sorted(names)
+        self.root = {}
+        # The full names by their last component, for suggestions
+        self.leaves = {}
+        for name in self.names:
+            node = self.root
+            for part in name.split('.'):
+                node = node.setdefault(part, {})
+            node[END] = name
+            self.leaves.setdefault(name.rpartition('.')[2], []).append(name)
+
+    def resolve(self, abbreviation):
+        '''The full names of the tasks and modules an abbreviation refers to.
+        Components that match exactly take precedence over those that only
+        match a prefix, so `foo` refers to `foo` even when `foobar` exists'''
+        nodes = [(self.root, [])]
+        for part in abbreviation.split('.'):
+            following = []
+            for node, path in nodes:
+                if part and part in node:
+                    following.append((node[part], path + [part]))
+                    continue
+                following.extend((child, path + [key])
+                    for key, child in node.items()
+                    if key != END and key.startswith(part))
+            nodes = following
+        return sorted('.'.join(path) for _, path in nodes)
+
+    def complete(self, text, limit=None):
+        '''The full names that text could be completed to. First, the names
+        that start with it, and failing that, those it's an abbreviation of'''
+        lo = bisect.bisect_left(self.names, text)
+        hi = bisect.bisect_left(self.names, text + u'\U0010ffff')
+        found = self.names[lo:hi]
+        if not found:
+            found = set()
+            for prefix in self.resolve(text):
+                lo = bisect.bisect_left(self.names, prefix)
+                for name in self.names[lo:]:
+                    if name != prefix and not name.startswith(prefix + '.'):
+                        break
+                    found.add(name)
+            found = sorted(found)
+        return found[:limit] if limit else found
+
+    def suggest(self, name, limit=5, cutoff=0.6):
+        '''Names that are similar to name, the most similar first. Rather than
+        compare against every name, this follows the branches of the trie that
+        are similar to each component. Only if that turns up too few does it
+        look at all the names whose last component is similar to the last one
+        provided, in case the module was misremembered'''
+        matcher = difflib.SequenceMatcher()
+
+        def similar(part, keys):
+            matcher.set_seq2(part)
+            for key in keys:
+                matcher.set_seq1(key)
+                if key.startswith(part):
+                    yield 1.0, key
+                elif (matcher.real_quick_ratio() >= cutoff and
+                    matcher.quick_ratio() >= cutoff):
+                    ratio = matcher.ratio()
+                    if ratio >= cutoff:
+                        yield ratio, key
+
+        nodes = [self.root]
+        for part in name.split('.'):
+            nodes = [node[key] for node in nodes
+                for _, key in similar(part, node) if key != END]
+        candidates = set(node[END] for node in nodes if END in node)
+
+        last = name.rpartition('.')[2]
+        if len(candidates) < limit:
+            for _, leaf in heapq.nlargest(limit, similar(last, self.leaves)):
+                candidates.update(self.leaves[leaf])
+
+        def score(candidate):
+            return max(
+                difflib.SequenceMatcher(None, name, candidate).ratio(),
+                difflib.SequenceMatcher(
+                    None, last, candidate.rpartition('.')[2]).ratio())
+        return sorted(candidates, key=lambda c: (-score(c), c))[:limit]
+
+
+def resolve(shovel, name):
+    '''The name in shovel that name refers to: either itself, or the one task
+    or module it abbreviates. Otherwise raises Unresolved'''
+    if name in shovel:
+        return name
+    trie = Trie(shovel.keys())
+    found = trie.resolve(name)
+    if len(found) == 1:
+        return found[0]
+    if found:
+        raise Unresolved(name, candidates=found)
+    raise Unresolved(name, suggestions=trie.suggest(name))
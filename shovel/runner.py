@@ -21,65 +21,445 @@
 
 from __future__ import print_function
 
+import os
+import sys
+import time
 import logging
 from .tasks import Shovel, Task
 from .parser import parse
-from . import help, logger
+from .resolve import Trie, Unresolved, resolve
+from . import logger, timing
 
+# Anything not needed to run a task is imported only when it's used, so that
+# invoking shovel stays quick
 
-def run(*args):
-    '''Run the normal shovel functionality'''
-    import os
-    import sys
+
+def roots():
+    '''Yield the paths that tasks are read from, in order, along with the base
+    directory their names are relative to'''
+    for path in [
+        os.path.expanduser('~/.shovel.py'),
+        os.path.expanduser('~/.shovel')]:
+        if os.path.exists(path):  # pragma: no cover
+            yield path, os.path.expanduser('~/')
+
+    shovel_home = os.environ.get('SHOVEL_HOME')
+    if shovel_home and os.path.exists(shovel_home):
+        yield shovel_home, shovel_home
+
+    for path in ['shovel.py', 'shovel']:
+        if os.path.exists(path):
+            yield path, os.getcwd()
+
+
+def load(manifest=None, name=None):
+    '''Read in the tasks from ~/.shovel*, $SHOVEL_HOME and the current
+    directory, in that order. If a name is provided, only the files that could
+    define that name are read'''
+    shovel = Shovel()
+
+    # Read in any tasks that have already been defined
+    shovel.extend(Task.clear())
+
+    for path, base in roots():
+        with timing.phase('root %s' % path):
+            shovel.read(path, base, manifest, name)
+    return shovel
+
+
+def survey():
+    '''Like `load`, but discover tasks without importing any files. Tasks that
+    can only be found with an import are reported, but not included'''
+    from .discover import discover
+    shovel = Shovel()
+    shovel.extend(Task.clear())
+    for path, base in roots():
+        with timing.phase('root %s' % path):
+            tasks, unresolved = discover(path, base)
+        with timing.phase('extend'):
+            shovel.extend(tasks)
+        for found in unresolved:
+            print('%s:%s needs an import to resolve (%s)' % found,
+                file=sys.stderr)
+    return shovel
+
+
+def complete(shovel, name):
+    '''Whether the named task, and every task it depends on however
+    indirectly, are all in shovel'''
+    pending, seen = [name], set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        found = shovel[name] if name in shovel else None
+        if not isinstance(found, Task):
+            return False
+        pending.extend(found.depends)
+    return True
+
+
+def prepare(clargs):
+    '''Read in the tasks needed to do what the parsed arguments ask'''
+    if clargs.method in ('help', 'tasks', 'complete'):
+        # Listing and describing tasks doesn't need anything that only an
+        # import can provide, so those are served from the manifest if we can
+        if clargs.static:
+            return survey()
+        from .manifest import Manifest
+        manifest = None
+        if clargs.cache:
+            try:
+                manifest = Manifest.load()
+            except (IOError, OSError):
+                # Without a cache directory, every task file is imported
+                logger.info('No cache directory to keep a manifest in')
+        shovel = load(manifest)
+        if manifest:
+            manifest.save()
+        return shovel
+
+    # To run a task we only need the files that could define it, but if it's
+    # not in any of those (or it's an abbreviation, or depends on tasks from
+    # other files), fall back to reading everything. The same goes for running
+    # several tasks
+    if clargs.then:
+        return load()
+    shovel = load(name=clargs.method)
+    if not complete(shovel, clargs.method):
+        logger.info('Reading all tasks to find %s' % clargs.method)
+        shovel = load()
+    return shovel
+
+
+def version():
+    '''The installed version of shovel. Finding it can mean scanning all of
+    site-packages, so this is only done when asked for'''
+    try:
+        from importlib.metadata import version as lookup
+    except ImportError:  # pragma: no cover
+        import pkg_resources
+        return pkg_resources.require('shovel')[0].version
+    return lookup('shovel')
+
+
+def arguments():
+    '''The parser for shovel's own arguments'''
     import argparse
-    import pkg_resources
-    # First off, read the arguments
-    parser = argparse.ArgumentParser(prog='shovel', description='Rake, for Python')
+
+    class Version(argparse.Action):
+        '''Print the version, looking it up only when invoked'''
+        def __call__(self, parser, namespace, values, option_string=None):
+            print('Shovel v %s' % version())
+            parser.exit()
+
+    # Shovel's own options come before the task, and everything after it is
+    # passed to the task, even if it looks like one of them
+    parser = argparse.ArgumentParser(prog='shovel',
+        description='Rake, for Python', allow_abbrev=False)
 
     parser.add_argument('method', help='The task to run')
+    parser.add_argument('remaining', nargs=argparse.REMAINDER,
+        help='Arguments for the task')
     parser.add_argument('--verbose', dest='verbose', action='store_true',
         help='Be extra talkative')
     parser.add_argument('--dry-run', dest='dryRun', action='store_true',
         help='Show the args that would be used')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+        help='Import every task file when listing or describing tasks')
+    parser.add_argument('--static', dest='static', action='store_true',
+        help='List or describe tasks without importing any task files')
+
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+        help='Run up to this many tasks at once, when they don\'t depend on one another')
+    parser.add_argument('--processes', dest='processes', action='store_true',
+        help='Run tasks at once in processes rather than threads')
+
+    parser.add_argument('--batch', dest='batch', default=None,
+        help='Run the task once for each line of this file (or - for stdin)')
+    parser.add_argument('--ordered', dest='ordered', action='store_true',
+        help='Write --batch results in the order of the lines, not as they finish')
+
+    parser.add_argument('--no-skip', dest='force', action='store_true',
+        help='Run tasks even if their outputs are up to date')
+    parser.add_argument('--explain-skip', dest='explain', action='store_true',
+        help='Explain why each task is or isn\'t run')
+
+    parser.add_argument('--isolate', dest='isolate', action='store_true',
+        help='Run each task in a child process of its own')
+    parser.add_argument('--isolate-timeout', dest='timeout', type=float,
+        default=None,
+        help='Isolate tasks, and kill any that take longer than this many seconds')
+    parser.add_argument('--isolate-max-memory', dest='max_memory',
+        default=None,
+        help='Isolate tasks, and limit each to this much memory, like 512M')
 
-    ver = pkg_resources.require('shovel')[0].version
-    parser.add_argument('--version', action='version',
-        version='Shovel v %s' % ver, help='print the version of Shovel.')
+    parser.add_argument('--profile-phases', dest='profile',
+        action='store_true',
+        help='Profile reading in tasks and running them, each on its own')
+    parser.add_argument('--profile-prefix', dest='profile_prefix',
+        default='shovel', help='Write profiles to PREFIX.load.pstats and '
+        'PREFIX.run.pstats')
+    parser.add_argument('--profile-top', dest='profile_top', type=int,
+        default=20, help='Print this many of the most expensive functions')
+    parser.add_argument('--profile-stacks', dest='profile_stacks',
+        action='store_true',
+        help='Also write collapsed stacks, for flame graphs, to PREFIX.*.folded')
 
-    # Parse our arguments
-    if args:
-        clargs, remaining = parser.parse_known_args(args=args)
-    else:  # pragma: no cover
-        clargs, remaining = parser.parse_known_args()
+    parser.add_argument('--timings', dest='timings', action='store_const',
+        const='table', help='Print how long each phase took, or with '
+        '--timings=json, print it as JSON')
+    parser.add_argument('--timings=json', dest='timings', action='store_const',
+        const='json', help=argparse.SUPPRESS)
 
+    parser.add_argument('--watch', dest='watch', action='store_true',
+        help='Run the task again whenever task files change')
+    parser.add_argument('--client', dest='client', action='store_true',
+        help='Have a running `shovel daemon` do this, if there is one')
+    parser.add_argument('--socket', dest='socket', default=None,
+        help='The socket a `shovel daemon` listens on')
+    parser.add_argument('--version', action=Version, nargs=0,
+        help='print the version of Shovel.')
+    return parser
+
+
+def command(argv):
+    '''Parse shovel's own arguments from argv. Further tasks to run can follow,
+    separated by `--`, as in `shovel a 1 2 -- b --x 3 -- c`, and are kept as
+    a list of (method, remaining) in `then`'''
+    groups = [[]]
+    for arg in argv:
+        if arg == '--':
+            groups.append([])
+        else:
+            groups[-1].append(arg)
+    clargs = arguments().parse_args(args=groups[0])
+    clargs.then = [(group[0], group[1:]) for group in groups[1:] if group]
+    return clargs, clargs.remaining
+
+
+def status(exc):
+    '''The exit status that a SystemExit stands for. As with python itself, a
+    message in place of a status is printed, and stands for 1'''
+    if exc.code is None or isinstance(exc.code, int):
+        return exc.code or 0
+    print(exc.code, file=sys.stderr)
+    return 1
+
+
+def run(*args):
+    '''Run the normal shovel functionality, keeping track of how long each
+    phase of it takes'''
+    argv = list(args) or sys.argv[1:]
+    with timing.recording() as timings:
+        # First off, read the arguments
+        with timings.phase('parse'):
+            clargs, remaining = command(argv)
+        try:
+            main(clargs, remaining, argv)
+        finally:
+            if clargs.timings:
+                timings.report(clargs.timings)
+
+
+def main(clargs, remaining, argv):
+    '''Do what the parsed arguments ask'''
     if clargs.verbose:
         logger.setLevel(logging.DEBUG)
 
+    if clargs.method == 'daemon':
+        from . import daemon
+        daemon.serve(clargs.socket)
+        return
+
+    if clargs.method == 'cache':
+        memos(remaining)
+        return
+
+    if clargs.method == 'bench':
+        benchmark(clargs, remaining)
+        return
+
+    if clargs.watch:
+        watch(clargs, remaining)
+        return
+
+    if clargs.client:
+        from . import daemon
+        code = daemon.forward(argv, clargs.socket)
+        if code is not None:
+            if code:
+                exit(code)
+            return
+        logger.info('No daemon is running, so running locally')
+
+    execute(clargs, remaining)
+
+
+def memos(remaining):
+    '''Describe (`shovel cache stats`) or prune (`shovel cache prune`) the
+    return values that tasks have kept'''
+    from .memo import memo
+    store = memo()
+    action = remaining[0] if remaining else 'stats'
+    if action == 'stats':
+        stats = store.stats()
+        print('Path:    %s' % stats['path'])
+        print('Entries: %i' % stats['entries'])
+        print('Size:    %i bytes (of %i)' % (stats['bytes'], stats['limit']))
+        print('Hits:    %i' % stats['hits'])
+        print('Misses:  %i' % stats['misses'])
+    elif action == 'prune':
+        print('Removed %i results' % store.prune(expired=True))
+    else:
+        print('Unknown cache command "%s"; try stats or prune' % action,
+            file=sys.stderr)
+        exit(1)
+
+
+def benchmarking():
+    '''The parser for the options of `shovel bench`, which only it takes'''
+    import argparse
+    parser = argparse.ArgumentParser(prog='shovel bench',
+        description='Time a task, and compare it to its baseline',
+        allow_abbrev=False)
+    parser.add_argument('method', help='The task to time')
+    parser.add_argument('remaining', nargs=argparse.REMAINDER,
+        help='Arguments for the task')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=20,
+        help='How many times to time the task')
+    parser.add_argument('--warmup', dest='warmup', type=int, default=3,
+        help='How many times to run the task first')
+    parser.add_argument('--gc', dest='gc', action='store_true',
+        help='Leave garbage collection on while timing')
+    parser.add_argument('--threshold', dest='threshold', type=float,
+        default=0.1, help='Fail if the median is this much slower than the '
+        'baseline')
+    parser.add_argument('--baseline', dest='baseline', action='store_true',
+        help='Make this run the new baseline')
+    parser.add_argument('--history', dest='history', default=None,
+        help='Where to keep the results')
+    return parser
+
+
+def benchmark(clargs, remaining):
+    '''Time repeated calls of a task (`shovel bench foo.bar 1 2`), and compare
+    them to its baseline. Exits if it's regressed'''
+    from . import bench
+    parser = benchmarking()
+    options = parser.parse_args(remaining)
+    remaining = options.remaining
+    if options.repeat < 1:
+        parser.error('--repeat must be at least 1')
+    clargs.method = options.method
     args, kwargs = parse(remaining)
+    shovel = phase(clargs, 'load', prepare, clargs)
+    task = lookup(shovel, clargs.method, args, kwargs)
 
-    # Import all of the files we want
-    shovel = Shovel()
+    name = bench.key(task, args, kwargs)
+    with timing.phase('bench %s' % task.fullname):
+        try:
+            samples = bench.measure(task, args, kwargs, options.repeat,
+                options.warmup, options.gc)
+        except Exception:
+            logger.exception('Failed to run task %s' % task.name)
+            exit(1)
+    stats = bench.summarize(samples)
 
-    # Read in any tasks that have already been defined
-    shovel.extend(Task.clear())
+    history = bench.History(options.history)
+    baseline = history.baseline(name)
+    lines, regressed = bench.report(
+        task.fullname, stats, baseline, options.threshold)
+    for line in lines:
+        print(line)
+    history.append({
+        'key': name,
+        'task': task.fullname,
+        'time': time.time(),
+        'stats': stats,
+        'samples': samples,
+        'baseline': options.baseline or baseline is None
+    })
+    # A run recorded as the new baseline replaces the one it's compared to
+    if regressed and not options.baseline:
+        exit(1)
 
-    for path in [
-        os.path.expanduser('~/.shovel.py'),
-        os.path.expanduser('~/.shovel')]:
-        if os.path.exists(path):  # pragma: no cover
-            shovel.read(path, os.path.expanduser('~/'))
 
-    shovel_home = os.environ.get('SHOVEL_HOME')
-    if shovel_home and os.path.exists(shovel_home):
-        shovel.read(shovel_home, shovel_home)
+def watch(clargs, remaining):
+    '''Run a task, and then run it again whenever task files change'''
+    import traceback
+    from .watch import Watcher
+    shovel = load()
+    watcher = Watcher(shovel, roots())
+    try:
+        while True:
+            try:
+                execute(clargs, remaining, shovel)
+            except (Exception, SystemExit):
+                traceback.print_exc()
+            while not watcher.wait():
+                pass
+            print('Task files changed, running %s again' % clargs.method,
+                file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def execute(clargs, remaining, shovel=None):
+    '''Do what the parsed arguments ask, with the tasks in the provided shovel
+    or, if there isn't one, with the tasks read in for the occasion'''
+    if not (clargs.isolate or clargs.timeout is not None or clargs.max_memory):
+        return perform(clargs, remaining, shovel)
+
+    # Every task that's run, however it's run, is isolated if asked
+    from . import isolate
+    try:
+        limits = isolate.configure(True, clargs.timeout,
+            isolate.size(clargs.max_memory) if clargs.max_memory else None)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        exit(1)
+    with limits:
+        return perform(clargs, remaining, shovel)
+
+
+def perform(clargs, remaining, shovel=None):
+    '''Do what the parsed arguments ask, as `execute`. Reading in the tasks
+    and then running them are separate phases, so that they're profiled on
+    their own'''
+    args, kwargs = parse(remaining)
+    if shovel is None:
+        shovel = phase(clargs, 'load', prepare, clargs)
+    phase(clargs, 'run', dispatch, clargs, remaining, args, kwargs, shovel)
 
-    for path in ['shovel.py', 'shovel']:
-        if os.path.exists(path):
-            shovel.read(path)
 
+def phase(clargs, name, func, *args):
+    '''Do one phase of a command, timing it, and profiling it if asked'''
+    with timing.phase(name):
+        if not clargs.profile:
+            return func(*args)
+        from . import profiling
+        return profiling.run(func, args, '%s.%s' % (clargs.profile_prefix,
+            name), top=clargs.profile_top, stacks=clargs.profile_stacks)
+
+
+def dispatch(clargs, remaining, args, kwargs, shovel):
+    '''Do what the parsed arguments ask, with the tasks that have been read'''
     # If it's help we're looking for, look no further
     if clargs.method == 'help':
-        print(help.shovel_help(shovel, *args, **kwargs))
+        from . import help
+        try:
+            print(help.shovel_help(shovel, *args, **kwargs))
+        except Unresolved as exc:
+            print(exc, file=sys.stderr)
+            exit(2 if exc.candidates else 1)
+    elif clargs.method == 'complete':
+        # The names that the (possibly abbreviated) text could complete to
+        for name in Trie(shovel.keys()).complete(args[0] if args else ''):
+            print(name)
     elif clargs.method == 'tasks':
         tasks = list(v for _, v in shovel.items())
         if not tasks:
@@ -102,22 +482,103 @@ def run(*args):
                 max(len(name) for name in names), width)
             for name, doc in zip(names, docs):
                 print(format % (name, doc))
+    elif clargs.method and clargs.batch:
+        fanout(shovel, clargs, args, kwargs)
     elif clargs.method:
-        # Try to get the first command provided
-        try:
-            tasks = shovel.tasks(clargs.method)
-        except KeyError:
-            print('Could not find task "%s"' % clargs.method, file=sys.stderr)
-            exit(1)
+        # Find every task asked for before running any of them
+        invocations = []
+        for method, tokens in [(clargs.method, remaining)] + clargs.then:
+            args, kwargs = parse(tokens)
+            invocations.append((lookup(shovel, method, args, kwargs), args, kwargs))
 
-        if len(tasks) > 1:
-            print('Specifier "%s" matches multiple tasks:' % clargs.method, file=sys.stderr)
-            for task in tasks:
-                print('\t%s' % task.fullname, file=sys.stderr)
-            exit(2)
+        task, args, kwargs = invocations[0]
+        if (len(invocations) > 1 or task.depends or task.inputs or
+            task.outputs):
+            schedule(shovel, invocations, clargs)
+            return
 
-        task = tasks[0]
         if clargs.dryRun:
             print(task.dry(*args, **kwargs))
         else:
-            task(*args, **kwargs)
+            with timing.phase('task %s' % task.fullname):
+                task(*args, **kwargs)
+
+
+def schedule(shovel, invocations, clargs):
+    '''Run a list of (task, args, kwargs) in order, along with the tasks they
+    depend on, skipping any that are up to date. Exits with the status of the
+    first that fails'''
+    from .schedule import Schedule
+    plan = Schedule(shovel, force=clargs.force, explain=clargs.explain)
+    try:
+        for task, args, kwargs in invocations:
+            plan.add(task, args, kwargs)
+    except (KeyError, ValueError) as exc:
+        print(exc.args[0], file=sys.stderr)
+        exit(1)
+
+    # Tasks with inputs or outputs are skipped if they're up to date
+    if any(n.task.inputs or n.task.outputs for n in plan.nodes):
+        from .state import State
+        plan.state = State.load()
+    code = plan.run(clargs.jobs or 1, clargs.processes, clargs.dryRun)
+    if code:
+        exit(code)
+
+
+def fanout(shovel, clargs, args, kwargs):
+    '''Run a task once for each line of the --batch file, with the provided
+    args and kwargs along with those on the line. Exits if any line doesn't
+    fit the task, or if any of the invocations fail'''
+    from . import batch
+    task = lookup(shovel, clargs.method)
+    try:
+        if clargs.batch == '-':
+            invocations = list(batch.read(sys.stdin, args, kwargs))
+        else:
+            with open(clargs.batch) as fin:
+                invocations = list(batch.read(fin, args, kwargs))
+        batch.bind(task, invocations)
+    except (IOError, OSError, ValueError) as exc:
+        print(exc, file=sys.stderr)
+        exit(1)
+
+    if clargs.dryRun:
+        for _, args, kwargs in invocations:
+            print(task.dry(*args, **kwargs))
+        return
+
+    failed = batch.run(task, invocations, clargs.jobs, clargs.ordered)
+    if failed:
+        print('%i of %i invocations failed' % (failed, len(invocations)),
+            file=sys.stderr)
+        exit(1)
+
+
+def lookup(shovel, method, args=None, kwargs=None):
+    '''Find the one task that method refers to, and make sure it can be invoked
+    with the provided arguments (if any). Exits if not'''
+    # The name may be abbreviated
+    try:
+        with timing.phase('resolve %s' % method):
+            tasks = shovel.tasks(resolve(shovel, method))
+    except Unresolved as exc:
+        print(exc, file=sys.stderr)
+        exit(2 if exc.candidates else 1)
+
+    if len(tasks) > 1:
+        print('Specifier "%s" matches multiple tasks:' % method, file=sys.stderr)
+        for task in tasks:
+            print('\t%s' % task.fullname, file=sys.stderr)
+        exit(2)
+
+    task = tasks[0]
+    if args is None and kwargs is None:
+        return task
+    try:
+        task.args.get(*(args or ()), **(kwargs or {}))
+    except TypeError as exc:
+        print('%s: %s' % (task.fullname, exc), file=sys.stderr)
+        print('Usage: %s%s' % (task.fullname, task.args), file=sys.stderr)
+        exit(1)
+    return task
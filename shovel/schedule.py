@@ -0,0 +1,263 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Running tasks along with the tasks they depend on, in parallel if asked'''
+
+from __future__ import print_function
+
+import sys
+import time
+
+from shovel import logger, timing
+from shovel.compat import copy_context, forked
+from shovel.runner import status
+from shovel.tasks import Task
+
+# The shovel that tasks are looked up in by a pool of processes, which they
+# inherit when they're forked
+_shovel = None
+
+
+class Node(object):
+    '''An invocation of a task, and the invocations it has to wait for'''
+    def __init__(self, task, args=(), kwargs=None):
+        self.task = task
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.after = []
+        # What the task and its files looked like before it ran
+        self.snapshot = None
+
+    @property
+    def fullname(self):
+        return self.task.fullname
+
+
+class Schedule(object):
+    '''The tasks to run, each after the tasks it depends on. Each dependency is
+    only run once, however many tasks depend on it. Run one at a time, the
+    tasks that were asked for are run in the order they were asked for. Run
+    several at a time, any that don't depend on one another may overlap, and
+    asynchronous tasks share one event loop.
+
+    With a state, tasks whose outputs are current are skipped (unless forced),
+    and those that succeed are recorded. If asked to explain, the reasons that
+    each task does or doesn't run are reported'''
+    def __init__(self, shovel, state=None, force=False, explain=False):
+        self.shovel = shovel
+        self.state = state
+        self.force = force
+        self.explain = explain
+        self.nodes = []
+        # Dependencies, by full name
+        self._depends = {}
+        # The nodes of tasks that were asked for
+        self._asked = set()
+
+    def add(self, task, args=(), kwargs=None):
+        '''Add an invocation of a task, after those already added. Raises
+        KeyError if it depends on anything that isn't a task, and ValueError if
+        its dependencies are circular'''
+        node = Node(task, args, kwargs)
+        if not args and not kwargs:
+            # Without arguments, it's the same as running it as a dependency,
+            # which may have already been scheduled to run earlier. Tasks
+            # that are asked for more than once are run each time, though
+            existing = self._depends.get(task.fullname)
+            if existing is not None and existing not in self._asked:
+                return existing
+            self._depends[task.fullname] = node
+        self._asked.add(node)
+        return self._add(node, ())
+
+    def _add(self, node, path):
+        '''Add a node along with all of the dependencies of its task'''
+        path = path + (node.fullname,)
+        for name in node.task.depends:
+            if name in path:
+                raise ValueError('Circular dependency: %s' % ' -> '.join(
+                    path[path.index(name):] + (name,)))
+            dependency = self._depends.get(name)
+            if dependency is None:
+                found = self.shovel[name] if name in self.shovel else None
+                if not isinstance(found, Task):
+                    raise KeyError('%s depends on %s, which is not a task' % (
+                        node.fullname, name))
+                dependency = self._add(Node(found), path)
+                self._depends[name] = dependency
+            node.after.append(dependency)
+        self.nodes.append(node)
+        return node
+
+    def run(self, jobs=1, processes=False, dry=False):
+        '''Run everything, up to `jobs` at a time, on threads or (if asked) in
+        processes. Each task's outcome is reported on stderr. Stops starting
+        tasks at the first failure, and returns its exit status'''
+        if dry:
+            for node in self.nodes:
+                print(node.task.dry(*node.args, **node.kwargs))
+            return 0
+
+        try:
+            if jobs <= 1:
+                return self._sequentially()
+            return self._concurrently(jobs, processes)
+        finally:
+            if self.state is not None:
+                self.state.save()
+
+    def _current(self, node):
+        '''Whether a task is up to date, and so can be skipped'''
+        if self.state is None:
+            return False
+        node.snapshot = self.state.snapshot(node.task, node.args, node.kwargs)
+        reasons = self.state.changes(node.task, node.snapshot)
+        if self.force and not reasons:
+            reasons = ['it was forced']
+        if reasons:
+            if self.explain:
+                print('%s runs because %s' % (
+                    node.fullname, '; '.join(reasons)), file=sys.stderr)
+            return False
+        print('%s is up to date' % node.fullname, file=sys.stderr)
+        return True
+
+    def _succeeded(self, node):
+        '''Remember what a task looked like when it succeeded'''
+        if self.state is not None:
+            self.state.record(node.task, node.snapshot)
+
+    def _report(self, node, code, elapsed):
+        '''Report how running a task went'''
+        if code:
+            print('%s failed (%s) in %.3fs' % (node.fullname, code, elapsed),
+                file=sys.stderr)
+        else:
+            self._succeeded(node)
+            print('%s succeeded in %.3fs' % (node.fullname, elapsed),
+                file=sys.stderr)
+
+    def _skipped(self, done):
+        '''Report the tasks that never ran'''
+        for node in self.nodes:
+            if node not in done:
+                print('%s skipped' % node.fullname, file=sys.stderr)
+
+    def _sequentially(self):
+        '''Run each task in turn'''
+        done = set()
+        for node in self.nodes:
+            if self._current(node):
+                done.add(node)
+                continue
+            start = time.time()
+            code = invoke(node.task, node.args, node.kwargs)
+            self._report(node, code, time.time() - start)
+            done.add(node)
+            if code:
+                self._skipped(done)
+                return code
+        return 0
+
+    def _concurrently(self, jobs, processes):
+        '''Run tasks as soon as everything they're after has succeeded'''
+        from concurrent import futures
+        global _shovel
+        if processes:
+            _shovel = self.shovel
+            pool = forked(jobs)
+        else:
+            pool = futures.ThreadPoolExecutor(jobs)
+
+        runner = None
+
+        pending = list(self.nodes)
+        running, done, failure = {}, set(), 0
+        try:
+            while pending or running:
+                # Skipping a task can make the tasks after it ready, too
+                ready = not failure
+                while ready:
+                    ready = [n for n in pending
+                        if all(a in done for a in n.after)]
+                    for node in ready:
+                        pending.remove(node)
+                        if self._current(node):
+                            done.add(node)
+                        elif processes:
+                            future = pool.submit(
+                                _invoke, node.fullname, node.args, node.kwargs)
+                            running[future] = (node, time.time())
+                        elif node.task.asynchronous:
+                            # Asynchronous tasks share one loop, rather than
+                            # each taking up a thread
+                            from shovel import aio
+                            if runner is None:
+                                runner = aio.Runner(jobs)
+                            future = runner.submit(
+                                aio.status, node.task, node.args, node.kwargs)
+                            running[future] = (node, time.time())
+                        else:
+                            # Threads start with an empty context, so copy
+                            # ours for output to go wherever it's routed
+                            future = pool.submit(
+                                copy_context().run,
+                                invoke, node.task, node.args, node.kwargs)
+                            running[future] = (node, time.time())
+                if not running:
+                    break
+
+                finished, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED)
+                for future in finished:
+                    node, start = running.pop(future)
+                    code = future.result()
+                    self._report(node, code, time.time() - start)
+                    done.add(node)
+                    failure = failure or code
+        finally:
+            pool.shutdown()
+            if runner is not None:
+                runner.shutdown()
+            _shovel = None
+
+        if failure:
+            self._skipped(done)
+        return failure
+
+
+def invoke(task, args, kwargs):
+    '''Run a task, and return its exit status'''
+    try:
+        with timing.phase('task %s' % task.fullname):
+            task(*args, **kwargs)
+    except SystemExit as exc:
+        return status(exc)
+    except Exception:
+        # The task has already logged what went wrong
+        return 1
+    return 0
+
+
+def _invoke(fullname, args, kwargs):
+    '''Run a task in a process of the pool, finding it by its full name'''
+    logger.debug('Running %s in process' % fullname)
+    return invoke(_shovel[fullname], args, kwargs)
@@ -0,0 +1,172 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''A record of tasks' last successful runs, for skipping those that are current'''
+
+import os
+import glob
+import json
+import hashlib
+import threading
+
+# Internal imports
+from shovel import logger
+from shovel import cache
+
+
+class State(object):
+    '''What each task with inputs or outputs looked like when it last
+    succeeded: the hash of its source, its arguments, the hashes of its inputs
+    and the stat of its outputs. If none of that has changed, and its outputs
+    still exist, it doesn't need to run again'''
+    # Bumped whenever the format of the stored state changes
+    version = 1
+
+    @classmethod
+    def load(cls, path=None):
+        '''Read the state for the current directory (or at path)'''
+        if path is None:
+            path = cache.local('state', '.json')
+        try:
+            with open(path) as fin:
+                data = json.load(fin)
+            if data.get('version') == cls.version:
+                return cls(path, data['tasks'], data['files'])
+        except (IOError, OSError, ValueError, KeyError):
+            logger.info('No usable state at %s' % path)
+        return cls(path)
+
+    def __init__(self, path, tasks=None, files=None):
+        self.path = path
+        self.tasks = tasks or {}
+        # The hashes of files we've read, along with their stats, so that
+        # files that haven't been touched needn't be read again
+        self.files = files or {}
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def stat(path):
+        '''The parts of a file's stat that change when it's written'''
+        stat = os.stat(path)
+        return [getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size]
+
+    def digest(self, path):
+        '''The hash of a file's contents'''
+        absolute = os.path.abspath(path)
+        stat = self.stat(absolute)
+        with self.lock:
+            entry = self.files.get(absolute)
+            if entry and entry['stat'] == stat:
+                return entry['hash']
+        hasher = hashlib.sha1()
+        with open(absolute, 'rb') as fin:
+            for chunk in iter(lambda: fin.read(1 << 16), b''):
+                hasher.update(chunk)
+        with self.lock:
+            self.files[absolute] = {'stat': stat, 'hash': hasher.hexdigest()}
+            self.dirty = True
+        return hasher.hexdigest()
+
+    @staticmethod
+    def expand(patterns):
+        '''The files that match any of the globs, and the globs that match
+        nothing'''
+        found, missing = set(), []
+        for pattern in patterns:
+            matches = [p for p in glob.glob(pattern, recursive=True)
+                if os.path.isfile(p)]
+            found.update(matches)
+            if not matches:
+                missing.append(pattern)
+        return sorted(found), missing
+
+    def snapshot(self, task, args=(), kwargs=None):
+        '''What a task and its files look like right now'''
+        source = task.source or task.file
+        inputs, _ = self.expand(task.inputs)
+        outputs, missing = self.expand(task.outputs)
+        return {
+            'source': self.digest(source) if os.path.isfile(source) else None,
+            'args': json.dumps(
+                [list(args), kwargs or {}], sort_keys=True, default=str),
+            'inputs': dict((path, self.digest(path)) for path in inputs),
+            'outputs': dict((path, self.stat(path)) for path in outputs),
+            'missing': missing
+        }
+
+    def changes(self, task, snapshot):
+        '''The reasons a task has to run, given its snapshot. There are none
+        if it's up to date'''
+        if not task.inputs and not task.outputs:
+            return ['it has no inputs or outputs']
+        if snapshot['missing']:
+            return ['%s matches nothing' % p for p in snapshot['missing']]
+        with self.lock:
+            last = self.tasks.get(task.fullname)
+        if last is None:
+            return ['it has not succeeded before']
+
+        reasons = []
+        if last['source'] != snapshot['source']:
+            reasons.append('its source changed')
+        if last['args'] != snapshot['args']:
+            reasons.append('its arguments changed')
+        for kind in ('inputs', 'outputs'):
+            before, after = last[kind], snapshot[kind]
+            for path in sorted(set(before) | set(after)):
+                if path not in before:
+                    reasons.append('%s was added' % path)
+                elif path not in after:
+                    reasons.append('%s was removed' % path)
+                elif before[path] != after[path]:
+                    reasons.append('%s changed' % path)
+        return reasons
+
+    def record(self, task, snapshot):
+        '''Remember a task's snapshot from before it succeeded. Its outputs are
+        looked at afresh, since it will have written them'''
+        if not task.inputs and not task.outputs:
+            return
+        outputs, _ = self.expand(task.outputs)
+        entry = dict(snapshot,
+            outputs=dict((path, self.stat(path)) for path in outputs))
+        del entry['missing']
+        with self.lock:
+            self.tasks[task.fullname] = entry
+            self.dirty = True
+
+    def save(self):
+        '''Write the state back out if anything has changed'''
+        for absolute in [f for f in self.files if not os.path.exists(f)]:
+            del self.files[absolute]
+            self.dirty = True
+        if not self.dirty:
+            return
+        try:
+            cache.write(self.path, json.dumps({
+                'version': self.version,
+                'tasks': self.tasks,
+                'files': self.files
+            }))
+            self.dirty = False
+        except (IOError, OSError):
+            logger.exception('Unable to write state %s' % self.path)
@@ -22,24 +22,115 @@
 '''Task helper'''
 
 import os
-import imp
-import sys
+import copy
+import functools
 import inspect
-from collections import defaultdict
+import bisect
+from collections import OrderedDict
+from contextlib import contextmanager
 
 # Internal imports
 from shovel import logger
-from shovel.args import Args
-
-
-def task(func):
-    '''Register this task with shovel, but return the original function'''
-    Task.make(func)
-    return func
+from shovel.args import Args, ArgSpec, annotation, getspec
+from shovel.walk import walk
+from shovel import loader
+from shovel import timing
+
+
+def modules(relative):
+    '''The module names that a relative path contributes to the full names of
+    the tasks defined in (or beneath) it'''
+    # If it's either in shovel.py, or folder/__init__.py, then we
+    # should consider it as being at one level above that file
+    return [part.strip('.') for part in relative.split(os.path.sep) if part
+        not in ('shovel', '.shovel', '__init__', '.', '..', '')]
+
+
+def routes(path, base, name, directory=False):
+    '''Whether the file (or directory) at path could hold tasks that `name`
+    refers to. That is a task called `name`, or any task beneath it'''
+    target = name.split('.')
+    if directory:
+        found = modules(os.path.relpath(path, base))
+        # Anything in this directory extends its module names, so it's only
+        # worth visiting if it's on the way to the name, or beneath it
+        length = min(len(found), len(target))
+        return found[:length] == target[:length]
+    found = modules(os.path.relpath(path, base).rpartition('.py')[0])
+    return found == target[:-1] or found[:len(target)] == target
+
+
+def files(path, base, name=None):
+    '''Yield the absolute paths of the task files at path, which may be either
+    a file or a directory. If a name is provided, only yield the files that could
+    define it'''
+    absolute = os.path.abspath(path)
+    if os.path.isfile(absolute):
+        if not name or routes(absolute, base, name):
+            yield absolute
+    elif os.path.isdir(absolute):
+        prune = (lambda child, directory:
+            not routes(child, base, name, directory)) if name else None
+        for child in walk(absolute, base, prune):
+            yield child
+
+
+@contextmanager
+def measured(name):
+    '''Measure the task run in the block, if metrics are being sent anywhere.
+    If they aren't, the metrics module isn't so much as imported'''
+    if not (os.environ.get('SHOVEL_METRICS_TEXTFILE') or
+        os.environ.get('SHOVEL_STATSD')):
+        yield
+        return
+    from shovel import metrics
+    with metrics.measure(name):
+        yield
+
+
+def task(func=None, depends=None, inputs=None, outputs=None, cache=None,
+    isolate=False, timeout=None, max_memory=None):
+    '''Register this task with shovel, but return the original function. It's
+    used either bare, as `@task`, or with options, as in
+
+        @task(depends=['build.compile'], inputs=['src/**/*.c'],
+            outputs=['build/app'])
+
+    where `depends` are the full names of tasks that must be run first, and
+    `inputs` and `outputs` are globs of the files it reads and writes. A task
+    with outputs is skipped if they exist and nothing has changed since it
+    last succeeded.
+
+    With `cache`, return values are kept on disk for that many seconds (or
+    indefinitely, if it's True), keyed by the arguments and the task's
+    source. Calls to the function that's returned use them, too.
+
+    With `isolate`, the task is run in a child process of its own. It's killed
+    if it takes more than `timeout` seconds, and it can't use more than
+    `max_memory` (a number of bytes, or a string like `512M`). Either of those
+    implies `isolate`'''
+    if func is None:
+        return lambda func: task(func, depends, inputs, outputs, cache,
+            isolate, timeout, max_memory)
+    made = Task.make(func, depends, inputs, outputs, cache,
+        isolate, timeout, max_memory)
+    if made is None or cache is None or isinstance(func, type):
+        return func
+
+    @functools.wraps(func)
+    def memoized(*args, **kwargs):
+        from shovel.memo import memo
+        return memo().call(made, args, kwargs)
+    return memoized
 
 
 class Shovel(object):
     '''A collection of tasks contained in a file or folder'''
+    # All the tasks are kept in a flat index of full name to task, along with
+    # a sorted list of those names. That way, finding a task is a lookup and
+    # finding all the tasks in a module is a slice of the sorted names. A
+    # module (like `foo` in `foo.bar`) is a view onto the same index, limited
+    # to the names with its prefix.
     @classmethod
     def load(cls, path, base=None):
         '''Either load a path and return a shovel object or return None'''
@@ -47,68 +138,209 @@ class Shovel(object):
         obj.read(path, base)
         return obj
 
-    def __init__(self, tasks=None):
-        self.overrides = None
-        self._tasks = tasks or []
-        self.map = defaultdict(Shovel)
+    def __init__(self, tasks=None, prefix=''):
+        self._tasks = []
+        self._index = {}
+        self._keys = []
+        self._prefix = prefix
+        # When a module replaces a task (like `foo.bar` replacing `foo`), the
+        # task it overrides is kept here until the module is empty again
+        self._shadowed = {}
+        # The base and tasks of each file that's been read, in order
+        self.sources = OrderedDict()
         self.extend(tasks or [])
 
+    def _view(self, prefix):
+        '''A shovel of the tasks in a module, sharing this shovel's index'''
+        view = Shovel.__new__(Shovel)
+        view.__dict__.update(self.__dict__)
+        view._prefix = prefix
+        return view
+
+    @property
+    def overrides(self):
+        '''The task this module overrides, if any'''
+        return self._shadowed.get(self._prefix)
+
+    @property
+    def map(self):
+        '''A dictionary of the tasks and modules immediately in this shovel'''
+        result = {}
+        start = len(self._prefix) + 1 if self._prefix else 0
+        lo, hi = self._range(self._prefix)
+        for key in self._keys[lo:hi]:
+            child, dot, _ = key[start:].partition('.')
+            if child not in result:
+                if dot:
+                    result[child] = self._view(key[:start] + child)
+                else:
+                    result[child] = self._index[key]
+        return result
+
+    def _full(self, key):
+        '''The full name of a key relative to this shovel'''
+        return self._prefix + '.' + key if self._prefix else key
+
+    def _range(self, prefix):
+        '''The slice of sorted names that are beneath a prefix'''
+        if not prefix:
+            return 0, len(self._keys)
+        # Every name that starts with 'foo.' sorts between 'foo.' and 'foo/'
+        return (bisect.bisect_left(self._keys, prefix + '.'),
+            bisect.bisect_left(self._keys, prefix + '/'))
+
+    def _insert(self, name, task):
+        '''Put a task in the index'''
+        if name not in self._index:
+            bisect.insort(self._keys, name)
+        self._index[name] = task
+
+    def _remove(self, name):
+        '''Take a task out of the index'''
+        del self._index[name]
+        del self._keys[bisect.bisect_left(self._keys, name)]
+
     def extend(self, tasks):
         '''Add tasks to this particular shovel'''
         self._tasks.extend(tasks)
         for task in tasks:
-            # We'll now go through all of our tasks and group them into
-            # sub-shovels
-            current = self.map
-            modules = task.fullname.split('.')
-            for module in modules[:-1]:
-                if not isinstance(current[module], Shovel):
-                    logger.warn('Overriding task %s with a module' %
-                        current[module].file)
-                    shovel = Shovel()
-                    shovel.overrides = current[module]
-                    current[module] = shovel
-                current = current[module].map
-
-            # Now we'll put the task in this particular sub-shovel
-            name = modules[-1]
-            if name in current:
-                logger.warn('Overriding %s with %s' % (
-                    '.'.join(modules), task.file))
-                task.overrides = current[name]
-            current[name] = task
-
-    def read(self, path, base=None):
-        '''Import some tasks'''
+            self._add(task)
+
+    def _add(self, task, ranks=None):
+        '''Put a task in its place in the index. Normally it overrides whatever
+        is already there, but if `ranks` (of each source file) is provided, it
+        only overrides tasks from files that were read before its own'''
+        name = task.fullname
+        # Tasks with the name of any of the modules this is in are overridden
+        # by those modules
+        modules = name.split('.')
+        for index in range(1, len(modules)):
+            module = '.'.join(modules[:index])
+            if module in self._index:
+                logger.warn('Overriding task %s with a module' %
+                    self._index[module].file)
+                self._shadowed[module] = self._index[module]
+                self._remove(module)
+
+        # If this has the name of a module, it overrides that whole module
+        below = self._index.get(name)
+        lo, hi = self._range(name)
+        if lo < hi:
+            below = Shovel(prefix=name)
+            for key in self._keys[lo:hi]:
+                below._insert(key, self._index.pop(key))
+            for key in list(self._shadowed):
+                if key == name or key.startswith(name + '.'):
+                    below._shadowed[key] = self._shadowed.pop(key)
+            del self._keys[lo:hi]
+
+        # Now we'll put the task in its place, beneath any tasks that should
+        # override it
+        above = None
+        if ranks is not None:
+            rank = ranks.get(task.source, -1)
+            while (isinstance(below, Task) and
+                ranks.get(below.source, -1) > rank):
+                above, below = below, below.overrides
+        if below is not None:
+            logger.warn('Overriding %s with %s' % (name, task.file))
+        task.overrides = below
+        if above is None:
+            self._insert(name, task)
+        else:
+            above.overrides = task
+
+    def discard(self, tasks):
+        '''Remove tasks, restoring whatever they overrode'''
+        for task in tasks:
+            if task in self._tasks:
+                self._tasks.remove(task)
+            self._discard(task)
+
+    def _discard(self, task):
+        '''Remove a task from the index'''
+        name = task.fullname
+        if self._index.get(name) is task:
+            self._remove(name)
+            self._restore(name, task.overrides)
+        elif self._shadowed.get(name) is task:
+            # A module has overridden this task, and so it's set aside
+            if isinstance(task.overrides, Shovel) or task.overrides is None:
+                del self._shadowed[name]
+            else:
+                self._shadowed[name] = task.overrides
+        else:
+            # The task is somewhere in a chain of overrides
+            node = self._index.get(name) or self._shadowed.get(name)
+            while node is not None:
+                if isinstance(node, Shovel):
+                    node._discard(task)
+                    break
+                if node.overrides is task:
+                    node.overrides = task.overrides
+                    break
+                node = node.overrides
+
+        # Modules left empty give way to the tasks they overrode
+        modules = name.split('.')
+        for index in range(len(modules) - 1, 0, -1):
+            module = '.'.join(modules[:index])
+            lo, hi = self._range(module)
+            if lo == hi and module in self._shadowed:
+                self._restore(module, self._shadowed.pop(module))
+
+    def _restore(self, name, overridden):
+        '''Put back whatever a removed task had overridden'''
+        if isinstance(overridden, Shovel):
+            for key in overridden._keys:
+                self._insert(key, overridden._index[key])
+            self._shadowed.update(overridden._shadowed)
+        elif overridden is not None:
+            self._insert(name, overridden)
+
+    def reload(self, absolute):
+        '''Read a file again, replacing the tasks it provided before. They
+        keep their place among the overrides of files read before or after'''
+        base, old = self.sources[absolute]
+        tasks = Task.load(absolute, base) if os.path.exists(absolute) else []
+        self.discard(old)
+        if not os.path.exists(absolute):
+            del self.sources[absolute]
+            return
+        self.sources[absolute] = (base, tasks)
+        ranks = dict((path, rank) for rank, path in enumerate(self.sources))
+        self._tasks.extend(tasks)
+        for task in tasks:
+            self._add(task, ranks)
+
+    def read(self, path, base=None, manifest=None, name=None):
+        '''Import some tasks. If a manifest is provided, files that haven't
+        changed since they were recorded in it aren't imported. If a name is
+        provided, only the files that could define it are imported'''
         if base == None:
             base = os.getcwd()
-        absolute = os.path.abspath(path)
-        if os.path.isfile(absolute):
-            # Load that particular file
+        base = os.path.abspath(base)
+        load = manifest.tasks if manifest else Task.load
+        tasks = []
+        for absolute in files(path, base, name):
             logger.info('Loading %s' % absolute)
-            self.extend(Task.load(path, base))
-        elif os.path.isdir(absolute):
-            # Walk this directory looking for tasks
-            tasks = []
-            for root, _, files in os.walk(absolute):
-                files = [f for f in files if f.endswith('.py')]
-                for child in files:
-                    absolute = os.path.join(root, child)
-                    logger.info('Loading %s' % absolute)
-                    tasks.extend(Task.load(absolute, base))
+            with timing.phase(absolute):
+                found = load(absolute, base)
+            self.sources[absolute] = (base, found)
+            tasks.extend(found)
+        with timing.phase('extend'):
             self.extend(tasks)
 
     def __getitem__(self, key):
-        '''Find a task with the provided name'''
-        current = self.map
-        split = key.split('.')
-        for module in split[:-1]:
-            if module not in current:
-                raise KeyError('Module not found')
-            current = current[module].map
-        if split[-1] not in current:
-            raise KeyError('Task not found')
-        return current[split[-1]]
+        '''Find a task (or module of tasks) with the provided name'''
+        name = self._full(key)
+        task = self._index.get(name)
+        if task is not None:
+            return task
+        lo, hi = self._range(name)
+        if lo == hi:
+            raise KeyError('Task not found: %s' % key)
+        return self._view(name)
 
     def __contains__(self, key):
         try:
@@ -116,25 +348,22 @@ class Shovel(object):
         except KeyError:
             return False
 
+    def __iter__(self):
+        '''Iterate over all the valid keys, in order'''
+        start = len(self._prefix) + 1 if self._prefix else 0
+        lo, hi = self._range(self._prefix)
+        for index in range(lo, hi):
+            yield self._keys[index][start:]
+
     def keys(self):
         '''Return all valid keys'''
-        keys = []
-        for key, value in self.map.items():
-            if isinstance(value, Shovel):
-                keys.extend([key + '.' + k for k in value.keys()])
-            else:
-                keys.append(key)
-        return sorted(keys)
+        return list(self)
 
     def items(self):
         '''Return a list of tuples of all the keys and tasks'''
-        pairs = []
-        for key, value in self.map.items():
-            if isinstance(value, Shovel):
-                pairs.extend([(key + '.' + k, v) for k, v in value.items()])
-            else:
-                pairs.append((key, value))
-        return sorted(pairs)
+        lo, hi = self._range(self._prefix)
+        return [(key, self._index[name])
+            for key, name in zip(self, self._keys[lo:hi])]
 
     def tasks(self, name):
         '''Get all the tasks that match a name'''
@@ -162,38 +391,48 @@ class Task(object):
     _tasks = {}
 
     @classmethod
-    def make(cls, obj):
+    def make(cls, obj, depends=None, inputs=None, outputs=None, cache=None,
+        isolate=False, timeout=None, max_memory=None):
         '''Given a callable object, return a new callable object'''
         try:
-            cls._cache.append(Task(obj))
+            made = Task(obj, depends, inputs, outputs, cache,
+                isolate, timeout, max_memory)
         except Exception:
             logger.exception('Unable to make task for %s' % repr(obj))
+            return None
+        cls._cache.append(made)
+        return made
 
     @classmethod
     def load(cls, path, base=None):
         '''Return a list of the tasks stored in a file'''
         base = base or os.getcwd()
         absolute = os.path.abspath(path)
-        parent = os.path.dirname(absolute)
         name, _, _ = os.path.basename(absolute).rpartition('.py')
-        fobj, path, description = imp.find_module(name, [parent])
-        try:
-            imp.load_module(name, fobj, path, description)
-        finally:
-            if fobj:
-                fobj.close()
+        with timing.phase('import'):
+            try:
+                module, executed = loader.load(absolute)
+            except BaseException:
+                # Whatever tasks the file made before it failed would
+                # otherwise be taken for those of the next file loaded
+                cls.clear()
+                raise
+        if executed:
+            module.__shovel_tasks__ = list(cls._cache)
+        else:
+            # The module has already been imported, and so the decorators
+            # won't run again. Instead, we'll use copies of the tasks they made
+            for task in module.__shovel_tasks__:
+                task = copy.copy(task)
+                task.overrides = None
+                cls._cache.append(task)
         # Manipulate the full names of the tasks to be relative to the provided
         # base
-        relative, _, _ = os.path.relpath(path, base).rpartition('.py')
+        relative, _, _ = os.path.relpath(absolute, base).rpartition('.py')
         for task in cls._cache:
-            parts = relative.split(os.path.sep)
-            parts.append(task.name)
-            # If it's either in shovel.py, or folder/__init__.py, then we
-            # should consider it as being at one level above that file
-            parts = [part.strip('.') for part in parts if part not in
-                ('shovel', '.shovel', '__init__', '.', '..', '')]
-            task.fullname = '.'.join(parts)
-            logger.debug('Found task %s in %s' % (task.fullname, task.module))
+            task.source = absolute
+            task.fullname = '.'.join(modules(relative) + modules(task.name))
+            logger.debug('Found task %s in %s' % (task.fullname, name))
         return cls.clear()
 
     @classmethod
@@ -203,79 +442,289 @@ class Task(object):
         cls._cache = []
         return cached
 
-    def __init__(self, obj):
+    # Tasks are made for every decorated function whenever a task file is
+    # imported, including by code that only wants to use those functions as a
+    # library. So they're kept small, and everything that takes introspection
+    # to find out (the docstring, argument spec, and where it was defined) is
+    # only worked out when it's first asked for
+    __slots__ = ('name', 'fullname', 'module', 'source', 'overrides',
+        'depends', 'inputs', 'outputs', 'cache', 'isolate', 'timeout',
+        'max_memory', '_target', '_instance', '_doc', '_spec', '_args', '_line', '_file')
+
+    def __init__(self, obj, depends=None, inputs=None, outputs=None,
+        cache=None, isolate=False, timeout=None, max_memory=None):
         if not callable(obj):
             raise TypeError('Object not callable: %s' % obj)
+        for option in (depends, inputs, outputs):
+            if isinstance(option, str):
+                raise TypeError('%s => Task options must be lists' % (
+                    obj.__name__))
+        if cache is not None and cache is not True and (
+            isinstance(cache, bool) or not isinstance(cache, (int, float))):
+            raise TypeError('%s => cache must be True or a number of seconds' % (
+                obj.__name__))
+        if timeout is not None and (
+            isinstance(timeout, bool) or not isinstance(timeout, (int, float))):
+            raise TypeError('%s => timeout must be a number of seconds' % (
+                obj.__name__))
+        if max_memory is not None:
+            from shovel.isolate import size
+            try:
+                max_memory = size(max_memory)
+            except ValueError:
+                raise TypeError('%s => max_memory must be a size, like 512M' % (
+                    obj.__name__))
 
         # Save some attributes about the task
         self.name = obj.__name__
-        self.doc = inspect.getdoc(obj) or ''
+        self.module = obj.__module__
+        self.fullname = self.name
+        self._target = obj
 
         # If the provided object is a type (like a class), we'll treat
         # it a little differently from if it's a pure function. The
-        # assumption is that the class will be instantiated wit no
-        # arguments, and then called with the provided arguments
-        if isinstance(obj, type):
+        # assumption is that the class will be instantiated with no
+        # arguments (when it's first needed), and then called with the
+        # provided arguments
+        if isinstance(obj, type) and not self._nullary(obj):
+            raise TypeError(
+                '%s => Task classes must take no arguments' % self.name)
+
+        # The file this task was read from, if any
+        self.source = None
+
+        # What module / etc. this overrides, if any
+        self.overrides = None
+
+        # The full names of the tasks that must be run before this one, and
+        # globs of the files it reads and writes
+        self.depends = tuple(depends or ())
+        self.inputs = tuple(inputs or ())
+        self.outputs = tuple(outputs or ())
+
+        # How long to keep return values, if at all
+        self.cache = cache
+
+        # Whether to run in a child process, and the limits it runs under
+        self.isolate = bool(isolate)
+        self.timeout = timeout
+        self.max_memory = max_memory
+
+    @staticmethod
+    def _nullary(cls):
+        '''Whether a class can be instantiated with no arguments, as far as
+        can be told without instantiating it'''
+        init = getattr(cls.__init__, '__func__', cls.__init__)
+        code = getattr(init, '__code__', None)
+        if code is None:
+            # Implemented in C, like object.__init__
+            return True
+        kwonly = getattr(code, 'co_kwonlyargcount', 0)
+        required = code.co_argcount - len(init.__defaults__ or ())
+        names = code.co_varnames[code.co_argcount:code.co_argcount + kwonly]
+        return required <= 1 and all(
+            name in (init.__kwdefaults__ or {}) for name in names)
+
+    @property
+    def _obj(self):
+        '''The callable that the task invokes'''
+        if not isinstance(self._target, type):
+            return self._target
+        try:
+            return self._instance
+        except AttributeError:
             try:
-                self._obj = obj()
-            except:
+                self._instance = self._target()
+            except Exception:
                 raise TypeError(
                     '%s => Task classes must take no arguments' % self.name)
-            self.spec = inspect.getargspec(self._obj.__call__)
-            self.doc = inspect.getdoc(self._obj.__call__) or self.doc
-            self.line = 'Unknown line'
-            self.file = 'Unknown file'
-        else:
-            self.spec = inspect.getargspec(obj)
-            self._obj = obj
-            self.line = obj.__code__.co_firstlineno
-            self.file = obj.__code__.co_filename
+            return self._instance
 
-        self.module = self._obj.__module__
-        self.fullname = self.name
+    @property
+    def doc(self):
+        try:
+            return self._doc
+        except AttributeError:
+            doc = inspect.getdoc(self._target) or ''
+            if isinstance(self._target, type):
+                doc = inspect.getdoc(self._target.__call__) or doc
+            self._doc = doc
+            return doc
+
+    @doc.setter
+    def doc(self, value):
+        self._doc = value
+
+    @property
+    def spec(self):
+        try:
+            return self._spec
+        except AttributeError:
+            if isinstance(self._target, type):
+                self._spec = getspec(self._obj.__call__)
+            else:
+                self._spec = getspec(self._target)
+            return self._spec
 
-        # What module / etc. this overrides, if any
-        self.overrides = None
+    @spec.setter
+    def spec(self, value):
+        self._spec = value
+        try:
+            del self._args
+        except AttributeError:
+            pass
+
+    @property
+    def args(self):
+        '''The arguments this task takes, ready to check an invocation'''
+        try:
+            return self._args
+        except AttributeError:
+            self._args = Args(self.spec)
+            return self._args
+
+    @property
+    def line(self):
+        try:
+            return self._line
+        except AttributeError:
+            code = getattr(self._target, '__code__', None)
+            self._line = code.co_firstlineno if code else 'Unknown line'
+            return self._line
+
+    @line.setter
+    def line(self, value):
+        self._line = value
+
+    @property
+    def file(self):
+        try:
+            return self._file
+        except AttributeError:
+            code = getattr(self._target, '__code__', None)
+            self._file = code.co_filename if code else 'Unknown file'
+            return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
 
     def __call__(self, *args, **kwargs):
-        '''Invoke the task itself'''
+        '''Invoke the task itself, measuring it if metrics are being sent'''
         try:
-            return self._obj(*args, **kwargs)
+            with measured(self.fullname):
+                if self.cache is not None:
+                    from shovel.memo import memo
+                    return memo().call(self, args, kwargs)
+                return self.invoke(*args, **kwargs)
         except Exception as exc:
             logger.exception('Failed to run task %s' % self.name)
             raise(exc)
 
+    @property
+    def asynchronous(self):
+        '''Whether this task is an `async def` or async generator'''
+        target = self._target
+        if isinstance(target, type):
+            target = getattr(target, '__call__', None)
+        # An isolated task blocks while its child process runs it
+        return (inspect.iscoroutinefunction(target) or
+            inspect.isasyncgenfunction(target)) and not self.isolated
+
+    @property
+    def isolated(self):
+        '''Whether this task is run in a child process of its own'''
+        from shovel import isolate
+        return isolate.settings(self) is not None
+
+    def invoke(self, *args, **kwargs):
+        '''Call the task's object, in a child process if it's isolated'''
+        from shovel import isolate
+        settings = isolate.settings(self)
+        if settings is not None:
+            return isolate.run(self, args, kwargs, **settings)
+        return self._call(*args, **kwargs)
+
+    def _call(self, *args, **kwargs):
+        '''Call the task's object, and if it's asynchronous (an `async def` or
+        async generator), run it to completion on an event loop'''
+        result = self._obj(*args, **kwargs)
+        if inspect.iscoroutine(result) or inspect.isasyncgen(result):
+            from shovel import aio
+            return aio.run(result)
+        return result
+
     def capture(self, *args, **kwargs):
-        '''Run a task and return a dictionary with stderr, stdout and the
-        return value. Also, the traceback from the exception if there was
-        one'''
+        '''Run a task and return a dictionary with stderr, stdout, the
+        return value and the exit status. Also, the traceback from the
+        exception if there was one. Only this task's output is captured, so
+        other threads and coroutines can keep on writing (or capturing) at the
+        same time'''
         import traceback
-        try:
-            from StringIO import StringIO
-        except ImportError:
-            from io import StringIO
-        stdout, stderr = sys.stdout, sys.stderr
-        sys.stdout = out = StringIO()
-        sys.stderr = err = StringIO()
+        from shovel.capture import capture
+        from shovel.runner import status
         result = {
             'exception': None,
             'stderr': None,
             'stdout': None,
-            'return': None
+            'return': None,
+            'status': 0
         }
-        try:
-            result['return'] = self.__call__(*args, **kwargs)
-        except Exception:
-            result['exception'] = traceback.format_exc()
-        sys.stdout, sys.stderr = stdout, stderr
-        result['stderr'] = err.getvalue()
-        result['stdout'] = out.getvalue()
+        with capture() as (out, err):
+            try:
+                result['return'] = self.__call__(*args, **kwargs)
+            except SystemExit as exc:
+                result['status'] = status(exc)
+                if result['status']:
+                    result['exception'] = traceback.format_exc()
+            except Exception:
+                result['exception'] = traceback.format_exc()
+                result['status'] = 1
+            result['stderr'] = err.getvalue()
+            result['stdout'] = out.getvalue()
         return result
 
+    def profile(self, *args, **kwargs):
+        '''Run the task under cProfile, and return what it returns along with
+        the `pstats.Stats` of the run'''
+        from shovel.profiling import profile
+        return profile(self.__call__, *args, **kwargs)
+
+    def to_dict(self):
+        '''The details of this task that can be stored in a manifest'''
+        return {
+            'name': self.name,
+            'fullname': self.fullname,
+            'doc': self.doc,
+            'module': self.module,
+            'file': self.file,
+            'line': self.line,
+            'depends': list(self.depends),
+            'inputs': list(self.inputs),
+            'outputs': list(self.outputs),
+            'cache': self.cache,
+            'isolate': self.isolate,
+            'timeout': self.timeout,
+            'max_memory': self.max_memory,
+            'spec': {
+                'args': self.spec.args,
+                'varargs': self.spec.varargs,
+                'keywords': self.spec.keywords,
+                # Defaults are only ever displayed, so their string form is
+                # all that we need to keep
+                'defaults': [str(d) for d in self.spec.defaults or []],
+                'kwonlyargs': list(self.spec.kwonlyargs or []),
+                'kwonlydefaults': dict((k, str(v))
+                    for k, v in (self.spec.kwonlydefaults or {}).items()),
+                'annotations': dict((k, annotation(v))
+                    for k, v in (self.spec.annotations or {}).items())
+            }
+        }
+
     def dry(self, *args, **kwargs):
         '''Perform a dry-run of the task'''
         return 'Would have executed:\n%s%s' % (
-            self.name, Args(self.spec).explain(*args, **kwargs))
+            self.name, self.args.explain(*args, **kwargs))
 
     def help(self):
         '''Return the help string of the task'''
@@ -287,6 +736,16 @@ class Task(object):
         # <docstring>
         # ============================== (If overrides other tasks)
         # Overrides <other task file>
+        # ============================== (If it depends on other tasks)
+        # Depends on <task>, <task>
+        # ============================== (If it has inputs or outputs)
+        # Reads <glob>, <glob>
+        # Writes <glob>, <glob>
+        # ============================== (If it keeps its results)
+        # Keeps its results for <seconds> seconds
+        # ============================== (If it's isolated)
+        # Runs in its own process, for up to <seconds> seconds, with up to
+        # <bytes> bytes of memory
         # ==============================
         # From <file> on <line>
         # ==============================
@@ -311,11 +770,88 @@ class Task(object):
                 result.append('Overrides %s' % override.file)
             override = override.overrides
 
+        if self.depends:
+            result.extend([
+                '=' * 30,
+                'Depends on %s' % ', '.join(self.depends)
+            ])
+        if self.inputs or self.outputs:
+            result.extend([
+                '=' * 30,
+                'Reads %s' % (', '.join(self.inputs) or 'nothing'),
+                'Writes %s' % (', '.join(self.outputs) or 'nothing')
+            ])
+        if self.cache is not None:
+            result.extend([
+                '=' * 30,
+                'Keeps its results %s' % ('indefinitely' if self.cache is True
+                    else 'for %s seconds' % self.cache)
+            ])
+        if self.isolate or self.timeout is not None or (
+            self.max_memory is not None):
+            limits = ['Runs in its own process']
+            if self.timeout is not None:
+                limits.append('for up to %s seconds' % self.timeout)
+            if self.max_memory is not None:
+                limits.append('with up to %i bytes of memory' % self.max_memory)
+            result.extend([
+                '=' * 30,
+                ', '.join(limits)
+            ])
+
         # Print where we read this function in from
         result.extend([
             '=' * 30,
             'From %s on line %i' % (self.file, self.line),
             '=' * 30,
-            '%s%s' % (self.name, str(Args(self.spec)))
+            '%s%s' % (self.name, str(self.args))
         ])
         return os.linesep.join(result)
+
+
+class Stub(Task):
+    '''A task whose details were read from a manifest rather than by importing
+    the file that defines it. It can be listed and described just like a task,
+    and invoking it imports the file and invokes the real task'''
+    __slots__ = ('path', 'base', '_task')
+
+    def __init__(self, details, path, base):
+        # Deliberately not calling Task.__init__, since there's no object
+        self.name = details['name']
+        self.fullname = details['fullname']
+        self.doc = details['doc']
+        self.module = details['module']
+        self.file = details['file']
+        self.line = details['line']
+        spec = details['spec']
+        self.spec = ArgSpec(spec['args'], spec['varargs'], spec['keywords'],
+            tuple(spec['defaults']) or None, spec['kwonlyargs'],
+            spec['kwonlydefaults'] or None, spec['annotations'] or None)
+        self.path = path
+        self.base = base
+        self.source = path
+        self.overrides = None
+        self.depends = tuple(details['depends'])
+        self.inputs = tuple(details['inputs'])
+        self.outputs = tuple(details['outputs'])
+        self.cache = details['cache']
+        self.isolate = details['isolate']
+        self.timeout = details['timeout']
+        self.max_memory = details['max_memory']
+        self._task = None
+
+    def resolve(self):
+        '''Import the file that defines this task, and return the real task'''
+        if self._task is None:
+            for task in Task.load(self.path, self.base):
+                if task.fullname == self.fullname:
+                    self._task = task
+                    break
+            else:
+                raise KeyError('%s no longer defines %s' % (
+                    self.path, self.fullname))
+        return self._task
+
+    def __call__(self, *args, **kwargs):
+        '''Invoke the real task'''
+        return self.resolve()(*args, **kwargs)
@@ -0,0 +1,184 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Keeping track of the wall and CPU time spent in each phase of a run, like
+reading in each task file or running the task itself'''
+
+from __future__ import print_function
+
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# Internal imports
+from shovel.compat import ContextVar
+
+# The timings being kept in this context, and the phase they're in, if any
+_current = ContextVar('shovel_timings', default=None)
+
+
+class Phase(object):
+    '''The wall and CPU time (of the whole process) spent in a phase, along
+    with the phases within it'''
+    __slots__ = ('name', 'wall', 'cpu', 'phases')
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = None
+        self.cpu = None
+        self.phases = []
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'phases': [phase.to_dict() for phase in self.phases]
+        }
+
+
+class Timings(object):
+    '''Timings for everything done within them, as in
+
+        with Timings() as timings:
+            shovel = Shovel.load('shovel.py')
+        print(timings.table())
+
+    Shovel records each phase it goes through, so only those done in this
+    context (including threads it starts) are recorded'''
+    def __init__(self):
+        self.total = Phase('total')
+        self._started = None
+        self._token = None
+
+    def __enter__(self):
+        self._started = (time.perf_counter(), time.process_time())
+        self._token = _current.set((self, self.total))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._token)
+        self._stop(self.total, self._started)
+
+    @staticmethod
+    def _stop(phase, started):
+        wall, cpu = started
+        phase.wall = time.perf_counter() - wall
+        phase.cpu = time.process_time() - cpu
+
+    @contextmanager
+    def phase(self, name):
+        '''Record the time spent in the block as a phase of the current one'''
+        _, parent = _current.get() or (self, self.total)
+        phase = Phase(name)
+        parent.phases.append(phase)
+        token = _current.set((self, phase))
+        started = (time.perf_counter(), time.process_time())
+        try:
+            yield phase
+        finally:
+            self._stop(phase, started)
+            _current.reset(token)
+
+    def to_dict(self):
+        '''The timings, with the total so far if they're still being kept'''
+        result = self.total.to_dict()
+        if self.total.wall is None and self._started:
+            wall, cpu = self._started
+            result['wall'] = time.perf_counter() - wall
+            result['cpu'] = time.process_time() - cpu
+        return result
+
+    def json(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    def table(self):
+        '''A table of each phase, indented under the phase it's part of'''
+        total = self.to_dict()
+        rows = []
+
+        def walk(phase, depth):
+            rows.append(('  ' * depth + phase['name'], phase['wall'],
+                phase['cpu']))
+            for child in phase['phases']:
+                walk(child, depth + 1)
+        for phase in total['phases']:
+            walk(phase, 0)
+        rows.append((total['name'], total['wall'], total['cpu']))
+
+        width = max(len(name) for name, _, _ in rows)
+        lines = ['%-*s %10s %10s' % (width, 'phase', 'wall', 'cpu')]
+        for name, wall, cpu in rows:
+            lines.append('%-*s %10s %10s' % (
+                width, name, milliseconds(wall), milliseconds(cpu)))
+        return '\n'.join(lines)
+
+    def report(self, style='table', stream=None):
+        '''Print the timings as a table or, if style is `json`, a line of
+        JSON'''
+        stream = stream or sys.stderr
+        print(self.json() if style == 'json' else self.table(), file=stream)
+
+
+def milliseconds(seconds):
+    '''A duration for display'''
+    if seconds is None:
+        return '-'
+    return '%.1fms' % (seconds * 1000)
+
+
+def current():
+    '''The timings being kept in this context, if any'''
+    found = _current.get()
+    return found[0] if found else None
+
+
+@contextmanager
+def recording():
+    '''Yield the timings being kept in this context, keeping some for the
+    duration if there aren't any'''
+    timings = current()
+    if timings is not None:
+        yield timings
+    else:
+        with Timings() as timings:
+            yield timings
+
+
+class Untimed(object):
+    '''Recording a phase when no timings are being kept does nothing'''
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+_untimed = Untimed()
+
+
+def phase(name):
+    '''Record the block as a phase of the timings being kept, if any'''
+    found = _current.get()
+    if found is None:
+        return _untimed
+    return found[0].phase(name)
@@ -0,0 +1,223 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Walking directories of task files'''
+
+import os
+import re
+
+# Internal imports
+from shovel import logger
+
+# The name of the files that list patterns to skip, like a .gitignore
+IGNORE = '.shovelignore'
+# Directories that never hold tasks worth importing
+SKIP = ('__pycache__', 'site-packages', 'node_modules')
+
+
+def translate(pattern):
+    '''Turn a gitignore-style glob into a regular expression'''
+    result = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith('**/', index):
+            result.append('(?:.*/)?')
+            index += 3
+        elif pattern.startswith('**', index):
+            result.append('.*')
+            index += 2
+        elif pattern[index] == '*':
+            result.append('[^/]*')
+            index += 1
+        elif pattern[index] == '?':
+            result.append('[^/]')
+            index += 1
+        elif pattern[index] == '[' and ']' in pattern[index + 1:]:
+            end = pattern.index(']', index + 1)
+            result.append('[%s]' % pattern[index + 1:end].replace('!', '^', 1))
+            index = end + 1
+        else:
+            result.append(re.escape(pattern[index]))
+            index += 1
+    return ''.join(result)
+
+
+class Ignore(object):
+    '''The patterns in an ignore file, which apply to the paths beneath the
+    directory it's in'''
+    @classmethod
+    def read(cls, directory):
+        '''Read the ignore file in a directory'''
+        with open(os.path.join(directory, IGNORE)) as fin:
+            return cls(directory, fin.read().splitlines())
+
+    def __init__(self, root, patterns):
+        self.root = root
+        self.rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negated = pattern.startswith('!')
+            pattern = pattern.lstrip('!')
+            directories = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            # Patterns with a slash are relative to the root, and those
+            # without one can match at any depth
+            if '/' not in pattern:
+                pattern = '**/' + pattern
+            regex = re.compile(translate(pattern.lstrip('/')) + '$')
+            self.rules.append((regex, negated, directories))
+
+    def match(self, absolute, directory):
+        '''Whether the path is ignored (True), explicitly included (False) or
+        neither (None) by these patterns. The last matching pattern wins'''
+        relative = os.path.relpath(absolute, self.root).replace(os.sep, '/')
+        result = None
+        for regex, negated, directories in self.rules:
+            if directories and not directory:
+                continue
+            if regex.match(relative):
+                result = not negated
+        return result
+
+
+def ignored(ignores, absolute, directory):
+    '''Whether any of the ignore files applying to path exclude it. Deeper
+    ignore files take precedence over those above them'''
+    result = False
+    for ignore in ignores:
+        matched = ignore.match(absolute, directory)
+        if matched is not None:
+            result = matched
+    return result
+
+
+def scan(directory, ignores):
+    '''List one directory, returning the ignore files that apply beneath it and
+    a sorted list of (name, path, key) for the python files and directories in
+    it worth looking at. For directories, key is their (device, inode), which
+    is how we notice symlink loops; for files it's None'''
+    try:
+        entries = sorted(os.scandir(directory), key=lambda e: e.name)
+    except OSError:
+        logger.exception('Unable to list %s' % directory)
+        return ignores, []
+
+    names = set(entry.name for entry in entries)
+    if 'pyvenv.cfg' in names:
+        logger.info('Skipping virtualenv %s' % directory)
+        return ignores, []
+    if IGNORE in names:
+        ignores = ignores + [Ignore.read(directory)]
+
+    found = []
+    for entry in entries:
+        if entry.is_dir():
+            if entry.name in SKIP or (
+                entry.name.startswith('.') and entry.name != '.shovel'):
+                continue
+            if ignored(ignores, entry.path, True):
+                continue
+            stat = entry.stat()
+            found.append((entry.name, entry.path, (stat.st_dev, stat.st_ino)))
+        elif entry.name.endswith('.py') and entry.is_file():
+            if not ignored(ignores, entry.path, False):
+                found.append((entry.name, entry.path, None))
+    return ignores, found
+
+
+def walk(path, base=None, prune=None, threads=None):
+    '''Yield the python files beneath a directory, in sorted order, skipping
+    hidden and cache directories, virtualenvs and anything excluded by a
+    .shovelignore in it or in the directories between it and `base`. Symlinks
+    are followed, but each directory is only visited once. If provided,
+    `prune(path, directory)` may exclude more paths.
+
+    Each directory listing (and stat) is a round trip on network filesystems,
+    so with `threads` (or $SHOVEL_WALK_THREADS) directories are listed
+    concurrently by a pool of that many threads'''
+    absolute = os.path.abspath(path)
+    root = os.stat(absolute)
+    visited = set([(root.st_dev, root.st_ino)])
+    ignores = []
+    # The ignore files of the directories from base down to this one apply
+    base = os.path.abspath(base or absolute)
+    parent = os.path.dirname(absolute)
+    while os.path.relpath(parent, base).split(os.sep)[0] != '..':
+        if os.path.isfile(os.path.join(parent, IGNORE)):
+            ignores.insert(0, Ignore.read(parent))
+        if parent == base:
+            break
+        parent = os.path.dirname(parent)
+
+    threads = threads or int(os.environ.get('SHOVEL_WALK_THREADS') or 0)
+    if threads > 1:
+        found = _concurrently(absolute, ignores, visited, prune, threads)
+    else:
+        found = _sequentially(absolute, ignores, visited, prune)
+    for child in found:
+        yield child
+
+
+def _keep(visited, prune, name, path, key):
+    '''Whether to keep a found path, and make a note of visited directories'''
+    if key is not None:
+        if key in visited:
+            logger.info('Skipping already-visited directory %s' % path)
+            return False
+        visited.add(key)
+    return not (prune and prune(path, key is not None))
+
+
+def _sequentially(directory, ignores, visited, prune):
+    '''Walk a directory depth first'''
+    ignores, found = scan(directory, ignores)
+    for name, path, key in found:
+        if not _keep(visited, prune, name, path, key):
+            continue
+        if key is None:
+            yield path
+        else:
+            for child in _sequentially(path, ignores, visited, prune):
+                yield child
+
+
+def _concurrently(directory, ignores, visited, prune, threads):
+    '''Walk a directory with a pool of threads, in the same order as
+    `_sequentially` would'''
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    files = []
+    with ThreadPoolExecutor(threads) as pool:
+        pending = set([pool.submit(scan, directory, ignores)])
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                ignores, found = future.result()
+                for name, path, key in found:
+                    if not _keep(visited, prune, name, path, key):
+                        continue
+                    if key is None:
+                        files.append(path)
+                    else:
+                        pending.add(pool.submit(scan, path, ignores))
+    # Depth-first with sorted entries is the same as sorting by components
+    return sorted(files, key=lambda f: f.split(os.sep))
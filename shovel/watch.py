@@ -0,0 +1,184 @@
+# Copyright (c) 2011-2014 Moz
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''Watching task files, and reloading them as they change'''
+
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+
+# Internal imports
+from shovel import logger
+from shovel.tasks import files
+from shovel.walk import walk
+
+# The inotify events that mean a task file may have changed
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+EVENTS = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+
+class Inotify(object):
+    '''Wakes up when anything changes in a set of directories. Raises OSError
+    if inotify isn't available on this platform'''
+    def __init__(self):
+        name = ctypes.util.find_library('c')
+        if not name:
+            raise OSError('Unable to find libc')
+        self.libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watched = set()
+
+    def watch(self, directories):
+        '''Make sure that all of these directories are watched. Any others are
+        forgotten, so that they're watched again if they're made again'''
+        directories = set(directories)
+        self.watched &= directories
+        for directory in directories - self.watched:
+            if self.libc.inotify_add_watch(
+                self.fd, directory.encode('utf-8'), EVENTS) >= 0:
+                self.watched.add(directory)
+
+    def wait(self, timeout):
+        '''Wait up to timeout seconds for something to change, returning
+        whether anything did'''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        # We don't care what the events are, just that there were some
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except (IOError, OSError):
+            pass
+        return True
+
+    def close(self):
+        '''Stop watching'''
+        os.close(self.fd)
+
+
+class Watcher(object):
+    '''Keeps a shovel up to date with the files beneath some roots. When files
+    change, only those files are imported again, so that their tasks can be
+    replaced. Changes are noticed with inotify where it's available, and by
+    checking every `interval` seconds otherwise'''
+    def __init__(self, shovel, roots, interval=1.0, inotify=True):
+        self.shovel = shovel
+        self.roots = list(roots)
+        self.interval = interval
+        self.notifier = None
+        if inotify:
+            try:
+                self.notifier = Inotify()
+            except OSError:
+                logger.info('Falling back to polling for changes')
+        self.stamps = self.stamp()
+
+    def stamp(self):
+        '''The modification time and size of every task file, and the base
+        that each was found in. Every directory that's walked is watched, even
+        those without task files yet, so that files made in them are noticed'''
+        stamps = {}
+        directories = set()
+
+        def visit(path, directory):
+            '''Note the directories the walk visits, without pruning any'''
+            if directory:
+                directories.add(path)
+            return False
+
+        for path, base in self.roots:
+            base = os.path.abspath(base or os.getcwd())
+            absolute = os.path.abspath(path)
+            if os.path.isdir(absolute):
+                directories.add(absolute)
+                found = walk(absolute, base, visit)
+            else:
+                found = files(absolute, base)
+            for absolute in found:
+                try:
+                    stat = os.stat(absolute)
+                except (IOError, OSError):
+                    continue
+                stamps[absolute] = (stat.st_mtime_ns, stat.st_size, base)
+        if self.notifier:
+            directories.update(os.path.dirname(f) for f in stamps)
+            self.notifier.watch(directories)
+        return stamps
+
+    def poll(self):
+        '''Bring the shovel up to date, returning the paths of the files that
+        were added, changed or removed'''
+        stamps = self.stamp()
+        changed = sorted(
+            path for path in set(stamps) | set(self.stamps)
+            if stamps.get(path) != self.stamps.get(path))
+        for path in changed:
+            try:
+                if path in self.shovel.sources:
+                    logger.info('Reloading %s' % path)
+                    self.shovel.reload(path)
+                elif path in stamps:
+                    logger.info('Loading %s' % path)
+                    self.shovel.read(path, stamps[path][2])
+            except Exception:
+                # Leave the old tasks in place until the file is fixed
+                logger.exception('Unable to load %s' % path)
+                stamps[path] = self.stamps.get(path)
+        self.stamps = dict((k, v) for k, v in stamps.items() if v is not None)
+        return changed
+
+    def wait(self, timeout=None):
+        '''Wait until files may have changed, and bring the shovel up to date.
+        Returns the files that changed, which may be none'''
+        if timeout is None:
+            timeout = self.interval
+        if self.notifier:
+            if not self.notifier.wait(timeout):
+                return []
+            # Editors often write files in several steps
+            time.sleep(0.05)
+            self.notifier.wait(0)
+        else:
+            time.sleep(timeout)
+        return self.poll()
+
+    def close(self):
+        '''Stop watching'''
+        if self.notifier:
+            self.notifier.close()
+            self.notifier = None
@@ -0,0 +1,23 @@
+'''Tasks for testing dependencies between tasks'''
+
+from __future__ import print_function
+
+from shovel import task
+
+
+@task
+def compile():
+    '''Compile things'''
+    print('compile')
+
+
+@task(depends=['compile'])
+def build():
+    '''Build things'''
+    print('build')
+
+
+@task(depends=['build', 'compile'])
+def release(version='1.0'):
+    '''Release things'''
+    print('release %s' % version)
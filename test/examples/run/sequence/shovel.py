@@ -0,0 +1,32 @@
+'''Tasks for testing running several tasks at once'''
+
+from __future__ import print_function
+
+import time
+
+from shovel import task
+
+
+@task
+def hello(name='world'):
+    '''Say hello'''
+    print('Hello, %s!' % name)
+
+
+@task
+def fail():
+    '''Always fails'''
+    raise ValueError('Failed')
+
+
+@task
+def nap(seconds):
+    '''Sleep for a while'''
+    time.sleep(float(seconds))
+
+
+@task
+def fetch(url, timeout=10, history=None, force=False, profile=None, **kwargs):
+    '''Print the arguments, whose names are often those of options'''
+    print('%s %s %s %s %s %s' % (
+        url, timeout, history, force, profile, sorted(kwargs.items())))
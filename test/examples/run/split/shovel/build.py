@@ -0,0 +1,11 @@
+'''Tasks that others depend on, from another file'''
+
+from __future__ import print_function
+
+from shovel import task
+
+
+@task
+def compile():
+    '''Compile things'''
+    print('compile')
@@ -0,0 +1,11 @@
+'''Tasks that depend on tasks from another file'''
+
+from __future__ import print_function
+
+from shovel import task
+
+
+@task(depends=['build.compile'])
+def publish(version='1.0'):
+    '''Publish things'''
+    print('publish %s' % version)
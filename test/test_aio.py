@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+
+'''Ensure asynchronous tasks are run on an event loop'''
+
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from io import StringIO
+
+from shovel import aio, batch, metrics
+from shovel.schedule import Schedule
+from shovel.tasks import Shovel, Task
+
+
+class TestAsync(unittest.TestCase):
+    '''Test running asynchronous tasks'''
+    def test_coroutine(self):
+        '''Coroutine functions are run to completion'''
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+
+        task = Task(add)
+        self.assertTrue(task.asynchronous)
+        self.assertEqual(task(1, 2), 3)
+        self.assertEqual(task(3, 4), 7)
+
+    def test_generator(self):
+        '''What async generators yield is collected'''
+        async def count(n):
+            for i in range(n):
+                yield i
+
+        task = Task(count)
+        self.assertTrue(task.asynchronous)
+        self.assertEqual(task(3), [0, 1, 2])
+
+    def test_synchronous(self):
+        '''Normal functions aren't asynchronous'''
+        self.assertFalse(Task(lambda: None).asynchronous)
+
+    def test_batch(self):
+        '''Invocations of a batch share a loop, up to a limit at once'''
+        running = []
+        most = []
+
+        async def fetch(n):
+            running.append(n)
+            most.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(n)
+            return int(n) * 2
+
+        invocations = list(batch.read([str(i) for i in range(20)]))
+        stream = StringIO()
+        start = time.time()
+        failed = batch.run(
+            Task(fetch), invocations, 10, ordered=True, stream=stream)
+        self.assertEqual(failed, 0)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(max(most), 10)
+        results = [json.loads(l) for l in stream.getvalue().splitlines()]
+        self.assertEqual([r['return'] for r in results],
+            [i * 2 for i in range(20)])
+
+    def test_batch_exit(self):
+        '''Invocations that exit fail on their own, with their exit status'''
+        async def check(n):
+            if n == '2':
+                sys.exit(3)
+            return n
+
+        invocations = list(batch.read(['1', '2', '3']))
+        stream = StringIO()
+        failed = batch.run(
+            Task(check), invocations, 2, ordered=True, stream=stream)
+        self.assertEqual(failed, 1)
+        results = [json.loads(l) for l in stream.getvalue().splitlines()]
+        self.assertEqual([r['line'] for r in results], [1, 2, 3])
+        self.assertEqual([r['status'] for r in results], [0, 3, 0])
+        self.assertIn('SystemExit', results[1]['error'])
+        self.assertIsNone(results[2]['error'])
+
+    def test_runner_base_exception(self):
+        '''Coroutines that raise more than an Exception fail their future,
+        rather than stopping the loop'''
+        async def interrupt():
+            raise KeyboardInterrupt()
+
+        async def fine():
+            return 'fine'
+
+        runner = aio.Runner(2)
+        try:
+            future = runner.submit(interrupt)
+            self.assertRaises(RuntimeError, future.result, 5)
+            self.assertEqual(runner.submit(fine).result(5), 'fine')
+        finally:
+            runner.shutdown()
+
+    def test_schedule(self):
+        '''Asynchronous tasks run at the same time on one loop'''
+        arrived = []
+
+        def make(name):
+            async def meet():
+                arrived.append(name)
+                deadline = time.time() + 5
+                while len(arrived) < 2 and time.time() < deadline:
+                    await asyncio.sleep(0.01)
+                if len(arrived) < 2:
+                    raise RuntimeError('Never met')
+            meet.__name__ = name
+            return Task(meet)
+
+        shovel = Shovel([make('one'), make('two')])
+        plan = Schedule(shovel)
+        plan.add(shovel['one'])
+        plan.add(shovel['two'])
+        self.assertEqual(plan.run(jobs=2), 0)
+
+    def test_schedule_exit(self):
+        '''Asynchronous tasks that exit fail with their exit status'''
+        async def leave():
+            sys.exit(3)
+
+        shovel = Shovel([Task(leave)])
+        plan = Schedule(shovel)
+        plan.add(shovel['leave'])
+        self.assertEqual(plan.run(jobs=2), 3)
+
+    def test_wrapped(self):
+        '''Tasks run on a loop keep return values and are measured, as they
+        are when called'''
+        tmpdir = tempfile.mkdtemp()
+        textfile = os.path.join(tmpdir, 'shovel.prom')
+        os.environ['SHOVEL_CACHE'] = os.path.join(tmpdir, 'cache')
+        os.environ['SHOVEL_METRICS_TEXTFILE'] = textfile
+        calls = []
+
+        async def slow(n):
+            calls.append(n)
+            return n * 2
+
+        task = Task(slow, cache=True)
+        try:
+            async def main():
+                return [await aio.call(task, [2], {}) for _ in range(2)]
+            self.assertEqual(aio.run(main()), [4, 4])
+            self.assertEqual(calls, [2])
+            metrics.recorder().flush()
+            with open(textfile) as fin:
+                self.assertIn(
+                    'shovel_task_runs_total{task="slow",result="success"} 2',
+                    fin.read())
+        finally:
+            for name in ('SHOVEL_CACHE', 'SHOVEL_METRICS_TEXTFILE'):
+                os.environ.pop(name, None)
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -66,6 +66,42 @@ class TestArgs(unittest.TestCase):
         self.assertRaises(Exception, args.get, 1, 2)
         self.assertRaises(Exception, args.get, 1, 2, 3, 4)
 
+    def test_keyword_only(self):
+        '''Keyword-only arguments can only be provided by keyword'''
+        def foo(a, *, b, c=3):
+            pass
+
+        args = Args.parse(foo)
+        self.assertEqual(args.get(1, b=2).required, [('a', 1), ('b', 2)])
+        self.assertEqual(args.get(1, b=2).defaulted, [('c', 3)])
+        self.assertRaises(TypeError, args.get, 1, 2)
+        self.assertEqual(str(args), '(a, *, b, c=3)')
+
+    def test_unexpected(self):
+        '''Keyword arguments must have a name the function takes'''
+        def foo(a, b=2):
+            pass
+
+        args = Args.parse(foo)
+        self.assertEqual(args.get(b=3, a=1).kwargs, {'a': 1, 'b': 3})
+        self.assertRaisesRegex(TypeError, 'whiz', args.get, 1, whiz=3)
+
+    def test_annotations(self):
+        '''Annotations are included in the representation'''
+        def foo(a: int, b: '0-100'=50, *args: str):
+            pass
+
+        self.assertEqual(
+            str(Args.parse(foo)), '(a: int, b: 0-100=50, *args: str)')
+
+    def test_methods(self):
+        '''Bound methods don't include their first argument'''
+        class Foo(object):
+            def foo(self, a):
+                pass
+
+        self.assertEqual(Args.parse(Foo().foo).get(1).required, [('a', 1)])
+
     def test_str_basic(self):
         '''Gets a representation of a basic function'''
         def foo(a, b=2):
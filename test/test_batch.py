@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+
+'''Ensure a task can be run for many sets of arguments'''
+
+import sys
+import json
+import unittest
+
+from io import StringIO
+
+from shovel import batch
+from shovel.tasks import Task
+
+
+def greet(name, greeting='Hello'):
+    '''Greet someone'''
+    if name == 'nobody':
+        raise ValueError('Nobody to greet')
+    print('greeting %s' % name)
+    return '%s, %s!' % (greeting, name)
+
+
+def check(number):
+    '''Exit for the second one'''
+    if number == '2':
+        sys.exit(3)
+    return number
+
+
+class TestBatch(unittest.TestCase):
+    '''Test running a task in batches'''
+    def setUp(self):
+        self.task = Task(greet)
+
+    def test_read(self):
+        '''Reads JSON and command-line style lines'''
+        lines = [
+            '["alice"]',
+            '{"name": "bob", "greeting": "Hi"}',
+            '',
+            '# A comment',
+            'carol --greeting "Good day"']
+        self.assertEqual(list(batch.read(lines, kwargs={'extra': '1'})), [
+            (1, ['alice'], {'extra': '1'}),
+            (2, [], {'extra': '1', 'name': 'bob', 'greeting': 'Hi'}),
+            (5, ['carol'], {'extra': '1', 'greeting': 'Good day'})])
+        self.assertRaises(ValueError, list, batch.read(['[oops']))
+
+    def test_bind(self):
+        '''Every line that doesn't fit is reported'''
+        invocations = list(batch.read(['alice', '', 'a b c', '{}']))
+        try:
+            batch.bind(self.task, invocations)
+            self.fail('Expected ValueError')
+        except ValueError as exc:
+            self.assertEqual(str(exc).split('\n'), [
+                'Line 3: Too many arguments provided',
+                "Line 4: Missing arguments ['name']"])
+
+    def test_run(self):
+        '''Streams results as JSON, in order if asked'''
+        names = ['n%i' % i for i in range(20)] + ['nobody']
+        invocations = list(batch.read(names))
+        stream = StringIO()
+        failed = batch.run(
+            self.task, invocations, jobs=3, ordered=True, stream=stream)
+        self.assertEqual(failed, 1)
+        results = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['line'] for r in results], list(range(1, 22)))
+        self.assertEqual(results[0]['return'], 'Hello, n0!')
+        self.assertEqual(results[0]['stdout'], 'greeting n0\n')
+        self.assertIsNone(results[0]['error'])
+        self.assertIn('Nobody to greet', results[-1]['error'])
+
+    def test_exit(self):
+        '''Invocations that exit fail on their own, with their exit status'''
+        invocations = list(batch.read(['1', '2', '3']))
+        stream = StringIO()
+        failed = batch.run(
+            Task(check), invocations, jobs=2, ordered=True, stream=stream)
+        self.assertEqual(failed, 1)
+        results = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([r['line'] for r in results], [1, 2, 3])
+        self.assertEqual([r['status'] for r in results], [0, 3, 0])
+        self.assertEqual(results[2]['return'], '3')
+        self.assertIn('SystemExit', results[1]['error'])
+
+    def test_unordered(self):
+        '''Every invocation is reported, even when not in order'''
+        invocations = list(batch.read(['n%i' % i for i in range(10)]))
+        stream = StringIO()
+        self.assertEqual(batch.run(self.task, invocations, 2, stream=stream), 0)
+        lines = sorted(
+            json.loads(line)['line'] for line in stream.getvalue().splitlines())
+        self.assertEqual(lines, list(range(1, 11)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+
+'''Ensure tasks can be benchmarked'''
+
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+from shovel import bench
+from shovel.tasks import Task
+
+
+class TestBench(unittest.TestCase):
+    '''Test benchmarking tasks'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_percentile(self):
+        '''Percentiles interpolate between samples'''
+        ordered = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.assertEqual(bench.percentile(ordered, 0), 1.0)
+        self.assertEqual(bench.percentile(ordered, 0.5), 3.0)
+        self.assertEqual(bench.percentile(ordered, 1), 5.0)
+        self.assertAlmostEqual(bench.percentile(ordered, 0.95), 4.8)
+        self.assertEqual(bench.percentile([7.0], 0.95), 7.0)
+
+    def test_outliers(self):
+        '''Samples far outside the interquartile range are outliers'''
+        samples = [1.0, 1.1, 0.9, 1.0, 1.05, 0.95, 10.0]
+        self.assertEqual(bench.outliers(samples), [10.0])
+        self.assertEqual(bench.outliers([1.0, 1.0, 1.0]), [])
+
+    def test_summarize(self):
+        '''Samples are summarized'''
+        stats = bench.summarize([3.0, 1.0, 2.0])
+        self.assertEqual(stats['runs'], 3)
+        self.assertEqual(stats['min'], 1.0)
+        self.assertEqual(stats['median'], 2.0)
+        self.assertEqual(stats['max'], 3.0)
+        self.assertEqual(stats['mean'], 2.0)
+        self.assertEqual(stats['stddev'], 1.0)
+        self.assertEqual(stats['outliers'], 0)
+
+    def test_measure(self):
+        '''Tasks are warmed up, and then timed without the collector'''
+        calls = []
+
+        def work(n):
+            calls.append(gc.isenabled())
+            return n
+
+        samples = bench.measure(Task(work), [1], {}, repeat=5, warmup=2)
+        self.assertEqual(len(samples), 5)
+        self.assertEqual(calls, [True] * 2 + [False] * 5)
+        self.assertTrue(gc.isenabled())
+        del calls[:]
+        bench.measure(Task(work), [1], {}, repeat=2, warmup=0, collect=True)
+        self.assertEqual(calls, [True, True])
+
+    def test_history(self):
+        '''Runs are recorded, and the latest baseline is found'''
+        history = bench.History(os.path.join(self.tmpdir, 'history.jsonl'))
+        self.assertEqual(history.baseline('a'), None)
+        history.append({'key': 'a', 'baseline': True, 'stats': {'median': 1}})
+        history.append({'key': 'a', 'baseline': False, 'stats': {'median': 2}})
+        history.append({'key': 'b', 'baseline': True, 'stats': {'median': 3}})
+        self.assertEqual(history.baseline('a')['stats']['median'], 1)
+        history.append({'key': 'a', 'baseline': True, 'stats': {'median': 4}})
+        self.assertEqual(history.baseline('a')['stats']['median'], 4)
+        self.assertEqual(len(list(history.entries())), 4)
+
+    def test_report(self):
+        '''Regressions are found by comparing medians'''
+        stats = bench.summarize([0.002, 0.002, 0.002])
+        lines, regressed = bench.report('foo', stats)
+        self.assertEqual(lines[0], 'foo: 3 runs')
+        self.assertIn('  median        2.000ms', lines)
+        self.assertFalse(regressed)
+
+        baseline = {'stats': {'median': 0.001}}
+        lines, regressed = bench.report('foo', stats, baseline, 0.1)
+        self.assertTrue(regressed)
+        self.assertIn('+100.0%', lines[-1])
+        _, regressed = bench.report('foo', stats, baseline, 1.5)
+        self.assertFalse(regressed)
+
+
+if __name__ == '__main__':
+    unittest.main()
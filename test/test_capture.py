@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+
+'''Ensure output is captured for just the thread or coroutine asking for it'''
+
+import sys
+import asyncio
+import threading
+import unittest
+
+from io import StringIO
+
+from shovel import aio
+from shovel.capture import capture
+from shovel.tasks import Task
+
+
+class TestCapture(unittest.TestCase):
+    '''Test capturing stdout and stderr'''
+    def setUp(self):
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+
+    def test_basic(self):
+        '''Both streams are captured, and nothing else sees them'''
+        original = sys.stdout
+        with capture() as (out, err):
+            print('hello')
+            sys.stderr.write('oops\n')
+            self.assertEqual(out.getvalue(), 'hello\n')
+            self.assertEqual(err.getvalue(), 'oops\n')
+        print('after')
+        self.assertEqual(original.getvalue(), 'after\n')
+
+    def test_threads(self):
+        '''Threads capturing at the same time each get their own output'''
+        results = {}
+        barrier = threading.Barrier(4)
+
+        def work(name):
+            with capture() as (out, _):
+                barrier.wait()
+                for i in range(100):
+                    print('%s %s' % (name, i))
+                results[name] = out.getvalue()
+
+        threads = [
+            threading.Thread(target=work, args=(str(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for name, value in results.items():
+            self.assertEqual(value, ''.join(
+                '%s %s\n' % (name, i) for i in range(100)))
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Needs contextvars')
+    def test_coroutines(self):
+        '''Coroutines on one loop each get their own output'''
+        async def talk(name):
+            for i in range(3):
+                print('%s %s' % (name, i))
+                await asyncio.sleep(0)
+            return name
+
+        async def main():
+            task = Task(talk)
+            return await asyncio.gather(
+                aio.outcome(task, ['a'], {}), aio.outcome(task, ['b'], {}))
+
+        first, second = aio.run(main())
+        self.assertEqual(first['stdout'], 'a 0\na 1\na 2\n')
+        self.assertEqual(second['stdout'], 'b 0\nb 1\nb 2\n')
+        self.assertEqual(first['return'], 'a')
+
+    def test_spool(self):
+        '''Output past the threshold is spooled to a file'''
+        with capture(threshold=10) as (out, _):
+            sys.stdout.write('x' * 5)
+            self.assertFalse(out.spool._rolled)
+            sys.stdout.write('x' * 20)
+            self.assertTrue(out.spool._rolled)
+            self.assertEqual(out.getvalue(), 'x' * 25)
+            # Reading it doesn't get in the way of writing more
+            sys.stdout.write('y')
+            self.assertEqual(out.getvalue(), 'x' * 25 + 'y')
+
+    def test_tail(self):
+        '''The end of the output is kept on hand'''
+        with capture(tail=5) as (out, _):
+            for i in range(10):
+                sys.stdout.write(str(i))
+            self.assertEqual(out.tail(), '56789')
+            sys.stdout.write('abcdefgh')
+            self.assertEqual(out.tail(), 'defgh')
+        with capture() as (out, _):
+            sys.stdout.write('anything')
+            self.assertEqual(out.tail(), '')
+
+    def test_callback(self):
+        '''Each write is passed along as it happens'''
+        chunks = []
+        with capture(callback=lambda *chunk: chunks.append(chunk)):
+            sys.stdout.write('one')
+            sys.stderr.write('two')
+            self.assertEqual(chunks, [('stdout', 'one'), ('stderr', 'two')])
+
+    def test_interrupt(self):
+        '''Streams are restored even when interrupted'''
+        original = sys.stdout
+        with self.assertRaises(KeyboardInterrupt):
+            with capture():
+                raise KeyboardInterrupt()
+        print('after')
+        self.assertEqual(original.getvalue(), 'after\n')
+
+    def test_nested(self):
+        '''Captures can be nested'''
+        with capture() as (outer, _):
+            print('outer')
+            with capture() as (inner, _):
+                print('inner')
+                self.assertEqual(inner.getvalue(), 'inner\n')
+            print('outer again')
+            self.assertEqual(outer.getvalue(), 'outer\nouter again\n')
+
+    def test_task(self):
+        '''Task.capture still reports output, returns and exceptions'''
+        def noisy(fail=False):
+            print('out')
+            sys.stderr.write('err\n')
+            if fail:
+                raise ValueError('nope')
+            return 5
+
+        result = Task(noisy).capture()
+        self.assertEqual(result['stdout'], 'out\n')
+        self.assertEqual(result['stderr'], 'err\n')
+        self.assertEqual(result['return'], 5)
+        self.assertEqual(result['exception'], None)
+        result = Task(noisy).capture(fail=True)
+        self.assertIn('ValueError', result['exception'])
+        self.assertEqual(result['stdout'], 'out\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
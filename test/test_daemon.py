@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+
+'''Ensure that the daemon runs tasks for its clients'''
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from io import StringIO
+
+from shovel import daemon
+
+
+class TestDaemon(unittest.TestCase):
+    '''Run a daemon in a thread, and talk to it'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'project')
+        os.makedirs(self.root)
+        self.write('hello', 'Hello from the daemon')
+        self.socket = os.path.join(self.tmpdir, 'daemon.sock')
+        self.stdout, self.stderr = sys.stdout, sys.stderr
+        # The daemon serves the directory it's started in
+        self.cwd = os.getcwd()
+        os.chdir(self.root)
+        self.daemon = daemon.Daemon(interval=0)
+        self.server = self.daemon.listen(self.socket)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        sys.stdout, sys.stderr = self.stdout, self.stderr
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, message):
+        '''Write a shovel.py with a task that prints a message'''
+        path = os.path.join(self.root, 'shovel.py')
+        with open(path, 'w') as fout:
+            fout.write('\n'.join([
+                'import os, sys, time',
+                'from shovel import task',
+                '@task',
+                'def %s(who="world"):' % name,
+                '    print("%s, %%s" %% who)' % message,
+                '@task',
+                'def env():',
+                '    print(os.environ.get("SHOVEL_TEST"))',
+                '@task',
+                'def meet(mine, theirs):',
+                '    open(mine, "w").close()',
+                '    for _ in range(500):',
+                '        if os.path.exists(theirs):',
+                '            return',
+                '        time.sleep(0.01)',
+                '    raise ValueError("Nobody came")',
+                '@task',
+                'def fail():',
+                '    sys.stderr.write("oops\\n")',
+                '    raise ValueError("oops")']))
+        # Make sure that the change is noticed, even within the resolution
+        # of the filesystem's modification times
+        os.utime(path, (time.time() + 10, time.time() + 10))
+
+    def forward(self, *argv):
+        '''Return the exit code, stdout and stderr of a command line'''
+        out, err = StringIO(), StringIO()
+        code = daemon.forward(list(argv), self.socket, out, err)
+        return code, out.getvalue(), err.getvalue()
+
+    def test_run(self):
+        '''Runs tasks and relays their output'''
+        self.assertEqual(self.forward('hello', 'you'),
+            (0, 'Hello from the daemon, you\n', ''))
+        self.assertEqual(self.forward('tasks')[0], 0)
+
+    def test_errors(self):
+        '''Relays exit codes and errors'''
+        code, _, err = self.forward('missing')
+        self.assertEqual(code, 1)
+        self.assertTrue('Could not find task' in err)
+
+        code, _, err = self.forward('fail')
+        self.assertEqual(code, 1)
+        self.assertTrue('ValueError' in err)
+
+    def test_no_daemon(self):
+        '''Tells the caller when there's no daemon'''
+        self.assertEqual(daemon.forward(
+            ['hello'], os.path.join(self.tmpdir, 'missing.sock')), None)
+
+    def test_environment(self):
+        '''Runs with the client's environment'''
+        os.environ['SHOVEL_TEST'] = 'from the client'
+        try:
+            self.assertEqual(self.forward('env')[1], 'from the client\n')
+        finally:
+            os.environ.pop('SHOVEL_TEST', None)
+        self.assertEqual(self.forward('env')[1], 'None\n')
+
+    def test_concurrent(self):
+        '''Serves several clients at once'''
+        results = []
+
+        def client():
+            results.append(self.forward('hello'))
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results,
+            [(0, 'Hello from the daemon, world\n', '')] * 8)
+
+    def test_concurrent_environment(self):
+        '''Serves several clients at once, even with their own environment'''
+        results = []
+        first, second = (os.path.join(self.tmpdir, n) for n in ('a', 'b'))
+
+        def client(mine, theirs):
+            results.append(self.forward('meet', mine, theirs))
+        threads = [
+            threading.Thread(target=client, args=(first, second)),
+            threading.Thread(target=client, args=(second, first))]
+        os.environ['SHOVEL_TEST'] = 'from the client'
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.environ.pop('SHOVEL_TEST', None)
+        self.assertEqual(results, [(0, '', '')] * 2)
+
+    def test_reload(self):
+        '''Notices when task files change'''
+        self.assertEqual(self.forward('hello')[0], 0)
+        self.write('howdy', 'Howdy from the daemon')
+        self.assertEqual(self.forward('howdy'),
+            (0, 'Howdy from the daemon, world\n', ''))
+        self.assertEqual(self.forward('hello')[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
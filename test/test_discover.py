@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+
+'''Ensure that we can find tasks without importing them'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from shovel import discover
+from shovel.tasks import Shovel
+
+
+class TestDiscover(unittest.TestCase):
+    '''Test our ability to find tasks by reading their source'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, source):
+        '''Write a task file into our temporary directory'''
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as fout:
+            fout.write(source)
+        return path
+
+    def compare(self, path):
+        '''Discovered tasks should have the same details as imported ones'''
+        tasks, unresolved = discover.discover(path, path)
+        self.assertEqual(unresolved, [])
+        imported = Shovel.load(path, path)
+        self.assertEqual(
+            sorted(t.fullname for t in tasks), sorted(imported.keys()))
+        for task in tasks:
+            self.assertEqual(task.to_dict(), imported[task.fullname].to_dict())
+
+    def test_examples(self):
+        '''Gets the same tasks as an import for our examples'''
+        for example in ['capture', 'nested', 'help', 'toplevel/one',
+            'run/depends']:
+            self.compare('test/examples/%s' % example)
+
+    def test_classes(self):
+        '''Functor classes are described by their __call__'''
+        tasks, unresolved = discover.discover('test/examples/classes')
+        self.assertEqual(unresolved, [])
+        self.assertEqual(sorted(t.name for t in tasks), ['Bar', 'Foo'])
+        for task in tasks:
+            self.assertEqual(task.spec.args, ['foo'])
+
+    def test_no_import(self):
+        '''Never executes the task files'''
+        self.write('tasks.py', '\n'.join([
+            'from shovel import task as t',
+            'raise RuntimeError("imported!")',
+            '@t',
+            'def foo(a, b=[1, 2], *args, **kwargs):',
+            '    """Does foo"""']))
+        tasks, _ = discover.discover(self.tmpdir, self.tmpdir)
+        self.assertEqual(len(tasks), 1)
+        self.assertEqual(tasks[0].fullname, 'tasks.foo')
+        self.assertEqual(tasks[0].doc, 'Does foo')
+        self.assertEqual(str(tasks[0].help().split('\n')[-1]),
+            'foo(a, b=[1, 2], *args, **kwargs)')
+
+    def test_keyword_only(self):
+        '''Keyword-only arguments and annotations match an import'''
+        self.write('tasks.py', '\n'.join([
+            'from shovel import task',
+            '@task',
+            'def foo(a: int, *, b, c=3, **kwargs):',
+            '    pass']))
+        self.compare(self.tmpdir)
+
+    def test_async(self):
+        '''Asynchronous tasks match an import'''
+        self.write('tasks.py', '\n'.join([
+            'from shovel import task',
+            '@task',
+            'async def foo(a, b=2):',
+            '    """Does foo"""',
+            '@task',
+            'async def bar():',
+            '    yield 1']))
+        self.compare(self.tmpdir)
+
+    def test_options(self):
+        '''Task options match an import'''
+        self.write('tasks.py', '\n'.join([
+            'from shovel import task',
+            '@task(depends=["other"], inputs=["src/*"], outputs=("out",))',
+            'def foo():',
+            '    pass',
+            '@task(timeout=2.5, max_memory="64M")',
+            'def bar():',
+            '    pass',
+            '@task(isolate=True)',
+            'def baz():',
+            '    pass']))
+        self.compare(self.tmpdir)
+
+    def test_unresolved(self):
+        '''Reports tasks that can only be found with an import'''
+        self.write('tasks.py', '\n'.join([
+            'import shovel',
+            'for name in ["a", "b"]:',
+            '    shovel.task(lambda: name)',
+            '@shovel.task',
+            'def foo():',
+            '    pass']))
+        self.write('broken.py', 'def (')
+        tasks, unresolved = discover.discover(self.tmpdir, self.tmpdir)
+        self.assertEqual([t.fullname for t in tasks], ['tasks.foo'])
+        self.assertEqual(sorted((os.path.basename(f), l, r)
+            for f, l, r in unresolved), [
+                ('broken.py', 1, 'syntax error'),
+                ('tasks.py', 3, 'dynamic use of task')])
+
+    def test_errors(self):
+        '''Classes that can't be instantiated aren't tasks'''
+        tasks, unresolved = discover.discover('test/examples/errors')
+        self.assertEqual(tasks, [])
+        self.assertEqual(len(unresolved), 1)
+
+    def test_pool(self):
+        '''Large trees are parsed in a pool of processes'''
+        for index in range(10):
+            self.write('tasks%i.py' % index,
+                'from shovel import task\n@task\ndef foo():\n    pass\n')
+        threshold, discover.THRESHOLD = discover.THRESHOLD, 5
+        try:
+            tasks, _ = discover.discover(self.tmpdir, self.tmpdir, 2)
+        finally:
+            discover.THRESHOLD = threshold
+        self.assertEqual(sorted(t.fullname for t in tasks),
+            ['tasks%i.foo' % index for index in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+
+'''Ensure isolated tasks run in a child process, within their limits'''
+
+import array
+import os
+import sys
+import time
+import unittest
+
+from shovel import isolate
+from shovel.tasks import Task
+
+
+def pid():
+    return os.getpid()
+
+
+def nap(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail():
+    raise ValueError('Failed')
+
+
+def hog():
+    return bytearray(512 * 1024 * 1024)
+
+
+def die():
+    os._exit(3)
+
+
+def chatty():
+    print('out')
+    sys.stderr.write('err\n')
+    return 'done'
+
+
+def big(kind):
+    if kind == 'array':
+        return array.array('d', range(isolate.SHARED))
+    return kind(b'x' * isolate.SHARED * 2)
+
+
+class TestIsolate(unittest.TestCase):
+    '''Test running tasks in a child process'''
+    def test_options(self):
+        '''Limits imply isolation, and are checked'''
+        self.assertFalse(Task(pid).isolated)
+        self.assertTrue(Task(pid, isolate=True).isolated)
+        self.assertTrue(Task(pid, timeout=1).isolated)
+        task = Task(pid, max_memory='2M')
+        self.assertTrue(task.isolated)
+        self.assertEqual(task.max_memory, 2 * 1024 * 1024)
+        self.assertRaises(TypeError, Task, pid, timeout='1')
+        self.assertRaises(TypeError, Task, pid, max_memory='lots')
+
+    def test_size(self):
+        '''Memory sizes can have suffixes'''
+        self.assertEqual(isolate.size(100), 100)
+        self.assertEqual(isolate.size('1k'), 1024)
+        self.assertEqual(isolate.size('1.5G'), 1.5 * 1024 ** 3)
+        self.assertEqual(isolate.size('512MB'), 512 * 1024 ** 2)
+        self.assertRaises(ValueError, isolate.size, 'M')
+        self.assertRaises(ValueError, isolate.size, True)
+
+    def test_child(self):
+        '''Runs in another process'''
+        self.assertEqual(Task(pid)(), os.getpid())
+        self.assertNotEqual(Task(pid, isolate=True)(), os.getpid())
+
+    def test_configure(self):
+        '''Every task can be isolated at once'''
+        task = Task(pid)
+        with isolate.configure(timeout=5):
+            self.assertEqual(
+                isolate.settings(task), {'timeout': 5, 'max_memory': None})
+            self.assertNotEqual(task(), os.getpid())
+        self.assertEqual(isolate.settings(task), None)
+        self.assertEqual(task(), os.getpid())
+
+    def test_timeout(self):
+        '''Tasks that take too long are killed'''
+        start = time.time()
+        self.assertRaisesRegex(TimeoutError, 'nap timed out after 0.2',
+            Task(nap, timeout=0.2), 10)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(Task(nap, timeout=5)(0), 0)
+
+    def test_max_memory(self):
+        '''Tasks can't use more than their memory'''
+        self.assertRaises(MemoryError, Task(hog, max_memory='256M'))
+
+    def test_exception(self):
+        '''Exceptions are raised again, with the child's traceback'''
+        with self.assertRaises(ValueError) as context:
+            Task(fail, isolate=True)()
+        self.assertIsInstance(context.exception.__cause__,
+            isolate.RemoteTraceback)
+        self.assertIn('in fail', str(context.exception.__cause__))
+
+    def test_died(self):
+        '''It's an error to exit without a result'''
+        self.assertRaisesRegex(RuntimeError, 'die exited with code 3',
+            Task(die, isolate=True))
+
+    def test_capture(self):
+        '''Output is captured from the child'''
+        result = Task(chatty, isolate=True).capture()
+        self.assertEqual(result['stdout'], 'out\n')
+        self.assertEqual(result['stderr'], 'err\n')
+        self.assertEqual(result['return'], 'done')
+
+    @unittest.skipIf(sys.version_info < (3, 8), 'Needs shared memory')
+    def test_shared(self):
+        '''Large buffers come back through shared memory'''
+        for kind in (bytes, bytearray, memoryview):
+            message = isolate.pack(big(kind))
+            self.assertEqual(message[0], 'shared')
+            value = isolate.unpack(message)
+            self.assertEqual(value, b'x' * isolate.SHARED * 2)
+        self.assertEqual(isolate.pack(b'small'), ('return', b'small'))
+
+    def test_large(self):
+        '''Large buffers come back, whether or not there's shared memory'''
+        task = Task(big, isolate=True)
+        self.assertEqual(task(bytearray), bytearray(big(bytearray)))
+        self.assertEqual(task('array'), big('array'))
+
+
+if __name__ == '__main__':
+    unittest.main()
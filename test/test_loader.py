@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+
+'''Ensure that task files are imported correctly'''
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from shovel import loader
+from shovel.tasks import Shovel, Task
+
+
+class TestLoader(unittest.TestCase):
+    '''Test how we import task files'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.environ['SHOVEL_CACHE'] = os.path.join(self.tmpdir, 'cache')
+        self.root = os.path.join(self.tmpdir, 'shovel')
+        sys.shovel_executions = 0
+
+    def tearDown(self):
+        del os.environ['SHOVEL_CACHE']
+        del sys.shovel_executions
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relative, name):
+        '''Write a task file that counts how often it's executed'''
+        path = os.path.join(self.root, relative)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fout:
+            fout.write('\n'.join([
+                'import sys',
+                'from shovel import task',
+                'sys.shovel_executions += 1',
+                '@task',
+                'def %s():' % name,
+                '    return %r' % relative]))
+        return path
+
+    def test_unique_names(self):
+        '''Files with the same name in different directories coexist'''
+        first = self.write('a/util.py', 'foo')
+        second = self.write('b/util.py', 'foo')
+        self.assertNotEqual(
+            loader.module_name(first), loader.module_name(second))
+        shovel = Shovel.load(self.root, self.root)
+        self.assertEqual(shovel['a.util.foo'](), 'a/util.py')
+        self.assertEqual(shovel['b.util.foo'](), 'b/util.py')
+        self.assertEqual(
+            sys.modules[loader.module_name(first)].__file__, first)
+
+    def test_reuse(self):
+        '''Files are only executed again when they change'''
+        path = self.write('foo.py', 'foo')
+        first = Shovel.load(self.root, self.root)
+        second = Shovel.load(self.root, self.root)
+        self.assertEqual(sys.shovel_executions, 1)
+        self.assertEqual(second.keys(), ['foo.foo'])
+        self.assertFalse(first['foo.foo'] is second['foo.foo'])
+
+        self.write('foo.py', 'bar')
+        os.utime(path, (0, 0))
+        self.assertEqual(Shovel.load(self.root, self.root).keys(),
+            ['foo.bar'])
+        self.assertEqual(sys.shovel_executions, 2)
+
+    def test_bytecode(self):
+        '''Compiled task files are kept in our cache, not next to them'''
+        path = self.write('foo.py', 'foo')
+        Task.load(path, self.root)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.root, '__pycache__')))
+        cached = os.listdir(os.path.join(self.tmpdir, 'cache', 'bytecode'))
+        self.assertEqual(len(cached), 1)
+
+        # A fresh loader should use that bytecode rather than compiling
+        class Strict(loader.Loader):
+            def source_to_code(self, *args, **kwargs):
+                raise AssertionError('Compiled again')
+        name = loader.module_name(path)
+        code = Strict(name, path).get_code(name)
+        self.assertEqual(code.co_filename, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
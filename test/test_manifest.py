@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+
+'''Ensure that the task manifest serves unchanged files'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from shovel.manifest import Manifest
+from shovel.tasks import Shovel, Stub
+
+
+class TestManifest(unittest.TestCase):
+    '''Test our ability to list tasks without importing them'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base = os.path.join(self.tmpdir, 'capture')
+        shutil.copytree('test/examples/capture', self.base)
+        self.path = os.path.join(self.tmpdir, 'manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        '''Read our example through a freshly-loaded manifest'''
+        manifest = Manifest.load(self.path)
+        shovel = Shovel()
+        shovel.read(self.base, self.base, manifest)
+        manifest.save()
+        return shovel
+
+    def test_missing(self):
+        '''A missing manifest is just an empty one'''
+        self.assertEqual(Manifest.load(self.path).files, {})
+
+    def test_stubs(self):
+        '''Unchanged files are served as stubs with the same details'''
+        original = self.read()
+        cached = self.read()
+        self.assertEqual(original.keys(), cached.keys())
+        for key in original.keys():
+            self.assertTrue(isinstance(cached[key], Stub))
+            self.assertEqual(original[key].to_dict(), cached[key].to_dict())
+            self.assertEqual(original[key].help(), cached[key].help())
+
+    def test_invoke(self):
+        '''Invoking a stub imports and invokes the real task'''
+        self.read()
+        stub = self.read()['foo']
+        self.assertTrue(isinstance(stub, Stub))
+        self.assertEqual(stub.capture(1, 2, 3)['return'], 6)
+
+    def test_stale(self):
+        '''Changed files are imported again'''
+        self.read()
+        with open(os.path.join(self.base, '__init__.py'), 'a') as fout:
+            fout.write('\n\n@task\ndef whiz():\n    pass\n')
+        shovel = self.read()
+        self.assertTrue('whiz' in shovel)
+        self.assertFalse(isinstance(shovel['foo'], Stub))
+
+    def test_touched(self):
+        '''Files whose contents haven't changed are still fresh'''
+        self.read()
+        os.utime(os.path.join(self.base, '__init__.py'), (0, 0))
+        self.assertTrue(isinstance(self.read()['foo'], Stub))
+
+    def test_prune(self):
+        '''Files that no longer exist are forgotten'''
+        self.read()
+        shutil.rmtree(self.base)
+        manifest = Manifest.load(self.path)
+        manifest.save()
+        self.assertEqual(Manifest.load(self.path).files, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
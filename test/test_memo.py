@@ -0,0 +1,134 @@
+#! /usr/bin/env python
+
+'''Ensure tasks' return values are kept when asked'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from shovel.memo import Memo, memo
+from shovel.tasks import Task, task
+
+
+class TestMemo(unittest.TestCase):
+    '''Test the store of return values'''
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        os.environ['SHOVEL_CACHE'] = self.cache
+        self.calls = []
+        Task.clear()
+
+    def tearDown(self):
+        Task.clear()
+        del os.environ['SHOVEL_CACHE']
+        shutil.rmtree(self.cache)
+
+    def make(self, cache=True):
+        '''A task that records its calls'''
+        def lookup(a, b=2, *rest):
+            self.calls.append((a, b) + rest)
+            return {'sum': a + b + sum(rest)}
+        return Task(lookup, cache=cache)
+
+    def test_memoized(self):
+        '''Return values are reused, however the arguments are given'''
+        lookup = self.make()
+        self.assertEqual(lookup(1), {'sum': 3})
+        self.assertEqual(lookup(1, 2), {'sum': 3})
+        self.assertEqual(lookup(a=1, b=2), {'sum': 3})
+        self.assertEqual(lookup(1, 3), {'sum': 4})
+        self.assertEqual(lookup(1, 2, 3), {'sum': 6})
+        self.assertEqual(self.calls, [(1, 2), (1, 3), (1, 2, 3)])
+        stats = memo().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+        self.assertEqual(stats['entries'], 3)
+
+    def test_expires(self):
+        '''Return values are only kept for as long as asked'''
+        lookup = self.make(cache=0.01)
+        lookup(1)
+        time.sleep(0.02)
+        lookup(1)
+        self.assertEqual(len(self.calls), 2)
+        time.sleep(0.02)
+        self.assertEqual(memo().prune(expired=True), 1)
+        self.assertEqual(memo().stats()['entries'], 0)
+
+    def test_evicts(self):
+        '''The least recently used values are evicted to fit the size'''
+        os.mkdir(os.path.join(self.cache, 'small'))
+        store = Memo(os.path.join(self.cache, 'small'), size=1)
+        store.put('one', b'x' * 100)
+        self.assertEqual(store.get('one'), (False, None))
+
+        store.size = 10000
+        for key in ('one', 'two', 'three'):
+            store.put(key, b'x' * 300)
+            os.utime(store.filename(key), (0, len(key)))
+        store.get('one')
+        store.size = 800
+        self.assertEqual(store.prune(), 1)
+        self.assertEqual(store.get('one')[0], True)
+        self.assertEqual(store.get('two')[0], False)
+        self.assertEqual(store.get('three')[0], True)
+
+    def test_listed_when_full(self):
+        '''The store is only listed once it may have grown too big'''
+        os.mkdir(os.path.join(self.cache, 'small'))
+        store = Memo(os.path.join(self.cache, 'small'), size=1000)
+        listed = []
+        entries = store.entries
+        store.entries = lambda: listed.append(True) or entries()
+        for key in ('one', 'two', 'three'):
+            store.put(key, b'x' * 100)
+        self.assertEqual(len(listed), 1)
+        store.put('four', b'x' * 700)
+        self.assertEqual(len(listed), 2)
+        self.assertEqual(store.get('one')[0], False)
+
+    def test_concurrent_counts(self):
+        '''Counts from several processes all add up'''
+        import multiprocessing
+        store = memo()
+
+        def count():
+            for _ in range(50):
+                store.count('hits')
+        processes = [multiprocessing.get_context('fork').Process(target=count)
+            for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(store.stats()['hits'], 200)
+
+    def test_decorator(self):
+        '''Calls to the decorated function use the store too'''
+        calls = []
+
+        @task(cache=60)
+        def double(a):
+            calls.append(a)
+            return a * 2
+
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double(2), 4)
+        self.assertEqual(calls, [2])
+        self.assertEqual(double.__name__, 'double')
+
+    def test_unpicklable(self):
+        '''Return values that can't be stored are still returned'''
+        lookup = Task(lambda: (lambda: None), cache=True)
+        self.assertTrue(callable(lookup()))
+        self.assertEqual(memo().stats()['entries'], 0)
+
+    def test_invalid(self):
+        '''The cache option has to be a number of seconds or True'''
+        self.assertRaises(TypeError, self.make, cache='forever')
+        self.assertRaises(TypeError, self.make, cache=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#! /usr/bin/env python
+
+'''Ensure metrics about tasks are recorded and exported'''
+
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from shovel import metrics
+from shovel.tasks import Task
+
+
+def ok():
+    return 'ok'
+
+
+def fail():
+    raise ValueError('Failed')
+
+
+class TestMetrics(unittest.TestCase):
+    '''Test recording and exporting metrics'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.textfile = os.path.join(self.tmpdir, 'shovel.prom')
+        os.environ['SHOVEL_CACHE'] = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        recorder = metrics.recorder()
+        if recorder is not None:
+            recorder.flush()
+        for name in ('SHOVEL_CACHE', 'SHOVEL_METRICS_TEXTFILE', 'SHOVEL_STATSD'):
+            os.environ.pop(name, None)
+        shutil.rmtree(self.tmpdir)
+
+    def read(self):
+        with open(self.textfile) as fin:
+            return fin.read()
+
+    def test_disabled(self):
+        '''Nothing is measured when there's nowhere to send it'''
+        self.assertEqual(metrics.recorder(), None)
+        self.assertEqual(Task(ok)(), 'ok')
+
+    def test_textfile(self):
+        '''Runs of tasks are written to a Prometheus textfile'''
+        os.environ['SHOVEL_METRICS_TEXTFILE'] = self.textfile
+        Task(ok)()
+        Task(ok)()
+        self.assertRaises(ValueError, Task(fail))
+        metrics.recorder().flush()
+        text = self.read()
+        self.assertIn('shovel_task_duration_seconds_count{task="ok"} 2', text)
+        self.assertIn(
+            'shovel_task_duration_seconds_bucket{task="ok",le="+Inf"} 2', text)
+        self.assertIn(
+            'shovel_task_runs_total{task="ok",result="success"} 2', text)
+        self.assertIn(
+            'shovel_task_runs_total{task="fail",result="failure"} 1', text)
+        self.assertIn('shovel_task_peak_rss_bytes{task="ok"}', text)
+        self.assertIn('shovel_task_last_success_timestamp_seconds{task="ok"}',
+            text)
+        self.assertNotIn(
+            'shovel_task_last_success_timestamp_seconds{task="fail"}', text)
+
+    def test_accumulates(self):
+        '''Each process adds to what's already in the textfile'''
+        for _ in range(2):
+            recorder = metrics.Recorder(self.textfile)
+            recorder.record('foo', 0.2, True)
+            recorder.flush()
+        text = self.read()
+        self.assertIn('shovel_task_duration_seconds_count{task="foo"} 2', text)
+        self.assertIn(
+            'shovel_task_duration_seconds_bucket{task="foo",le="0.1"} 0', text)
+        self.assertIn(
+            'shovel_task_duration_seconds_bucket{task="foo",le="0.25"} 2', text)
+        self.assertIn('shovel_task_duration_seconds_sum{task="foo"} 0.4', text)
+
+    def test_batched(self):
+        '''Measurements are only sent every so often'''
+        recorder = metrics.Recorder(self.textfile)
+        recorder.record('foo', 0.1, True)
+        self.assertFalse(os.path.exists(self.textfile))
+        recorder.flushed -= metrics.INTERVAL
+        recorder.record('foo', 0.1, True)
+        self.assertIn('shovel_task_duration_seconds_count{task="foo"} 2',
+            self.read())
+
+    def test_statsd(self):
+        '''Runs of tasks are sent to statsd, as few packets as possible'''
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            os.environ['SHOVEL_STATSD'] = '127.0.0.1:%i' % (
+                server.getsockname()[1])
+            Task(ok)()
+            self.assertRaises(ValueError, Task(fail))
+            metrics.recorder().flush()
+            lines = server.recv(metrics.PACKET).decode('utf-8').split('\n')
+        finally:
+            server.close()
+        self.assertTrue(lines[0].startswith('shovel.task.ok.duration:'))
+        self.assertTrue(lines[0].endswith('|ms'))
+        self.assertIn('shovel.task.ok.success:1|c', lines)
+        self.assertIn('shovel.task.fail.failure:1|c', lines)
+
+    def test_packets(self):
+        '''Lines are packed into packets no bigger than allowed'''
+        lines = ['x' * 10] * 10
+        self.assertEqual(list(metrics.packets(lines, 1000)), ['\n'.join(lines)])
+        packed = list(metrics.packets(lines, 31))
+        self.assertEqual(packed, ['\n'.join(['x' * 10] * 2)] * 5)
+
+    def test_label(self):
+        '''Label values are escaped'''
+        self.assertEqual(metrics.label('a"b\\c\nd'), 'a\\"b\\\\c\\nd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+
+'''Ensure tasks can be profiled'''
+
+import unittest
+
+from shovel import profiling
+from shovel.tasks import Task
+
+
+def inner(n):
+    return sum(i * i for i in range(n))
+
+
+def outer(n):
+    for _ in range(3):
+        inner(n)
+    return n
+
+
+class TestProfiling(unittest.TestCase):
+    '''Test profiling tasks'''
+    def test_profile(self):
+        '''Returns what the task returns, and its stats'''
+        result, stats = Task(outer).profile(1000)
+        self.assertEqual(result, 1000)
+        names = set(name for _, _, name in stats.stats)
+        self.assertIn('outer', names)
+        self.assertIn('inner', names)
+
+    def test_label(self):
+        '''Functions are labelled with where they are'''
+        self.assertEqual(profiling.label(('/a/b.py', 3, 'foo')), 'foo (b.py:3)')
+        self.assertEqual(profiling.label(
+            ('~', 0, '<built-in method time.sleep>')),
+            '<built-in method time.sleep>')
+
+    def test_collapse(self):
+        '''Collapsed stacks cover the time spent, from the outside in'''
+        _, stats = profiling.profile(outer, 100000)
+        lines = list(profiling.collapse(stats))
+        stacks = dict(line.rsplit(' ', 1) for line in lines)
+        self.assertTrue(any(
+            stack.startswith('outer') and 'inner' in stack for stack in stacks))
+        # Nearly all of the time is accounted for
+        total = sum(int(weight) for weight in stacks.values()) / 1e6
+        self.assertAlmostEqual(total, stats.total_tt, delta=stats.total_tt * 0.1)
+
+    def test_recursion(self):
+        '''Recursive calls don't go on forever'''
+        def fib(n):
+            return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+        _, stats = profiling.profile(fib, 15)
+        for line in profiling.collapse(stats):
+            stack, _ = line.rsplit(' ', 1)
+            self.assertLessEqual(stack.count('fib ('), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+
+'''Ensure abbreviated and misspelled task names are resolved'''
+
+import unittest
+
+from shovel.resolve import Trie, Unresolved, resolve
+from shovel.tasks import Shovel, Task
+
+
+class TestTrie(unittest.TestCase):
+    '''Test the trie of task names'''
+    def setUp(self):
+        self.trie = Trie([
+            'foo.bar.hello', 'foo.bar.howdy', 'foo.baz.hi', 'foobar.whiz',
+            'bar'])
+
+    def test_resolve_exact(self):
+        '''A full name resolves to itself'''
+        self.assertEqual(self.trie.resolve('foo.bar.hello'), ['foo.bar.hello'])
+
+    def test_resolve_abbreviation(self):
+        '''Each component may be abbreviated'''
+        self.assertEqual(self.trie.resolve('f.bar.he'), ['foo.bar.hello'])
+        self.assertEqual(self.trie.resolve('f.b.hi'), ['foo.baz.hi'])
+
+    def test_resolve_ambiguous(self):
+        '''All the names an abbreviation fits are returned'''
+        self.assertEqual(
+            self.trie.resolve('f.b.h'),
+            ['foo.bar.hello', 'foo.bar.howdy', 'foo.baz.hi'])
+
+    def test_resolve_exact_component(self):
+        '''A component that matches exactly is preferred'''
+        self.assertEqual(self.trie.resolve('foo'), ['foo'])
+        self.assertEqual(self.trie.resolve('foob'), ['foobar'])
+
+    def test_resolve_missing(self):
+        '''Nothing is returned for names that don't fit'''
+        self.assertEqual(self.trie.resolve('f.q'), [])
+        self.assertEqual(self.trie.resolve('foo.bar.hello.there'), [])
+
+    def test_complete(self):
+        '''Completes prefixes, and then abbreviations'''
+        self.assertEqual(
+            self.trie.complete('foo.bar.h'), ['foo.bar.hello', 'foo.bar.howdy'])
+        self.assertEqual(
+            self.trie.complete('f.ba'),
+            ['foo.bar.hello', 'foo.bar.howdy', 'foo.baz.hi'])
+        self.assertEqual(self.trie.complete('', limit=2), ['bar', 'foo.bar.hello'])
+
+    def test_suggest(self):
+        '''Suggests similar names, most similar first'''
+        self.assertEqual(self.trie.suggest('foo.bar.helo')[0], 'foo.bar.hello')
+        self.assertIn('foo.bar.howdy', self.trie.suggest('howdie'))
+        self.assertEqual(self.trie.suggest('zzzzzz'), [])
+
+
+class TestResolve(unittest.TestCase):
+    '''Test resolving names in a shovel'''
+    def setUp(self):
+        def hello():
+            pass
+        self.shovel = Shovel()
+        for name in ('foo.bar.hello', 'foo.baz.hello'):
+            task = Task(hello)
+            task.fullname = name
+            self.shovel.extend([task])
+
+    def test_resolve(self):
+        '''Names and unique abbreviations are resolved'''
+        self.assertEqual(resolve(self.shovel, 'foo'), 'foo')
+        self.assertEqual(resolve(self.shovel, 'f.bar'), 'foo.bar')
+        self.assertEqual(resolve(self.shovel, 'f.bar.h'), 'foo.bar.hello')
+
+    def test_ambiguous(self):
+        '''Ambiguous abbreviations list what they match'''
+        try:
+            resolve(self.shovel, 'f.b.h')
+            self.fail('Expected Unresolved')
+        except Unresolved as exc:
+            self.assertEqual(
+                exc.candidates, ['foo.bar.hello', 'foo.baz.hello'])
+            self.assertIn('matches multiple tasks', str(exc))
+
+    def test_missing(self):
+        '''Names that match nothing come with suggestions'''
+        try:
+            resolve(self.shovel, 'foo.bar.helo')
+            self.fail('Expected Unresolved')
+        except Unresolved as exc:
+            self.assertIsInstance(exc, KeyError)
+            self.assertEqual(exc.suggestions[0], 'foo.bar.hello')
+            self.assertIn('Did you mean', str(exc))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,13 @@
 import unittest
 
 from contextlib import contextmanager
+import json
 import logging
 import os
 import shovel
+import shutil
 import sys
+import tempfile
 
 from io import StringIO
 
@@ -39,6 +42,14 @@ def logs():
 
 class TestRun(unittest.TestCase):
     '''Test our `run` method'''
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        os.environ['SHOVEL_CACHE'] = self.cache
+
+    def tearDown(self):
+        del os.environ['SHOVEL_CACHE']
+        shutil.rmtree(self.cache)
+
     def stdout(self, pth, *args, **kwargs):
         with Path(pth):
             with capture() as out:
@@ -76,7 +87,7 @@ class TestRun(unittest.TestCase):
 
     def test_verbose(self):
         '''Can be run in verbose mode'''
-        actual = self.logs('test/examples/run/basic', 'bar', '--verbose')
+        actual = self.logs('test/examples/run/basic', '--verbose', 'bar')
         # We have to replace absolue paths with relative ones
         actual = [line.replace(os.getcwd(), '') for line in actual]
         expected_path = Path('/test/examples/run/basic/shovel.py').normpath()
@@ -85,11 +96,239 @@ class TestRun(unittest.TestCase):
             'Found task bar in shovel']
         self.assertEqual(actual, expected)
 
+    def test_version(self):
+        '''Prints the installed version when asked'''
+        with capture() as out:
+            self.assertRaises(SystemExit, shovel.run, '--version')
+        self.assertTrue(out.getvalue().startswith('Shovel v '))
+
     def test_task_missing(self):
         '''Exits if the task is missing'''
         self.assertRaises(
             SystemExit, self.stderr, 'test/examples/run/basic', 'whiz')
 
+    def test_task_suggestions(self):
+        '''Suggests tasks when the one asked for is missing'''
+        with capture('stderr') as out:
+            self.assertRaises(
+                SystemExit, self.stdout, 'test/examples/run/basic', 'baz')
+        self.assertIn('Did you mean', out.getvalue())
+        self.assertIn('bar', out.getvalue())
+
+    def test_task_abbreviated(self):
+        '''Tasks can be run by an unambiguous abbreviation'''
+        actual = self.stdout('test/examples/run/basic', 'b')
+        self.assertEqual(actual, ['Hello from bar!'])
+
+    def test_complete(self):
+        '''Prints the names that partial names complete to'''
+        actual = self.stdout('test/examples/run/basic', 'complete', 'b')
+        self.assertEqual(actual, ['bar'])
+
+    def test_bad_arguments(self):
+        '''Exits with usage if the arguments don't fit the task'''
+        with capture('stderr') as out:
+            self.assertRaises(SystemExit,
+                self.stdout, 'test/examples/run/basic', 'bar', '1')
+        self.assertIn('Too many arguments', out.getvalue())
+        self.assertIn('Usage: bar()', out.getvalue())
+
+    def test_sequence(self):
+        '''Runs several tasks, separated by --, in order'''
+        with capture('stderr') as err:
+            actual = self.stdout('test/examples/run/sequence',
+                'hello', '--', 'hello', 'you', '--', 'hello', '--name', 'me')
+        self.assertEqual(
+            actual, ['Hello, world!', 'Hello, you!', 'Hello, me!'])
+        self.assertEqual(err.getvalue().count('hello succeeded'), 3)
+
+    def test_sequence_missing(self):
+        '''Runs nothing if any of several tasks can't be found'''
+        with capture() as out:
+            with capture('stderr'):
+                self.assertRaises(SystemExit, self.stdout,
+                    'test/examples/run/sequence', 'hello', '--', 'whiz')
+        self.assertEqual(out.getvalue(), '')
+
+    def test_sequence_failure(self):
+        '''Stops at the first of several tasks that fails'''
+        with capture('stderr') as err:
+            with logs():
+                self.assertRaisesRegex(SystemExit, '1', self.stdout,
+                    'test/examples/run/sequence', 'fail', '--', 'hello')
+        self.assertIn('fail failed', err.getvalue())
+        self.assertIn('hello skipped', err.getvalue())
+
+    def test_depends(self):
+        '''Runs the tasks a task depends on first, and only once'''
+        with capture('stderr'):
+            for jobs in ('1', '2'):
+                actual = self.stdout(
+                    'test/examples/run/depends', '-j', jobs, 'release', '2.0')
+                self.assertEqual(actual, ['compile', 'build', 'release 2.0'])
+
+    def test_depends_elsewhere(self):
+        '''Finds the tasks a task depends on in other files'''
+        with capture('stderr'):
+            actual = self.stdout(
+                'test/examples/run/split', 'release.publish', '2.0')
+        self.assertEqual(actual, ['compile', 'publish 2.0'])
+
+    def test_depends_static(self):
+        '''Dependencies are found without importing'''
+        actual = self.stdout(
+            'test/examples/run/depends', '--static', 'help', 'release')
+        self.assertIn('Depends on build, compile', actual)
+
+    def test_up_to_date(self):
+        '''Skips tasks whose outputs are up to date'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(tmpdir, 'input.txt'), 'w') as fout:
+            fout.write('hello')
+        with open(os.path.join(tmpdir, 'shovel.py'), 'w') as fout:
+            fout.write('\n'.join([
+                'from shovel import task',
+                '@task(inputs=["*.txt"], outputs=["out/*"])',
+                'def copy():',
+                '    import os, shutil',
+                '    print("copying")',
+                '    os.makedirs("out", exist_ok=True)',
+                '    shutil.copy("input.txt", "out/output")']))
+
+        with capture('stderr') as err:
+            self.assertEqual(self.stdout(tmpdir, 'copy'), ['copying'])
+            self.assertEqual(self.stdout(tmpdir, 'copy'), [''])
+            self.assertIn('copy is up to date', err.getvalue())
+            self.assertEqual(
+                self.stdout(tmpdir, '--no-skip', 'copy'), ['copying'])
+        with capture('stderr') as err:
+            self.stdout(tmpdir, '--explain-skip', '--no-skip', 'copy')
+        self.assertIn('copy runs because it was forced', err.getvalue())
+
+    def test_cache_stats(self):
+        '''Describes and prunes the return values tasks have kept'''
+        actual = self.stdout('test/examples/run/basic', 'cache', 'stats')
+        self.assertIn('Entries: 0', actual)
+        actual = self.stdout('test/examples/run/basic', 'cache', 'prune')
+        self.assertEqual(actual, ['Removed 0 results'])
+
+    def test_batch(self):
+        '''Runs a task for each line of a file'''
+        path = os.path.join(self.cache, 'batch.txt')
+        with open(path, 'w') as fout:
+            fout.write('you\n{"name": "me"}\n')
+        actual = self.stdout('test/examples/run/sequence',
+            '--batch', path, '--ordered', 'hello')
+        self.assertEqual([json.loads(line)['stdout'] for line in actual],
+            ['Hello, you!\n', 'Hello, me!\n'])
+
+    def test_batch_invalid(self):
+        '''Runs nothing if any line doesn't fit the task'''
+        path = os.path.join(self.cache, 'batch.txt')
+        with open(path, 'w') as fout:
+            fout.write('you\none two\n')
+        with capture('stderr') as err:
+            self.assertRaises(SystemExit, self.stdout,
+                'test/examples/run/sequence', '--batch', path, 'hello')
+        self.assertIn('Line 2', err.getvalue())
+
+    def test_isolate(self):
+        '''Runs tasks in a child process when asked'''
+        actual = self.stdout('test/examples/run/sequence',
+            '--isolate', 'hello', 'you')
+        self.assertEqual(actual, ['Hello, you!'])
+
+    def test_timeout(self):
+        '''Kills tasks that take too long'''
+        with capture('stderr') as err:
+            with logs():
+                self.assertRaisesRegex(SystemExit, '1', self.stdout,
+                    'test/examples/run/sequence', '--isolate-timeout', '0.2',
+                    'nap', '10', '--', 'hello')
+        self.assertIn('nap failed', err.getvalue())
+        self.assertIn('hello skipped', err.getvalue())
+
+    def test_profile(self):
+        '''Profiles reading in tasks and running them separately'''
+        prefix = os.path.join(self.cache, 'profile')
+        with capture('stderr') as err:
+            actual = self.stdout('test/examples/run/basic', '--profile-phases',
+                '--profile-prefix', prefix, '--profile-stacks', 'bar')
+        self.assertEqual(actual, ['Hello from bar!'])
+        for phase in ('load', 'run'):
+            self.assertTrue(os.path.exists('%s.%s.pstats' % (prefix, phase)))
+            self.assertTrue(os.path.exists('%s.%s.folded' % (prefix, phase)))
+        with open('%s.run.folded' % prefix) as fin:
+            self.assertIn('bar (shovel.py:', fin.read())
+        self.assertIn('Ordered by: cumulative time', err.getvalue())
+
+    def test_timings(self):
+        '''Reports how long each phase took'''
+        with capture('stderr') as err:
+            self.stdout('test/examples/run/basic', '--timings=json', 'bar')
+        timings = json.loads(err.getvalue())
+        self.assertEqual([p['name'] for p in timings['phases']],
+            ['parse', 'load', 'run'])
+        self.assertEqual([p['name'] for p in timings['phases'][2]['phases']],
+            ['resolve bar', 'task bar'])
+
+        with capture('stderr') as err:
+            self.stdout('test/examples/run/basic', '--timings', 'bar')
+        self.assertIn('  task bar', err.getvalue())
+
+    def test_bench(self):
+        '''Benchmarks a task, failing if it's slower than its baseline'''
+        history = os.path.join(self.cache, 'history.jsonl')
+        argv = ['test/examples/run/sequence', 'bench', '--repeat', '3',
+            '--warmup', '1', '--history', history, '--threshold', '100',
+            'nap', '0.001']
+        actual = self.stdout(*argv)
+        self.assertEqual(actual[0], 'nap: 3 runs')
+        self.assertTrue(actual[2].startswith('median'))
+        actual = self.stdout(*argv)
+        self.assertIn('against the baseline', actual[-1])
+
+        # The first run became the baseline, and the second didn't
+        with open(history) as fin:
+            runs = [json.loads(line) for line in fin]
+        self.assertEqual([run['baseline'] for run in runs], [True, False])
+
+        # Against a much quicker baseline, it's regressed
+        baseline = dict(runs[0], stats=dict(runs[0]['stats'], median=1e-9))
+        with open(history, 'a') as fout:
+            fout.write(json.dumps(baseline) + '\n')
+        with capture():
+            self.assertRaisesRegex(SystemExit, '1', self.stdout, *argv)
+        self.stdout(*(argv[:2] + ['--baseline'] + argv[2:]))
+        self.stdout(*argv)
+
+    def test_bench_options(self):
+        '''Options only `shovel bench` takes are passed to other tasks'''
+        actual = self.stdout('test/examples/run/sequence', 'fetch', 'x',
+            '--history', 'h', '--repeat', '3')
+        self.assertEqual(actual, ["x 10 h False None [('repeat', '3')]"])
+
+    def test_task_options(self):
+        '''Keyword arguments with common names are passed to tasks'''
+        actual = self.stdout('test/examples/run/sequence', 'fetch', 'x',
+            '--force', '--profile', 'prod', '--timeout', '3')
+        self.assertEqual(actual, ["x 3 None True prod []"])
+
+    def test_shovel_options(self):
+        '''Shovel's own options after the task are passed to the task'''
+        actual = self.stdout('test/examples/run/sequence', 'fetch', 'x',
+            '--jobs', '3', '--batch', 'b', '--watch', '--verbose')
+        self.assertEqual(actual, ["x 10 None False None [('batch', 'b'), "
+            "('jobs', '3'), ('verbose', True), ('watch', True)]"])
+
+    def test_abbreviations(self):
+        '''Abbreviations of shovel's options are passed to tasks'''
+        actual = self.stdout('test/examples/run/sequence', 'fetch', 'x',
+            '--verb', '--proc', '2')
+        self.assertEqual(actual,
+            ["x 10 None False None [('proc', '2'), ('verb', True)]"])
+
     def test_too_many_tasks(self):
         '''Exits if there are too many matching tasks'''
         self.assertRaisesRegexp(
@@ -98,7 +337,7 @@ class TestRun(unittest.TestCase):
     def test_dry_run(self):
         '''Honors the dry-run flag'''
         actual = self.stdout(
-            'test/examples/run/basic', 'bar', '--dry-run')
+            'test/examples/run/basic', '--dry-run', 'bar')
         expected = ['Would have executed:', 'bar']
         self.assertEqual(actual, expected)
 
@@ -109,6 +348,33 @@ class TestRun(unittest.TestCase):
         expected = ['bar # Dummy function']
         self.assertEqual(actual, expected)
 
+    def test_tasks_cached(self):
+        '''Listing tasks a second time is served from the manifest'''
+        first = self.stdout('test/examples/run/basic', 'tasks')
+        second = self.stdout('test/examples/run/basic', 'tasks')
+        self.assertEqual(first, second)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.cache, 'manifest.json')))
+
+    def test_tasks_uncached(self):
+        '''Tasks are still listed when there's nowhere to cache them'''
+        blocked = os.path.join(self.cache, 'file')
+        with open(blocked, 'w'):
+            pass
+        os.environ['SHOVEL_CACHE'] = os.path.join(blocked, 'cache')
+        try:
+            actual = self.stdout('test/examples/run/basic', 'tasks')
+        finally:
+            os.environ['SHOVEL_CACHE'] = self.cache
+        self.assertEqual(actual, ['bar # Dummy function'])
+
+    def test_tasks_static(self):
+        '''Tasks can be listed without importing them'''
+        actual = self.stdout(
+            'test/examples/run/basic', '--static', 'tasks')
+        expected = ['bar # Dummy function']
+        self.assertEqual(actual, expected)
+
     def test_tasks_none_found(self):
         '''Display the correct thing when no tasks are found'''
         actual = self.stdout('test/examples/run/none', 'tasks')
@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+
+'''Ensure tasks are run along with their dependencies'''
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from shovel.schedule import Schedule
+from shovel.tasks import Shovel, Task
+
+
+class TestSchedule(unittest.TestCase):
+    '''Test scheduling tasks'''
+    def setUp(self):
+        self.ran = []
+        self.shovel = Shovel()
+
+    def make(self, name, depends=None, func=None):
+        '''Add a task that records that it ran'''
+        def record(*args):
+            self.ran.append((name,) + args)
+            if func:
+                return func()
+        record.__name__ = name
+        task = Task(record, depends)
+        self.shovel.extend([task])
+        return task
+
+    def test_order(self):
+        '''Dependencies run once, and before the tasks that need them'''
+        self.make('compile')
+        self.make('migrate')
+        self.make('build', ['compile'])
+        release = self.make('release', ['build', 'migrate', 'compile'])
+        plan = Schedule(self.shovel)
+        plan.add(release)
+        self.assertEqual(plan.run(), 0)
+        self.assertEqual(self.ran,
+            [('compile',), ('build',), ('migrate',), ('release',)])
+
+    def test_asked_for(self):
+        '''Tasks asked for run in order, and only once as dependencies'''
+        compile = self.make('compile')
+        build = self.make('build', ['compile'])
+        plan = Schedule(self.shovel)
+        plan.add(compile)
+        plan.add(build, ['fast'])
+        plan.add(build, ['slow'])
+        self.assertEqual(plan.run(), 0)
+        self.assertEqual(self.ran,
+            [('compile',), ('build', 'fast'), ('build', 'slow')])
+
+    def test_concurrent(self):
+        '''Independent tasks run at the same time'''
+        barrier = threading.Barrier(2, timeout=5)
+        self.make('one', func=barrier.wait)
+        self.make('two', func=barrier.wait)
+        both = self.make('both', ['one', 'two'])
+        plan = Schedule(self.shovel)
+        plan.add(both)
+        self.assertEqual(plan.run(jobs=2), 0)
+        self.assertEqual(self.ran[-1], ('both',))
+
+    def test_processes(self):
+        '''Tasks can be run in a pool of processes'''
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        def touch(name):
+            def func():
+                open(os.path.join(tmpdir, name), 'w').close()
+            return func
+        self.make('one', func=touch('one'))
+        self.make('two', func=touch('two'))
+        both = self.make('both', ['one', 'two'], func=touch('both'))
+        plan = Schedule(self.shovel)
+        plan.add(both)
+        self.assertEqual(plan.run(jobs=2, processes=True), 0)
+        self.assertEqual(sorted(os.listdir(tmpdir)), ['both', 'one', 'two'])
+
+    def test_failure(self):
+        '''Tasks that depend on a failed task are skipped'''
+        def fail():
+            raise SystemExit(3)
+        self.make('broken', func=fail)
+        self.make('fine')
+        after = self.make('after', ['fine', 'broken'])
+        for jobs in (1, 2):
+            self.ran = []
+            plan = Schedule(self.shovel)
+            plan.add(after)
+            self.assertEqual(plan.run(jobs=jobs), 3)
+            self.assertNotIn(('after',), self.ran)
+
+    def test_missing(self):
+        '''Depending on something that isn't a task is an error'''
+        task = self.make('task', ['missing'])
+        self.assertRaises(KeyError, Schedule(self.shovel).add, task)
+
+    def test_circular(self):
+        '''Circular dependencies are an error'''
+        self.make('one', ['two'])
+        self.make('two', ['one'])
+        self.assertRaisesRegex(ValueError, 'one -> two -> one',
+            Schedule(self.shovel).add, self.shovel['one'])
+
+
+if __name__ == '__main__':
+    unittest.main()
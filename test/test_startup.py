@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+
+'''Ensure that starting shovel stays quick'''
+
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+# The budget, in microseconds, for importing shovel itself (cumulatively, as
+# reported by `python -X importtime`). Typically this is around 40ms, and most
+# of that is `logging` and `inspect`
+BUDGET = 150000
+
+# The budget, in seconds, for the whole of an invocation of shovel, from
+# starting python until it exits. Typically this is well under 100ms, and most
+# of that is starting python itself
+LATENCY = 0.5
+
+# Modules that are slow to import and aren't needed to list or run tasks
+FORBIDDEN = ('pkg_resources', 'importlib.metadata', 'multiprocessing',
+    'shovel.metrics')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires -X importtime')
+class TestStartup(unittest.TestCase):
+    '''Measure what `shovel` imports on its way to doing something'''
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache)
+
+    def invoke(self, *args, **kwargs):
+        '''Invoke shovel with these arguments (and these options to python),
+        returning its stderr'''
+        # Running in isolated mode keeps the shovel.py in the example from
+        # being imported as `shovel`
+        command = [sys.executable, '-I'] + list(kwargs.get('options', [])) + [
+            '-c',
+            'import sys; sys.path.insert(0, %r); import shovel; shovel.run()'
+            % ROOT]
+        env = dict(os.environ, SHOVEL_CACHE=self.cache)
+        process = subprocess.Popen(command + list(args),
+            cwd=os.path.join(ROOT, 'test/examples/run/basic'), env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, stderr = process.communicate()
+        self.assertEqual(process.returncode, 0, stderr)
+        return stderr
+
+    def latency(self, *args):
+        '''The best time of a few invocations of shovel, in seconds'''
+        times = []
+        for _ in range(3):
+            start = time.time()
+            self.invoke(*args)
+            times.append(time.time() - start)
+        return min(times)
+
+    def importtime(self, *args):
+        '''Return a dictionary of module name to cumulative import time in
+        microseconds for an invocation of shovel'''
+        stderr = self.invoke(*args, options=['-X', 'importtime'])
+        times = {}
+        pattern = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)$')
+        for line in stderr.decode('utf-8').splitlines():
+            match = pattern.match(line)
+            if match:
+                times[match.group(3)] = int(match.group(1))
+        return times
+
+    def test_tasks(self):
+        '''Listing tasks stays within budget'''
+        for _ in range(2):
+            # The second time around is served from the manifest
+            times = self.importtime('tasks')
+            self.assertLess(times['shovel'], BUDGET)
+            for module in FORBIDDEN:
+                self.assertFalse(module in times, module)
+        self.assertLess(self.latency('tasks'), LATENCY)
+
+    def test_run(self):
+        '''Running a task stays within budget'''
+        times = self.importtime('bar')
+        self.assertLess(times['shovel'], BUDGET)
+        for module in FORBIDDEN:
+            self.assertFalse(module in times, module)
+        self.assertLess(self.latency('bar'), LATENCY)
+
+
+if __name__ == '__main__':
+    unittest.main()
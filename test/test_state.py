@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+
+'''Ensure tasks' last successful runs are tracked'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from shovel.state import State
+from shovel.tasks import Task
+
+
+class TestState(unittest.TestCase):
+    '''Test the state of tasks' files'''
+    def setUp(self):
+        self.original = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        os.mkdir('src')
+        self.write('src/a.txt', 'a')
+
+        def report(name='report'):
+            pass
+        self.task = Task(report, inputs=['src/*.txt'], outputs=['out.txt'])
+        self.path = os.path.join(self.tmpdir, 'state.json')
+
+    def tearDown(self):
+        os.chdir(self.original)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, path, contents):
+        '''Write a file, making sure its stat changes'''
+        with open(path, 'w') as fout:
+            fout.write(contents)
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + len(contents) + 1))
+
+    def succeed(self, state, *args):
+        '''Take a snapshot, "run" the task and record it'''
+        snapshot = state.snapshot(self.task, args)
+        self.write('out.txt', 'out')
+        state.record(self.task, snapshot)
+
+    def changes(self, state, *args):
+        return state.changes(self.task, state.snapshot(self.task, args))
+
+    def test_missing_output(self):
+        '''Tasks must run if their outputs don't exist'''
+        state = State(self.path)
+        self.assertEqual(self.changes(state), ['out.txt matches nothing'])
+
+    def test_up_to_date(self):
+        '''Tasks are current once they've succeeded, until something changes'''
+        state = State(self.path)
+        self.succeed(state)
+        self.assertEqual(self.changes(state), [])
+        self.assertEqual(self.changes(state, 'other'),
+            ['its arguments changed'])
+
+        self.write('src/b.txt', 'b')
+        self.assertEqual(self.changes(state), ['src/b.txt was added'])
+        self.succeed(state)
+        self.write('src/a.txt', 'changed')
+        self.assertEqual(self.changes(state), ['src/a.txt changed'])
+        self.succeed(state)
+        self.write('out.txt', 'tampered')
+        self.assertEqual(self.changes(state), ['out.txt changed'])
+
+    def test_touched(self):
+        '''Inputs that are touched but not changed don't count'''
+        state = State(self.path)
+        self.succeed(state)
+        self.write('src/a.txt', 'a')
+        self.assertEqual(self.changes(state), [])
+
+    def test_save(self):
+        '''State persists between runs'''
+        state = State(self.path)
+        self.succeed(state)
+        state.save()
+        self.assertEqual(self.changes(State.load(self.path)), [])
+
+    def test_no_files(self):
+        '''Tasks without inputs or outputs always run'''
+        state = State(self.path)
+        task = Task(lambda: None)
+        self.assertNotEqual(state.changes(task, state.snapshot(task)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
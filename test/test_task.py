@@ -3,7 +3,7 @@
 '''Ensure that we can correctly find tasks'''
 
 import unittest
-from shovel.tasks import Shovel, Task
+from shovel.tasks import Shovel, Task, routes
 
 
 class TestTask(unittest.TestCase):
@@ -63,6 +63,69 @@ class TestTask(unittest.TestCase):
             self.assertEqual(key, pair[0])
             self.assertEqual(key, pair[1].fullname)
 
+    def test_routed(self):
+        '''Reading with a name only imports the files that could define it'''
+        shovel = Shovel()
+        shovel.read('test/examples/nested/', 'test/examples/nested/',
+            name='foo.baz.hello')
+        self.assertEqual(shovel.keys(), ['foo.baz.hello'])
+
+        shovel = Shovel()
+        shovel.read('test/examples/nested/', 'test/examples/nested/',
+            name='foo.baz')
+        self.assertEqual(set(t.fullname for t in shovel.tasks('foo.baz')),
+            set(['foo.baz.hello', 'foo.baz.howdy.what']))
+
+        shovel = Shovel()
+        shovel.read('test/examples/toplevel/two',
+            'test/examples/toplevel/two', name='foo')
+        self.assertTrue('foo' in shovel)
+
+    def test_routes(self):
+        '''Files and directories are routed by their full names'''
+        base = 'test/examples/nested'
+        self.assertTrue(routes(base + '/foo/__init__.py', base, 'foo.bar'))
+        self.assertFalse(routes(base + '/foo/__init__.py', base, 'bar'))
+        self.assertTrue(routes(base + '/foo/baz', base, 'foo', True))
+        self.assertTrue(routes(base + '/foo/baz', base, 'foo.baz.x', True))
+        self.assertFalse(routes(base + '/foo/baz', base, 'foo.bar', True))
+
+    def test_module_overrides(self):
+        '''Modules and tasks with the same name override each other'''
+        def make(fullname):
+            task = Task(lambda: fullname)
+            task.fullname = fullname
+            return task
+
+        first, second, third = make('foo'), make('foo.bar'), make('foo')
+        shovel = Shovel([first, second])
+        self.assertEqual(shovel.keys(), ['foo.bar'])
+        self.assertTrue(shovel['foo'].overrides is first)
+
+        shovel.extend([third])
+        self.assertEqual(shovel.keys(), ['foo'])
+        self.assertTrue(isinstance(third.overrides, Shovel))
+        self.assertEqual(third.overrides.keys(), ['bar'])
+
+        # Removing them restores what they overrode
+        shovel.discard([third])
+        self.assertEqual(shovel.keys(), ['foo.bar'])
+        shovel.discard([second])
+        self.assertEqual(shovel.keys(), ['foo'])
+        self.assertTrue(shovel['foo'] is first)
+
+    def test_modules(self):
+        '''Modules are views of the tasks beneath them'''
+        shovel = Shovel.load('test/examples/nested/', 'test/examples/nested/')
+        module = shovel['foo.baz']
+        self.assertTrue(isinstance(module, Shovel))
+        self.assertEqual(module.keys(), ['hello', 'howdy.what'])
+        self.assertEqual(list(module), ['hello', 'howdy.what'])
+        self.assertTrue(module['howdy.what'] is shovel['foo.baz.howdy.what'])
+        self.assertEqual(sorted(shovel['foo'].map), ['bar', 'baz', 'whiz'])
+        self.assertRaises(KeyError, shovel.__getitem__, 'foo.ba')
+        self.assertRaises(KeyError, shovel.__getitem__, 'foo.bar.whiz')
+
     def test_multi_load(self):
         '''Load from multiple paths'''
         shovel = Shovel()
@@ -95,6 +158,27 @@ class TestTask(unittest.TestCase):
         self.assertEqual(shovel['Foo'](5), 5)
         self.assertRaises(TypeError, shovel['Bar'], 5)
 
+    def test_lazy(self):
+        '''Details are only worked out when they're asked for'''
+        made = []
+
+        class Foo(object):
+            def __init__(self):
+                made.append(self)
+
+            def __call__(self, a, b=2):
+                '''Add things'''
+                return a + b
+
+        task = Task(Foo)
+        self.assertEqual(made, [])
+        self.assertFalse(hasattr(task, '__dict__'))
+        self.assertEqual(task.doc, 'Add things')
+        self.assertEqual(task.spec.args, ['a', 'b'])
+        self.assertEqual(len(made), 1)
+        self.assertEqual(task(1), 3)
+        self.assertEqual(len(made), 1)
+
     def test_capture(self):
         '''Make sure we can capture output from a function'''
         shovel = Shovel.load('test/examples/capture/', 'test/examples/capture')
@@ -102,9 +186,11 @@ class TestTask(unittest.TestCase):
             'stderr': '',
             'stdout': 'foo\n',
             'return': 6,
-            'exception': None
+            'exception': None,
+            'status': 0
         })
         self.assertNotEqual(shovel['bar'].capture()['exception'], None)
+        self.assertEqual(shovel['bar'].capture()['status'], 1)
 
     def test_atts(self):
         '''Make sure some of the attributes are what we expect'''
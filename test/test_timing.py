@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+
+'''Ensure the time spent in each phase is recorded'''
+
+import threading
+import time
+import unittest
+
+from shovel import timing
+from shovel.compat import copy_context
+from shovel.tasks import Shovel
+
+
+class TestTiming(unittest.TestCase):
+    '''Test keeping track of phases'''
+    def test_nested(self):
+        '''Phases are recorded within the phase they're part of'''
+        with timing.Timings() as timings:
+            with timing.phase('outer'):
+                with timing.phase('inner'):
+                    time.sleep(0.01)
+            with timing.phase('after'):
+                pass
+        total = timings.to_dict()
+        self.assertEqual(total['name'], 'total')
+        self.assertEqual([p['name'] for p in total['phases']],
+            ['outer', 'after'])
+        outer = total['phases'][0]
+        self.assertEqual([p['name'] for p in outer['phases']], ['inner'])
+        self.assertGreaterEqual(outer['wall'], 0.01)
+        self.assertGreaterEqual(outer['wall'], outer['phases'][0]['wall'])
+        self.assertGreaterEqual(total['wall'], outer['wall'])
+        self.assertLess(outer['cpu'], outer['wall'])
+
+    def test_untimed(self):
+        '''Phases outside of any timings aren't recorded'''
+        self.assertEqual(timing.current(), None)
+        with timing.phase('nothing'):
+            pass
+        with timing.Timings() as timings:
+            self.assertIs(timing.current(), timings)
+        self.assertEqual(timing.current(), None)
+        self.assertEqual(timings.to_dict()['phases'], [])
+
+    def test_recording(self):
+        '''Timings already being kept are used'''
+        with timing.Timings() as timings:
+            with timing.recording() as found:
+                self.assertIs(found, timings)
+        with timing.recording() as found:
+            self.assertIs(timing.current(), found)
+
+    def test_threads(self):
+        '''Threads that are given the context record in the right place'''
+        with timing.Timings() as timings:
+            with timing.phase('parent'):
+                def work(name):
+                    with timing.phase(name):
+                        pass
+                threads = [threading.Thread(
+                    target=copy_context().run, args=(work, str(i)))
+                    for i in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        parent = timings.to_dict()['phases'][0]
+        self.assertEqual(sorted(p['name'] for p in parent['phases']),
+            ['0', '1', '2'])
+
+    def test_load(self):
+        '''Reading tasks records each file and import'''
+        with timing.Timings() as timings:
+            Shovel.load('test/examples/run/basic/shovel.py',
+                'test/examples/run/basic')
+        names = []
+
+        def walk(phase):
+            names.append(phase['name'])
+            for child in phase['phases']:
+                walk(child)
+        walk(timings.to_dict())
+        self.assertIn('import', names)
+        self.assertIn('extend', names)
+        self.assertTrue(any(name.endswith('basic/shovel.py') for name in names))
+
+    def test_table(self):
+        '''The table shows each phase, indented, and the total'''
+        with timing.Timings() as timings:
+            with timing.phase('outer'):
+                with timing.phase('inner'):
+                    pass
+        lines = timings.table().split('\n')
+        self.assertEqual(lines[0].split(), ['phase', 'wall', 'cpu'])
+        self.assertTrue(lines[1].startswith('outer '))
+        self.assertTrue(lines[2].startswith('  inner '))
+        self.assertTrue(lines[3].startswith('total '))
+
+
+if __name__ == '__main__':
+    unittest.main()
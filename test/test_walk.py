@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+
+'''Ensure that we walk task directories correctly'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from shovel.walk import Ignore, walk
+
+
+class TestWalk(unittest.TestCase):
+    '''Test our directory walker'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'shovel')
+        for path in [
+            'a.py', 'b.txt', '.c.py',
+            'foo/__init__.py', 'foo/bar.py',
+            '.shovel/whiz.py',
+            '.git/hooks.py',
+            '__pycache__/a.py',
+            'env/pyvenv.cfg', 'env/lib/thing.py',
+            'data/huge.py', 'data/keep.py',
+            'vendor/requests/api.py']:
+            self.touch(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, relative, content=''):
+        '''Create a file beneath our root'''
+        path = os.path.join(self.root, relative)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fout:
+            fout.write(content)
+
+    def walk(self, **kwargs):
+        '''Return the relative paths found beneath our root'''
+        return [os.path.relpath(p, self.root)
+            for p in walk(self.root, **kwargs)]
+
+    def test_defaults(self):
+        '''Skips hidden, cache and virtualenv directories'''
+        self.assertEqual(self.walk(), [
+            '.c.py', '.shovel/whiz.py', 'a.py', 'data/huge.py', 'data/keep.py',
+            'foo/__init__.py', 'foo/bar.py', 'vendor/requests/api.py'])
+
+    def test_ignore(self):
+        '''Honors patterns in .shovelignore files'''
+        self.touch('.shovelignore', '\n'.join([
+            '# Comments are fine', '', 'vendor/', 'data/*', '!keep.py']))
+        self.touch('foo/.shovelignore', 'bar.py')
+        self.assertEqual(self.walk(), [
+            '.c.py', '.shovel/whiz.py', 'a.py', 'data/keep.py',
+            'foo/__init__.py'])
+
+    def test_base_ignore(self):
+        '''Ignore files between the base and the walked directory apply'''
+        with open(os.path.join(self.tmpdir, '.shovelignore'), 'w') as fout:
+            fout.write('shovel/foo\n')
+        self.assertFalse('foo/bar.py' in self.walk(base=self.tmpdir))
+        self.assertTrue('foo/bar.py' in self.walk())
+
+    def test_patterns(self):
+        '''Supports the usual gitignore syntax'''
+        ignore = Ignore('/root', ['*.py', '!/keep.py', 'logs/', '/a/**/b.py'])
+        self.assertTrue(ignore.match('/root/x/y.py', False))
+        self.assertFalse(ignore.match('/root/keep.py', False))
+        self.assertTrue(ignore.match('/root/x/keep.py', False))
+        self.assertTrue(ignore.match('/root/x/logs', True))
+        self.assertEqual(ignore.match('/root/x/logs', False), None)
+        self.assertTrue(ignore.match('/root/a/c/d/b.py', False))
+
+    def test_symlink_loop(self):
+        '''Follows symlinks, but never visits a directory twice'''
+        os.symlink(self.root, os.path.join(self.root, 'foo', 'loop'))
+        os.symlink(os.path.join(self.root, 'data'),
+            os.path.join(self.root, 'link'))
+        found = self.walk()
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(len(found), 8)
+
+    def test_prune(self):
+        '''Callers can prune the walk further'''
+        found = self.walk(prune=lambda path, directory: directory)
+        self.assertEqual(found, ['.c.py', 'a.py'])
+
+    def test_threads(self):
+        '''Walking with threads finds the same files in the same order'''
+        self.touch('.shovelignore', 'vendor/')
+        self.assertEqual(self.walk(threads=4), self.walk())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+
+'''Ensure that watching task files keeps tasks up to date'''
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from shovel.tasks import Shovel
+from shovel.watch import Watcher
+
+
+class TestWatch(unittest.TestCase):
+    '''Change task files out from under a watcher'''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ticks = 0
+        self.roots = [
+            (os.path.join(self.tmpdir, name), os.path.join(self.tmpdir, name))
+            for name in ('one', 'two')]
+        self.write('one', 'foo.py', bar='one', whiz='one')
+        self.write('two', 'foo.py', bar='two')
+        self.shovel = Shovel()
+        for path, base in self.roots:
+            self.shovel.read(path, base)
+        self.watcher = Watcher(self.shovel, self.roots, inotify=False)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, root, name, **tasks):
+        '''Write a task file with tasks that return the provided values'''
+        path = os.path.join(self.tmpdir, root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fout:
+            fout.write('from shovel import task\n')
+            for key, value in sorted(tasks.items()):
+                fout.write('@task\ndef %s():\n    return %r\n' % (key, value))
+        self.touch(path)
+        return path
+
+    def touch(self, path):
+        '''Make sure a change is visible despite the resolution of mtimes'''
+        self.ticks += 10
+        os.utime(path, (time.time() + self.ticks, time.time() + self.ticks))
+
+    def test_unchanged(self):
+        '''Nothing happens if nothing changed'''
+        self.assertEqual(self.watcher.poll(), [])
+
+    def test_change(self):
+        '''Changed files are reloaded, keeping their place in overrides'''
+        path = self.write('one', 'foo.py', bar='uno', howdy='uno')
+        self.assertEqual(self.watcher.poll(), [path])
+        self.assertEqual(self.shovel.keys(),
+            ['foo.bar', 'foo.howdy'])
+        # The second root still overrides the first
+        self.assertEqual(self.shovel['foo.bar'](), 'two')
+        self.assertEqual(self.shovel['foo.bar'].overrides(), 'uno')
+        self.assertEqual(self.shovel['foo.howdy'](), 'uno')
+
+    def test_remove(self):
+        '''Removed files take their tasks with them'''
+        os.remove(os.path.join(self.tmpdir, 'two', 'foo.py'))
+        self.watcher.poll()
+        self.assertEqual(self.shovel['foo.bar'](), 'one')
+        self.assertEqual(self.shovel['foo.bar'].overrides, None)
+
+        os.remove(os.path.join(self.tmpdir, 'one', 'foo.py'))
+        self.watcher.poll()
+        self.assertEqual(self.shovel.keys(), [])
+        self.assertEqual(dict(self.shovel.map), {})
+
+    def test_add(self):
+        '''New files are read'''
+        self.write('two', 'nested/deep.py', what='two')
+        self.watcher.poll()
+        self.assertEqual(self.shovel['nested.deep.what'](), 'two')
+
+    def test_broken(self):
+        '''Files that can't be loaded leave their old tasks in place'''
+        path = os.path.join(self.tmpdir, 'one', 'foo.py')
+        with open(path, 'a') as fout:
+            fout.write('def (')
+        self.touch(path)
+        self.watcher.poll()
+        self.assertEqual(self.shovel['foo.whiz'](), 'one')
+
+    def test_broken_partway(self):
+        '''Tasks made by a file before it failed don't end up elsewhere'''
+        path = os.path.join(self.tmpdir, 'one', 'fail.py')
+        with open(path, 'w') as fout:
+            fout.write('from shovel import task\n')
+            for name in ('x', 'x2'):
+                fout.write('@task\ndef %s():\n    pass\n' % name)
+            fout.write('raise ValueError("oops")\n')
+        self.touch(path)
+        self.watcher.poll()
+        self.write('one', 'other.py', y='one')
+        self.watcher.poll()
+        self.assertEqual(self.shovel.keys(),
+            ['foo.bar', 'foo.whiz', 'other.y'])
+
+    def test_inotify(self):
+        '''Wakes up when a file changes'''
+        watcher = Watcher(self.shovel, self.roots, interval=5)
+        try:
+            if watcher.notifier is None:
+                self.skipTest('inotify is not available')
+            self.write('one', 'foo.py', bar='uno')
+            start = time.time()
+            self.assertEqual(len(watcher.wait()), 1)
+            self.assertLess(time.time() - start, 5)
+        finally:
+            watcher.close()
+
+    def test_inotify_new_directory(self):
+        '''Wakes up when a file is made in a new directory'''
+        watcher = Watcher(self.shovel, self.roots, interval=5)
+        try:
+            if watcher.notifier is None:
+                self.skipTest('inotify is not available')
+            os.mkdir(os.path.join(self.tmpdir, 'one', 'sub'))
+            self.assertEqual(watcher.wait(), [])
+            path = self.write('one', 'sub/b.py', what='one')
+            start = time.time()
+            self.assertEqual(watcher.wait(), [path])
+            self.assertLess(time.time() - start, 5)
+            self.assertEqual(self.shovel['sub.b.what'](), 'one')
+        finally:
+            watcher.close()
+
+    def test_inotify_quiet(self):
+        '''Doesn't look at the files unless something changed'''
+        watcher = Watcher(self.shovel, self.roots)
+        try:
+            if watcher.notifier is None:
+                self.skipTest('inotify is not available')
+            polls = []
+            watcher.poll = lambda: polls.append(True)
+            self.assertEqual(watcher.wait(0.01), [])
+            self.assertEqual(polls, [])
+        finally:
+            watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()